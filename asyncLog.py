@@ -0,0 +1,124 @@
+'''
+asyncLog.py - A log file written by a background thread.
+
+The master reports every pair it starts and every report it receives. With a
+write and flush per line, a slow (e.g. shared cluster) filesystem stalls the
+receive loop of the master. An AsyncLog takes lines into a bounded queue and
+returns at once; a writer thread writes them to the file, and echoes them to
+standard out, in batches, and flushes the file every flushInterval seconds.
+The queue only blocks the caller if the writer falls queueSize lines behind.
+
+close writes out every line queued, flushes and closes the file, and is also
+run at interpreter exit for logs left open.
+'''
+import sys
+import time
+import atexit
+import threading
+import Queue
+from config import LOG_QUEUE_SIZE, LOG_FLUSH_INTERVAL
+
+# queued in place of a line to ask the writer to flush, or to stop
+FLUSH, CLOSE = object(), object()
+# taken by the writer when nothing was queued for flushInterval seconds. Only
+# a FLUSH taken from the queue wakes a caller waiting in flush
+TIMEOUT = object()
+
+
+class AsyncLog(object):
+    '''
+    A file opened for appending, written by a background thread. write and
+    flush have the meaning they have for files, except that write returns
+    before the text is written. With a queueSize of 0, there is no thread:
+    every write is written and flushed at once.
+    '''
+    closed = False
+
+    def __init__(self, filename, echo=True, queueSize=LOG_QUEUE_SIZE,
+                 flushInterval=LOG_FLUSH_INTERVAL, batchSize=1000):
+        '''
+        If echo is True, text written is also printed to standard out. Up to
+        batchSize queued lines are written at once.
+        '''
+        self.file = open(filename, 'a')
+        self.echo = echo
+        self.flushInterval = flushInterval
+        self.batchSize = batchSize
+        self.thread = None
+        if queueSize:
+            self.queue = Queue.Queue(queueSize)
+            self.flushed = threading.Event()
+            self.thread = threading.Thread(target=self._writer)
+            self.thread.daemon = True
+            self.thread.start()
+            atexit.register(self.close)
+
+    def write(self, text):
+        '''
+        Queue text to be written.
+        '''
+        if self.thread is None:
+            self._write([text])
+            self.file.flush()
+        else:
+            self.queue.put(text)
+
+    def flush(self):
+        '''
+        Wait until everything written so far is in the file, and flush it.
+        '''
+        if self.thread is not None and not self.closed:
+            self.flushed.clear()
+            self.queue.put(FLUSH)
+            self.flushed.wait()
+
+    def close(self):
+        '''
+        Write out everything queued, and close the file.
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        if self.thread is not None:
+            self.queue.put(CLOSE)
+            self.thread.join()
+        self.file.close()
+
+    def _write(self, lines):
+        text = ''.join(lines)
+        self.file.write(text)
+        if self.echo:
+            sys.stdout.write(text)
+
+    def _writer(self):
+        lastFlush = time.time()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flushInterval or None)
+            except Queue.Empty:
+                item = TIMEOUT
+            # take what else is waiting, up to a batch
+            lines = []
+            while item is not FLUSH and item is not CLOSE and \
+                    item is not TIMEOUT:
+                lines.append(item)
+                if len(lines) >= self.batchSize:
+                    item = None
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except Queue.Empty:
+                    item = None
+                    break
+            if lines:
+                self._write(lines)
+            if item is not None or \
+                    time.time() - lastFlush >= self.flushInterval:
+                self.file.flush()
+                if self.echo:
+                    sys.stdout.flush()
+                lastFlush = time.time()
+            if item is FLUSH:
+                self.flushed.set()
+            elif item is CLOSE:
+                return
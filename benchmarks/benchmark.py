@@ -0,0 +1,197 @@
+'''
+benchmark.py - Timing, result files and baseline comparison shared by the
+benchmark scripts.
+
+A benchmark script produces a dictionary from benchmark names to values for
+which lower is better, mostly seconds per operation. write_results saves it
+as JSON, with a description of the machine and interpreter, and compare
+checks it against a baseline saved the same way earlier: a benchmark which
+got slower by more than the tolerance is a regression, and the scripts exit
+with status 1 if there is any.
+
+Benchmarks of other (N, M, T) than those in config.py are run in a child
+process, since the modules read N, M and T from config.py when imported.
+'''
+import os
+import sys
+import json
+import time
+import timeit
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+# directory of the benchmark scripts, and of the modules they time
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+# slower by more than this fraction of the baseline is a regression
+TOLERANCE = 0.2
+
+
+def measure(fn, minTime=0.2, repeat=3):
+    '''
+    Return the seconds per call of fn, the best of repeat runs of enough
+    calls to take at least minTime seconds.
+    '''
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= minTime or number >= 1 << 30:
+            break
+        number *= 2 if elapsed <= 0 else \
+            max(2, int(minTime / elapsed * 1.2))
+    best = min([elapsed] + timer.repeat(repeat - 1, number))
+    return best / number
+
+
+def measure_items(makeIterator, minTime=0.2, repeat=3):
+    '''
+    Return the seconds per item of the iterators returned by makeIterator,
+    the best of repeat runs of iterators exhausted for at least minTime
+    seconds.
+    '''
+    best = None
+    for r in range(repeat):
+        items = 0
+        start = time.time()
+        while True:
+            for item in makeIterator():
+                items += 1
+            elapsed = time.time() - start
+            if elapsed >= minTime:
+                break
+        if items and (best is None or elapsed / items < best):
+            best = elapsed / items
+    return best
+
+
+def point_name(name, n, m, t):
+    '''
+    Return the name of benchmark name run with a given (N, M, T).
+    '''
+    return "{} N={} M={} T={}".format(name, n, m, t)
+
+
+def set_config(n, m, t):
+    '''
+    Make the modules imported from now on use the given (N, M, T) instead of
+    those in config.py.
+    '''
+    import config
+    config.N, config.M, config.T = n, m, t
+
+
+def run_child(script, args):
+    '''
+    Run a benchmark script in a child process with the given arguments and
+    the name of a file to save its results to, and return the results. The
+    output of the child is discarded, since some of the code timed prints.
+    '''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT_DIR] + filter(None, [env.get('PYTHONPATH')]))
+    handle, filename = tempfile.mkstemp(suffix='.json')
+    os.close(handle)
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(
+                [sys.executable, os.path.join(BENCHMARK_DIR, script)] +
+                [str(a) for a in args] + [filename], env=env, stdout=devnull)
+        with open(filename) as resultFile:
+            return json.load(resultFile)
+    finally:
+        os.remove(filename)
+
+
+def machine():
+    '''
+    Return a description of the machine and interpreter the benchmarks ran
+    on.
+    '''
+    return {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'date': str(datetime.now())}
+
+
+def write_results(filename, results):
+    '''
+    Save benchmark results to a JSON file.
+    '''
+    with open(filename, 'w') as resultFile:
+        json.dump({'machine': machine(), 'results': results}, resultFile,
+                  indent=1, sort_keys=True)
+
+
+def read_results(filename):
+    '''
+    Return the benchmark results saved in a JSON file.
+    '''
+    with open(filename) as resultFile:
+        return json.load(resultFile)['results']
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    '''
+    Return a list of (name, baseline, result, ratio, regressed) for the
+    benchmarks in both results and baseline.
+    '''
+    rows = []
+    for name in sorted(results):
+        if name in baseline and baseline[name]:
+            ratio = results[name] / baseline[name]
+            rows.append((name, baseline[name], results[name], ratio,
+                         ratio > 1 + tolerance))
+    return rows
+
+
+def report(results, baseline=None, tolerance=TOLERANCE, out=sys.stdout):
+    '''
+    Print results, compared with baseline if given, and return the number of
+    regressions.
+    '''
+    if baseline is None:
+        for name in sorted(results):
+            out.write("{:<50} {:>12.3e}\n".format(name, results[name]))
+        return 0
+    regressions = 0
+    for name, base, result, ratio, regressed in compare(results, baseline,
+                                                        tolerance):
+        out.write("{:<50} {:>12.3e} {:>12.3e} {:>6.2f}x{}\n".format(
+            name, base, result, ratio, "  REGRESSION" if regressed else ""))
+        regressions += regressed
+    for name in sorted(set(results) - set(baseline)):
+        out.write("{:<50} {:>12.3e}  (not in baseline)\n".format(
+            name, results[name]))
+    return regressions
+
+
+def main(script, grid, argv, description):
+    '''
+    Command line of a benchmark script which times a grid of (N, M, T), each
+    in a child process run as script --point N M T FILE.
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--grid', nargs='+', metavar='N,M,T',
+                        default=[','.join(map(str, p)) for p in grid],
+                        help="values of (N, M, T) to time")
+    parser.add_argument('--output', metavar='FILE',
+                        help="save the results to FILE as JSON")
+    parser.add_argument('--baseline', metavar='FILE',
+                        help="compare the results with those saved in FILE")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="slowdown over the baseline, as a fraction, "
+                             "reported as a regression")
+    args = parser.parse_args(argv)
+    results = {}
+    for point in args.grid:
+        n, m, t = [int(v) for v in point.split(',')]
+        results.update(run_child(script, ['--point', n, m, t]))
+    if args.output:
+        write_results(args.output, results)
+    baseline = read_results(args.baseline) if args.baseline else None
+    return 1 if report(results, baseline, args.tolerance) else 0
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+'''
+microBenchmarks.py - Times the primitives in the hot path of a worker over a
+grid of (N, M, T):
+
+    vertex.construct, vertex.eq, vertex.sub  Vertex(1, 1), ==, -
+    mapping.call                             calling a full Mapping
+    mapping.dereference                      Mapping._mappingDereference
+    surjective.mapping                       SurjectiveMappingIterator, per
+                                             mapping
+    checkDisjointness, checkCommutativity    on a pair of full mappings
+    pairIterator.pair                        EndpointEmptyMappingPairIterator,
+                                             per pair
+
+All times are in seconds per operation. The leg cache is warm after the first
+run, so surjective.mapping is the time with cached leg completions.
+
+Usage:
+    python benchmarks/microBenchmarks.py --output micro.json
+    python benchmarks/microBenchmarks.py --baseline micro.json
+'''
+import sys
+import json
+from itertools import islice
+from benchmark import main, measure, measure_items, point_name, set_config
+
+# values of (N, M, T) timed by default
+GRID = [(3, 2, 3), (4, 2, 3), (5, 2, 3), (4, 3, 3)]
+# items taken from an iterator per timed run
+ITEMS = 2000
+
+
+def benchmark_point(n, m, t):
+    '''
+    Return the times of the benchmarks for one (N, M, T).
+    '''
+    set_config(n, m, t)
+    from mapping import Vertex
+    from mappingIterators import SurjectiveMappingIterator
+    from mappingIterators import EndpointEmptyMappingPairIterator
+    from comparitors import checkDisjointness, checkCommutativity
+
+    # the first pair of which both mappings can be completed
+    pairs = EndpointEmptyMappingPairIterator()
+    while True:
+        pair = pairs.next()
+        maps = [next(SurjectiveMappingIterator(p), None) for p in pair]
+        if None not in maps:
+            break
+    m1, m2 = maps
+    v1 = Vertex(0, 1)
+    v2 = Vertex(1, 1)
+    times = {
+        'vertex.construct': measure(lambda: Vertex(1, 1)),
+        'vertex.eq': measure(lambda: v1 == v2),
+        'vertex.sub': measure(lambda: v1 - v2),
+        'mapping.call': measure(lambda: m1(t - 1, n)),
+        'mapping.dereference': measure(
+            lambda: m1._mappingDereference((0, 1.5))),
+        'surjective.mapping': measure_items(
+            lambda: islice(SurjectiveMappingIterator(pair[0]), ITEMS)),
+        'checkDisjointness': measure(lambda: checkDisjointness(m1, m2)),
+        'checkCommutativity': measure(lambda: checkCommutativity(m1, m2)),
+        'pairIterator.pair': measure_items(
+            lambda: islice(iter(EndpointEmptyMappingPairIterator().next,
+                                None), ITEMS)),
+    }
+    return dict((point_name(name, n, m, t), value)
+                for name, value in times.iteritems())
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--point']:
+        n, m, t = [int(v) for v in sys.argv[2:5]]
+        with open(sys.argv[5], 'w') as resultFile:
+            json.dump(benchmark_point(n, m, t), resultFile)
+    else:
+        sys.exit(main('microBenchmarks.py', GRID, sys.argv[1:],
+                      "Time the primitives of the hot path"))
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+'''
+throughputBenchmark.py - Times whole runs of the overseer on one node.
+
+main_master and the worker loops are run over a range of pairs in processes
+connected by the local transports of transport.py, so no MPI install is
+needed. Every rank talks through a CountingTransport, which counts the
+messages sent by type and the time spent waiting to receive. For every
+number of processes, the benchmark gives:
+
+    seconds/pair, seconds/completion    over the work phase of the master,
+                                        from the end of the start-up
+                                        barriers to the last message
+    master.utilization                  fraction of the work phase the
+                                        master was not waiting for a message
+    messages/pair                       messages sent by all ranks, per pair
+    messages.TYPE/pair                  the same, for one type of message
+
+Lower is better for all of them, so they are compared with a baseline as in
+benchmark.py. The pairs and completions per second are printed as well.
+
+Options of overseer.py can be changed for a run with --set, for example
+
+    python benchmarks/throughputBenchmark.py --processes 2 4 8 \\
+        --set CHUNK_TIME=2 DISPATCH_PAIR_IDS=True --output dispatch.json
+'''
+from __future__ import division
+import os
+import sys
+import ast
+import json
+import time
+import shutil
+import tempfile
+import argparse
+from collections import Counter
+from benchmark import run_child, write_results, read_results, report
+from benchmark import TOLERANCE, ROOT_DIR
+sys.path.insert(0, ROOT_DIR)
+from transport import Transport, ANY_SOURCE, run_processes
+from message import DonePairMesage, DoneChunkMessage
+
+# numbers of processes timed by default
+PROCESSES = [2, 4]
+# pairs timed by default: the pairs after the first SKIP
+SKIP = 9000
+PAIRS = 40
+
+
+class CountingTransport(Transport):
+    '''
+    Transport passing everything to another one, counting the messages sent
+    and received by type, and the time spent in recv and barrier. The
+    counts of every rank are gathered on rank 0 when the run finalizes the
+    transport, in allStats.
+    '''
+    def __init__(self, transport):
+        self.transport = transport
+        self.rank = transport.rank
+        self.size = transport.size
+        self.wire = transport.wire
+        self.peerSends = transport.peerSends
+        self.sent = Counter()
+        self.received = Counter()
+        self.waiting = 0.0
+        self.completions = 0
+        self.barriers = []
+        self.lastRecv = None
+        self.allStats = None
+
+    def send(self, message, dest=0, block=True):
+        self.sent[type(message).__name__] += 1
+        return self.transport.send(message, dest=dest, block=block)
+
+    def recv(self, source=ANY_SOURCE):
+        start = time.time()
+        message = self.transport.recv(source=source)
+        self.lastRecv = time.time()
+        self.waiting += self.lastRecv - start
+        self.received[type(message).__name__] += 1
+        if isinstance(message, DoneChunkMessage):
+            self.completions += sum(r.countTotal for r in message.replies)
+        elif isinstance(message, DonePairMesage):
+            self.completions += message.countTotal
+        return message
+
+    def probe(self, source=ANY_SOURCE):
+        return self.transport.probe(source=source)
+
+    def barrier(self):
+        start = time.time()
+        self.transport.barrier()
+        self.barriers.append((start, time.time()))
+
+    def gather(self, obj, root=0):
+        return self.transport.gather(obj, root=root)
+
+    def waitall(self, requests):
+        self.transport.waitall(requests)
+
+    def finalize(self):
+        stats = {'rank': self.rank, 'sent': dict(self.sent),
+                 'received': dict(self.received), 'waiting': self.waiting}
+        if self.rank == 0:
+            # waiting in the work phase only
+            workStart = self.barriers[1][1]
+            stats['work'] = self.lastRecv - workStart
+            stats['completions'] = self.completions
+        self.allStats = self.transport.gather(stats, root=0)
+        self.transport.finalize()
+
+
+def limited_pairs(skip, count):
+    '''
+    Return a replacement for EndpointEmptyMappingPairIterator in overseer.py
+    which stops after count pairs, starting after the first skip, and counts
+    the pairs it gives out.
+    '''
+    from mappingIterators import EndpointEmptyMappingPairIterator
+
+    class LimitedPairIterator(object):
+        given = 0
+
+        def __init__(self, skip=None, canonical=False):
+            self.pairs = EndpointEmptyMappingPairIterator(
+                skip=limit[0] + (skip or 0), canonical=canonical)
+            self.left = limit[1] - (skip or 0)
+
+        def next(self):
+            if self.left <= 0:
+                raise StopIteration
+            self.left -= 1
+            LimitedPairIterator.given += 1
+            return self.pairs.next()
+
+    limit = (skip, count)
+    return LimitedPairIterator
+
+
+def run_point(spec):
+    '''
+    Run the overseer in spec['processes'] processes over the pairs of spec,
+    with the options of overseer.py in spec['options'], and return the
+    benchmark results.
+    '''
+    import overseer
+    from wireFormat import defaultWireFormat
+    for name, value in spec['options'].iteritems():
+        setattr(overseer, name, value)
+    if overseer.STATIC_SHARDING:
+        raise ValueError("Static sharding has no master to time")
+    if overseer.HIERARCHY_GROUP_SIZE and spec['backend'] == 'tcp':
+        # group leaders send to their workers, which TCPTransport cannot do
+        raise ValueError("Hierarchical mode needs the multiprocessing "
+                         "backend")
+    scratch = tempfile.mkdtemp()
+    try:
+        overseer.LOGFILE = os.path.join(scratch, 'log.txt')
+        if overseer.RESULT_FILE:
+            overseer.RESULT_FILE = os.path.join(scratch, 'results.bin')
+        overseer.CHECKPOINT_FILE = None
+        pairs = limited_pairs(spec['skip'], spec['pairs'])
+        overseer.EndpointEmptyMappingPairIterator = pairs
+
+        def target(t):
+            counting = CountingTransport(t)
+            overseer.start(counting)
+            return counting.allStats
+
+        wire = defaultWireFormat if overseer.WIRE_FORMAT == 'binary' \
+            else None
+        allStats = run_processes(spec['processes'], target,
+                                 spec['backend'], wire)
+    finally:
+        shutil.rmtree(scratch)
+    master = allStats[0]
+    sent = Counter()
+    for stats in allStats:
+        sent.update(stats['sent'])
+    name = lambda metric: point_name(metric, spec)
+    results = {
+        name('seconds/pair'): master['work'] / pairs.given,
+        name('seconds/completion'):
+            master['work'] / max(master['completions'], 1),
+        name('master.utilization'):
+            1 - min(master['waiting'], master['work']) / master['work'],
+        name('messages/pair'): sum(sent.values()) / pairs.given,
+    }
+    for kind, count in sent.iteritems():
+        results[name('messages.{}/pair'.format(kind))] = count / pairs.given
+    return results
+
+
+def point_name(metric, spec):
+    '''
+    Return the name of a metric of the run described by spec.
+    '''
+    options = ''.join(" {}={}".format(k, v)
+                      for k, v in sorted(spec['options'].iteritems()))
+    return "{} P={}{}".format(metric, spec['processes'], options)
+
+
+def parse_option(text):
+    '''
+    Parse NAME=VALUE from the command line into (NAME, value). The value is
+    a Python literal, or a string.
+    '''
+    name, value = text.split('=', 1)
+    if not name.isupper():
+        raise argparse.ArgumentTypeError(
+            "{} is not an option of overseer.py".format(name))
+    try:
+        return name, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return name, value
+
+
+def rates(results, spec, out=sys.stdout):
+    '''
+    Print the pairs and completions per second and the master utilization
+    of a run.
+    '''
+    name = lambda metric: point_name(metric, spec)
+    out.write("P={}: {:.2f} pairs/s, {:.0f} completions/s, master "
+              "utilization {:.1%}, {:.2f} messages/pair\n".format(
+                  spec['processes'], 1 / results[name('seconds/pair')],
+                  1 / results[name('seconds/completion')],
+                  results[name('master.utilization')],
+                  results[name('messages/pair')]))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Time whole runs of the overseer on one node")
+    parser.add_argument('--processes', type=int, nargs='+',
+                        default=PROCESSES, metavar='P',
+                        help="numbers of processes, master included")
+    parser.add_argument('--skip', type=int, default=SKIP,
+                        help="pairs to skip before the ones timed")
+    parser.add_argument('--pairs', type=int, default=PAIRS,
+                        help="pairs to time")
+    parser.add_argument('--backend', choices=['multiprocessing', 'tcp'],
+                        default='multiprocessing')
+    parser.add_argument('--set', type=parse_option, nargs='+', default=[],
+                        metavar='NAME=VALUE',
+                        help="options of overseer.py for the runs")
+    parser.add_argument('--output', metavar='FILE',
+                        help="save the results to FILE as JSON")
+    parser.add_argument('--baseline', metavar='FILE',
+                        help="compare the results with those saved in FILE")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="slowdown over the baseline, as a fraction, "
+                             "reported as a regression")
+    args = parser.parse_args(argv)
+    results = {}
+    for processes in args.processes:
+        spec = {'processes': processes, 'skip': args.skip,
+                'pairs': args.pairs, 'backend': args.backend,
+                'options': dict(args.set)}
+        point = run_child('throughputBenchmark.py',
+                          ['--point', json.dumps(spec)])
+        rates(point, spec)
+        results.update(point)
+    if args.output:
+        write_results(args.output, results)
+    baseline = read_results(args.baseline) if args.baseline else None
+    return 1 if report(results, baseline, args.tolerance) else 0
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--point']:
+        spec = json.loads(sys.argv[2])
+        results = run_point(spec)
+        with open(sys.argv[3], 'w') as resultFile:
+            json.dump(results, resultFile)
+    else:
+        sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,158 @@
+'''
+compactMapping.py - A compact, array-backed counterpart of the Mapping class.
+'''
+from config import N, T
+from mapping import Mapping, Point, Vertex
+from vertexTable import defaultTable, UNDEFINED
+
+
+class CompactMapping(object):
+    '''
+    A mapping stored as an encoded mapping (see vertexTable.py): a bytearray
+    with one slot per domain vertex holding the code of its image, or
+    UNDEFINED. The endpoint map, if any, is stored as a tuple of domain codes.
+
+    The buffer passed to the constructor is used as-is and is not copied, so
+    the bytearrays returned by the encoded mapping iterators can be wrapped
+    directly. Use copy() to obtain an independent mapping.
+
+    CompactMapping can be called and queried in the same way as Mapping, and
+    it supports len() and indexing by domain code so that it can be passed
+    directly to the encoded iterators and comparitors.
+    '''
+    __slots__ = ('_buf', '_epm', 'id')
+    table = defaultTable
+
+    def __init__(self, buf, endpointMap=None):
+        '''
+        CompactMapping(buf) -> mapping backed by the encoded mapping buf
+        CompactMapping(buf, endpointMap) -> as above, with an endpoint map
+        given as a sequence of domain codes
+        '''
+        if len(buf) != self.table.domainSize:
+            raise ValueError("Buffer must have one slot per domain vertex")
+        self._buf = buf
+        self._epm = tuple(endpointMap) if endpointMap is not None else None
+
+    @classmethod
+    def fromMapping(cls, mapping):
+        '''
+        Construct a CompactMapping from a Mapping, including its endpoint map
+        if it has one.
+        '''
+        epm = None
+        if len(mapping.endpointMap) == T:
+            epm = cls.table.encodeEndpointMap(mapping.endpointMap)
+        cmap = cls(cls.table.encodeMapping(mapping), epm)
+        if hasattr(mapping, 'id'):
+            cmap.id = mapping.id
+        return cmap
+
+    def toMapping(self):
+        '''
+        Return an equivalent Mapping object.
+        '''
+        mapp = self.table.decodeMapping(self._buf, self._epm)
+        if hasattr(self, 'id'):
+            mapp.id = self.id
+        return mapp
+
+    def copy(self):
+        '''
+        Return a copy of this mapping which does not share its buffer.
+        '''
+        cmap = CompactMapping(bytearray(self._buf), self._epm)
+        if hasattr(self, 'id'):
+            cmap.id = self.id
+        return cmap
+
+    @property
+    def buffer(self):
+        '''
+        The underlying encoded mapping.
+        '''
+        return self._buf
+
+    @property
+    def endpointCodes(self):
+        '''
+        The endpoint map as a tuple of domain codes, or None.
+        '''
+        return self._epm
+
+    @property
+    def endpointMap(self):
+        '''
+        The endpoint map as a list of domain Vertex objects. Empty if the
+        mapping has no endpoint map, as with Mapping.
+        '''
+        if self._epm is None:
+            return []
+        return [self.table.domainVertices[c] for c in self._epm]
+
+    def __len__(self):
+        return len(self._buf)
+
+    def __getitem__(self, code):
+        return self._buf[code]
+
+    def __reduce__(self):
+        return (_unpickle, (bytes(self._buf), self._epm,
+                            getattr(self, 'id', None)))
+
+    def __call__(self, *args):
+        '''
+        Same semantics as Mapping.__call__.
+        '''
+        if len(args) not in (1, 2):
+            raise TypeError("Calling the mapping expects one or two values")
+        if len(args) == 2:
+            a, b = args
+            if type(a) is not int or type(b) is not int:
+                raise TypeError("Two arguments of type 'int' are expected")
+            if a < 0 or a >= T:
+                raise ValueError("First argument must lie in [0, T)")
+            if b < 0 or b > N:
+                raise ValueError("Second argument must lie in [0, N]")
+        elif type(args[0]) is Point:
+            f = self.table.dereference(self._buf, args[0][0], args[0][1])
+            if f is None:
+                return None
+            return Point(*f)
+        elif type(args[0]) is Vertex:
+            a, b = args[0]
+        else:
+            raise TypeError("Argument must be of type 'Point' or type \
+                'Vertex'")
+        c = self._buf[self.table.domainCode(a, b)]
+        if c == UNDEFINED:
+            return None
+        return self.table.codomainVertices[c]
+
+    def getLeg(self, n):
+        '''
+        Returns a list representing leg number n of the mapping, not including
+        the base point.
+        '''
+        if n < 0 or n >= T:
+            raise ValueError("n is out of range")
+        cv = self.table.codomainVertices
+        return [cv[c] if c != UNDEFINED else None
+                for c in self._buf[1 + n*N:1 + (n+1)*N]]
+
+    def __str__(self):
+        s = "map[" + str(self.table.codomainVertices[self._buf[0]])
+        for leg in range(T):
+            s += ", " + str(self.getLeg(leg))
+        s += " ]"
+        return s
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def _unpickle(buf, endpointMap, idnum):
+    cmap = CompactMapping(bytearray(buf), endpointMap)
+    if idnum is not None:
+        cmap.id = idnum
+    return cmap
@@ -4,6 +4,8 @@ Comparitors.py - Functions to compare two triod mappings.
 from __future__ import division
 from mapping import Vertex, Mapping, Point
 from config import N, M, T
+from vertexTable import defaultTable, UNDEFINED
+from compactMapping import CompactMapping
 
 
 def checkDisjointness(partialMap1, partialMap2):
@@ -16,11 +18,18 @@ def checkDisjointness(partialMap1, partialMap2):
 
     checkDisjointness returns the closest distance between mappings. If the
     mappings are not disjoint, this value will be 0.
+
+    Either argument may be a CompactMapping. If both are, the comparison is
+    done by checkDisjointnessEncoded.
     '''
-    if not isinstance(partialMap1, Mapping):
+    if not isinstance(partialMap1, (Mapping, CompactMapping)):
         raise TypeError("Argument 1 must be of type 'Mapping'")
-    if not isinstance(partialMap2, Mapping):
+    if not isinstance(partialMap2, (Mapping, CompactMapping)):
         raise TypeError("Argument 2 must be of type 'Mapping'")
+    if isinstance(partialMap1, CompactMapping) and \
+            isinstance(partialMap2, CompactMapping):
+        return checkDisjointnessEncoded(partialMap1.buffer,
+                                        partialMap2.buffer)
 
     # if mappings share a basepoint, we have a failure.
     baseA = partialMap1(0, 0)
@@ -68,11 +77,16 @@ def checkCommutativity(map1, map2):
 
     Returns the maximum distance of seperation between the two composite
     functions.
+
+    Either argument may be a CompactMapping. If both are, the comparison is
+    done by checkCommutativityEncoded.
     '''
-    if not isinstance(map1, Mapping):
+    if not isinstance(map1, (Mapping, CompactMapping)):
         raise TypeError("Argument 1 must be of type 'Mapping'")
-    if not isinstance(map2, Mapping):
+    if not isinstance(map2, (Mapping, CompactMapping)):
         raise TypeError("Argument 2 must be of type 'Mapping'")
+    if isinstance(map1, CompactMapping) and isinstance(map2, CompactMapping):
+        return checkCommutativityEncoded(map1.buffer, map2.buffer)
     # generate the composite functions
 #    fog = lambda p: map1(map2(p))
 #    gof = lambda p: map2(map1(p))
@@ -100,6 +114,93 @@ def checkCommutativity(map1, map2):
     return dist
 
 
+def checkDisjointnessEncoded(map1, map2, table=defaultTable):
+    '''
+    Encoded counterpart of checkDisjointness. map1 and map2 are encoded
+    mappings as described in vertexTable.py.
+    '''
+    baseA = map1[0]
+    baseB = map2[0]
+    if baseA == baseB:
+        return 0
+    distance = table.codomainDistance
+    dist = distance[baseA][baseB]
+    n = table.N
+    for arm in range(table.T):
+        prevA = baseA
+        prevB = baseB
+        for slot in range(1 + arm*n, 1 + (arm+1)*n):
+            curA = map1[slot]
+            curB = map2[slot]
+            # stop at an undefined portion of either mapping
+            if curA == UNDEFINED or curB == UNDEFINED:
+                break
+            # mappings co-incide or cross eachother
+            if curA == curB or (curA == prevB and curB == prevA):
+                return 0
+            d = distance[curA][curB]
+            if d < dist:
+                dist = d
+            prevA = curA
+            prevB = curB
+    return dist
+
+
+def checkLegDisjointnessEncoded(baseA, baseB, legA, legB, table=defaultTable):
+    '''
+    Perform the checks of checkDisjointnessEncoded on a single leg. baseA and
+    baseB are the codes of the basepoint images, legA and legB sequences of
+    codes of the images of the leg vertices, which are compared up to the
+    length of the shorter one.
+
+    Returns the closest distance between the mappings on this leg, including
+    the basepoints, or 0 if they are not disjoint. The result of
+    checkDisjointnessEncoded is the smallest result over all legs.
+    '''
+    if baseA == baseB:
+        return 0
+    distance = table.codomainDistance
+    dist = distance[baseA][baseB]
+    prevA = baseA
+    prevB = baseB
+    for curA, curB in zip(legA, legB):
+        if curA == curB or (curA == prevB and curB == prevA):
+            return 0
+        d = distance[curA][curB]
+        if d < dist:
+            dist = d
+        prevA = curA
+        prevB = curB
+    return dist
+
+
+def checkCommutativityEncoded(map1, map2, table=defaultTable):
+    '''
+    Encoded counterpart of checkCommutativity, and equal to it wherever it
+    is defined. Unlike checkCommutativity, images lying further than 1 up an
+    arm do not raise ValueError: images are not converted to Point objects,
+    and the separation is computed from their distances as for any other
+    image.
+    '''
+    divisions = int(table.N**2/table.M)
+    dist = -1
+    for arm in xrange(table.T):
+        for n in linspace(0.0, 1.0, divisions):
+            a = table.dereference(map1, arm, n)
+            if a is None:
+                raise ValueError("map1 is not complete.")
+            b = table.dereference(map2, arm, n)
+            if b is None:
+                raise ValueError("map2 is not complete.")
+            if a[0] == b[0]:
+                d = abs(a[1] - b[1])
+            else:
+                d = a[1] + b[1]
+            if d > dist or dist == -1:
+                dist = d
+    return dist
+
+
 def linspace(start, stop, n):
     if n == 1:
         yield stop
@@ -9,7 +9,96 @@ T = 3
 
 # log file used for editing
 LOGFILE = "mapping-report.txt"
+# the log is written by a background thread, which falls at most
+# LOG_QUEUE_SIZE lines behind and flushes the file every LOG_FLUSH_INTERVAL
+# seconds (0 flushes after every batch of lines). A LOG_QUEUE_SIZE of 0
+# writes and flushes every line at once. See asyncLog.py
+LOG_QUEUE_SIZE = 10000
+LOG_FLUSH_INTERVAL = 1
+# file the master appends every reported pair to, as a fixed size binary
+# record, for analysis with ResultStore, e.g. "mapping-results.bin". The file
+# holds the pairs of one run: a new run refuses to append to the file of
+# another, except when resuming it from CHECKPOINT_FILE. None disables it.
+# See resultStore.py
+RESULT_FILE = None
 # number of pairs for the master to skip before seeding.
 PAIRSKIP = 100
 # how often workers report their status
 WORKER_REPORT_INTERVAL = 50000
+# what workers compute for every pair: 'enumerate' reports every disjoint pair
+# of completions using PAIR_ENGINE, 'count' only computes the counts with the
+# CountingPairEngine of pairEngine.py
+RUN_MODE = 'enumerate'
+# engine used by workers to process a pair: 'factorized' or 'joint'. See
+# pairEngine.py
+PAIR_ENGINE = 'factorized'
+# workers send the reports of disjoint pairs to the master in batches of at
+# most REPORT_BATCH_SIZE, sent at least every REPORT_BATCH_INTERVAL seconds
+# and always before the pair is done
+REPORT_BATCH_SIZE = 1000
+REPORT_BATCH_INTERVAL = 5
+# format of the messages between master and workers: 'pickle' sends the
+# message objects with mpi4py's pickle based send, 'binary' sends the fixed
+# layout encoding of wireFormat.py with the buffer based Send
+WIRE_FORMAT = 'pickle'
+# how the master and workers communicate: 'mpi' runs one rank per MPI
+# process with mpi4py, 'multiprocessing' and 'tcp' start TRANSPORT_PROCESSES
+# processes on this node, connected by queues or by localhost sockets on
+# TRANSPORT_PORT (0 picks a free port). See transport.py
+TRANSPORT = 'mpi'
+TRANSPORT_PROCESSES = 4
+TRANSPORT_PORT = 0
+# if not 0, the ranks other than 0 are split into groups of a leader and up
+# to HIERARCHY_GROUP_SIZE workers. Rank 0 only gives blocks of pairs to the
+# leaders, which give them out to their workers, log the reports of their
+# group to their own log file, and send back the counts of every block. Needs
+# CHUNK_TIME, and the 'mpi' or 'multiprocessing' TRANSPORT. See main_leader in
+# overseer.py
+HIERARCHY_GROUP_SIZE = 0
+# if True, the master only sends the canonical pair of every orbit under arm
+# permutations, and weights the counts of each pair by its orbit size. See
+# symmetry.py
+CANONICAL_PAIRS = False
+# if True, the master sends workers pair ids instead of whole pairs, and the
+# workers rebuild the pairs with a PairIndex. See mappingIterators.py
+DISPATCH_PAIR_IDS = False
+# if True, there is no master: every rank processes a fixed shard of the pair
+# ids, logs to its own file and the counts are combined at the end. See
+# main_static in overseer.py
+STATIC_SHARDING = False
+# if True, once every pair has been handed out, the master asks busy workers
+# to split off part of their pair for idle ones. See scheduler.py
+WORK_STEALING = False
+# file in which the master saves the state of the run every
+# CHECKPOINT_INTERVAL seconds, e.g. "overseer-checkpoint.pkl". If the file
+# exists when the master starts, the run continues from it: LOGFILE and
+# RESULT_FILE are cut back to what they held at the checkpoint, and the
+# reports of unfinished work already written out are not written again. The
+# file is removed when the run finishes. In hierarchical mode the group logs
+# are not cut back, and the group result files have to be moved away before
+# resuming. None disables checkpoints. See scheduler.py
+CHECKPOINT_FILE = None
+CHECKPOINT_INTERVAL = 600
+# number of assignments the master keeps queued at every worker, including
+# the one in progress. 1 gives a worker its next pair once it is done with
+# one; more, e.g. 2, saves workers from waiting for the master between pairs.
+# See scheduler.py
+PREFETCH_DEPTH = 1
+# if not 0, e.g. 2, the master gives out chunks of pairs instead of single
+# pairs, sized so that a worker takes about CHUNK_TIME seconds on one, and
+# shrinking towards the end of the run. Chunks have at most CHUNK_MAX pairs.
+# See scheduler.py
+CHUNK_TIME = 0
+CHUNK_MAX = 1000
+# if True, workers count the pairs of completions checked and pruned at every
+# stage and time every stage of their work on a pair, and send the counts
+# with their status and done messages. The master logs the totals of the run.
+# See stageStats.py
+STAGE_STATS = False
+# if not None, every rank runs under cProfile and saves its stats to this
+# directory when it stops, for profileMerge.py to merge into one profile of
+# the master side and one of the worker side
+PROFILE_DIR = None
+# maximum number of entries in the leg completion cache shared by the mapping
+# iterators and pair engines. 0 disables it. See legCache.py
+LEG_CACHE_SIZE = 4096
@@ -0,0 +1,96 @@
+'''
+legCache.py - A bounded cache of leg completions.
+
+The completions of a single leg depend only on the image the leg starts from,
+the position it starts at, the length it is completed to and the endpoint
+constraints which fall on that leg. The same leg completions are needed again
+and again across the pairs a worker processes, so the mapping iterators and
+pair engines look them up in a LegCompletionCache before generating them.
+'''
+from collections import OrderedDict
+from config import LEG_CACHE_SIZE
+
+
+class LegCompletionCache(object):
+    '''
+    A least recently used cache from hashable keys to lists of leg
+    completions. At most maxsize entries are kept; a maxsize of 0 disables
+    the cache.
+
+    Cached values are shared between everybody who looks them up, and are
+    stored as tuples so that they cannot be modified by accident.
+
+    hits, misses and evictions count the lookups which found an entry, the
+    lookups which did not, and the entries dropped to make room.
+    '''
+    maxsize = 0
+    hits = 0
+    misses = 0
+    evictions = 0
+
+    def __init__(self, maxsize=LEG_CACHE_SIZE):
+        if not isinstance(maxsize, int):
+            raise TypeError("maxsize must be int")
+        if maxsize < 0:
+            raise ValueError("maxsize must not be negative")
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, key, generate):
+        '''
+        Return the completions stored under key. On a miss, generate() is
+        called to produce them, and they are stored.
+        '''
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            value = tuple(generate())
+            if self.maxsize == 0:
+                return value
+            if len(self.entries) >= self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+        # re-insert to mark the entry as most recently used
+        self.entries[key] = value
+        return value
+
+    def clear(self):
+        '''
+        Drop every entry and reset the statistics.
+        '''
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hitRate(self):
+        '''
+        Return the fraction of lookups which were hits.
+        '''
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def stats(self):
+        '''
+        Return a dictionary of the cache statistics.
+        '''
+        return {'size': len(self.entries), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hitRate': self.hitRate()}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return "LegCompletionCache(size={}/{}, hits={}, misses={}, " \
+            "evictions={})".format(len(self.entries), self.maxsize,
+                                   self.hits, self.misses, self.evictions)
+
+
+# cache shared by the mapping iterators and pair engines.
+legCache = LegCompletionCache()
@@ -464,6 +464,8 @@ class MappingPair(object):
     idnum = 0
     map1 = None
     map2 = None
+    # number of pairs this pair stands for when only canonical pairs are used
+    orbitSize = 1
 
     def __init__(self, *args):  # :idnum, map1, map2):
         '''
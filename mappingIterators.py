@@ -9,6 +9,8 @@ The class heirarchy is as follows:
         ->EndpointEmptyMappingIterator
     ->FullMappingIterator
         ->SurjectiveMappingIterator
+    ->EncodedFullMappingIterator
+        ->EncodedSurjectiveMappingIterator
 ->EndpointEmptyMappingPairIterator
 
 Empty mapping iterators take no starting mapping, and generally return
@@ -16,12 +18,19 @@ non-complete mappings that need to be further completed.
 
 Partial mapping iterators usually take a starting mapping, and generate full
 completions. They are generally used in the worker processes.
+
+The Encoded iterators work on the integer vertex codes of vertexTable.py and
+return encoded mappings (bytearrays) rather than Mapping objects.
 '''
 from config import N, M, T
 from mapping import Mapping, Vertex, MappingPair
 from abc import ABCMeta, abstractmethod
 from pointIterators import CodomainVertexIterator, DomainVertexIterator
-from itertools import permutations, combinations
+from itertools import permutations, combinations, product, islice
+from bisect import bisect_left, bisect_right
+from vertexTable import defaultTable, UNDEFINED
+from symmetry import armPermutations, canonicalPair
+from legCache import legCache
 
 
 class MappingIterator(object):
@@ -52,10 +61,19 @@ class BasicEmptyMapIterator(EmptyMappingIterator):
 
     The optional skip argument specifies the number of mappings to skip before
     returning the first one to the calling function.
+
+    If canonical is True, only one basepoint is returned for every orbit of
+    the arm permutations (see symmetry.py), and every mapping returned has an
+    orbitSize attribute.
     '''
-    def __init__(self, skip=0):
+    canonical = False
+
+    def __init__(self, skip=0, canonical=False):
         self.iterator = CodomainVertexIterator()
         self.currentID = skip
+        self.canonical = canonical
+        if canonical:
+            self.group = armPermutations()
         #skip the required number of mappings
         try:
             for i in range(skip):
@@ -65,9 +83,20 @@ class BasicEmptyMapIterator(EmptyMappingIterator):
 
     def next(self):
         #throws StopIteration by itself when it's done.
-        mapp = Mapping(self.iterator.next())
+        basepoint = self.iterator.next()
+        if self.canonical:
+            code = defaultTable.encodeCodomain(basepoint)
+            orbit = set(g.codomainCodes[code] for g in self.group)
+            # only the smallest code of the orbit is returned
+            while code != min(orbit):
+                basepoint = self.iterator.next()
+                code = defaultTable.encodeCodomain(basepoint)
+                orbit = set(g.codomainCodes[code] for g in self.group)
+        mapp = Mapping(basepoint)
         self.currentID += 1
         mapp.id = self.currentID
+        if self.canonical:
+            mapp.orbitSize = len(orbit)
         return mapp
 
 
@@ -78,7 +107,8 @@ class EndpointEmptyMappingIterator(EmptyMappingIterator):
     endpointmap appended. 
 
     The optional skip argument specifies the number of mappings to skip before
-    returning the first one to the calling function.
+    returning the first one to the calling function. The iterator jumps
+    straight to the last mapping skipped, using the shared PairIndex.
     '''
     id = 0
     domainPoints = list(DomainVertexIterator())
@@ -95,8 +125,28 @@ class EndpointEmptyMappingIterator(EmptyMappingIterator):
         self.currentMap = self.mapIterator.next()
 
         # advance the iterator
-        for i in range(skip):
-            self.next()
+        if skip > 0:
+            self._seek(skip)
+
+    def _seek(self, skip):
+        '''
+        Position the iterators just after the mapping with id skip, or after
+        the last mapping if there are fewer.
+        '''
+        mappings = defaultPairIndex().mappings
+        skip = min(skip, len(mappings))
+        target = mappings[skip - 1]
+        basepoints = list(CodomainVertexIterator())
+        self.mapIterator = BasicEmptyMapIterator(
+            basepoints.index(target(0, 0)))
+        self.currentMap = self.mapIterator.next()
+        self.epmIterator = permutations(self.domainPoints, T)
+        rank = permutationRank([self.domainPoints.index(v)
+                                for v in target.endpointMap],
+                               len(self.domainPoints))
+        # consume every permutation up to and including the target's
+        next(islice(self.epmIterator, rank, None))
+        self.id = skip
 
     def next(self):
         while True:
@@ -143,21 +193,44 @@ class EndpointEmptyMappingIterator(EmptyMappingIterator):
         return newmap
 
 
+def permutationRank(indices, n):
+    '''
+    Return the position of the sequence of distinct indices in the order
+    itertools.permutations(range(n), len(indices)) generates them.
+    '''
+    rank = 0
+    used = []
+    for r, c in enumerate(indices):
+        smaller = c - len([u for u in used if u < c])
+        # number of ways to fill the remaining positions
+        ways = 1
+        for k in range(n - r - 1, n - len(indices), -1):
+            ways *= k
+        rank += smaller * ways
+        used.append(c)
+    return rank
+
+
 class FullMappingIterator(MappingIterator):
     '''
     A mapping iterator which returns every valid completion of the starting
     mapping. Mappings will be completed to the specified length, or completely
     if length is not specified.
 
-    The mappings will be generated using a stack approach.
+    Every leg is completed independently of the others. The completions of
+    each leg are generated using a stack approach, and the iterator walks
+    their product, so the last leg changes fastest. Leg completions are
+    looked up in a LegCompletionCache (see legCache.py) before they are
+    generated, which defaults to the cache shared by all iterators.
     '''
     originalMapping = None
+    basepoint = None
     legs = None
-    completions = None
-    isFirst = False
+    legCompletions = None
+    cache = None
     N = 0
 
-    def __init__(self, originalMapping, length=None):
+    def __init__(self, originalMapping, length=None, cache=None):
         self.N = N
         # type checking
         if not isinstance(originalMapping, Mapping):
@@ -169,108 +242,85 @@ class FullMappingIterator(MappingIterator):
             if length < 0 or length > N:
                 raise ValueError("length must be in range [0, N]")
             self.N = length
+        if cache is None:
+            cache = legCache
+        self.cache = cache
 
         self.originalMapping = originalMapping
+        self.basepoint = originalMapping(0, 0)
+        self._setup()
+        # legs is the completion stack used while generating leg completions
         self.legs = [[] for i in range(T)]
-        self.completions = [[] for i in range(T)]
-        # pre-fill arms and completions with what's already in the mapping.
-        for i in range(T):
-            oLeg = self.originalMapping.getLeg(i)
-            for j in range(self.N):
-                if oLeg[j] is None:
+        self.legCompletions = []
+        for l in range(T):
+            # pre-fill the leg with what's already in the mapping.
+            prefix = []
+            for v in self.originalMapping.getLeg(l)[:self.N]:
+                if v is None:
                     break
-                # append to the completion stack
-                self.legs[i].append(j)
-                # Also append to the completion stack, since it is the only
-                # 'valid completion' for that location
-                self.completions[i].append([oLeg[j]])
+                prefix.append(v)
+            prefix = tuple(prefix)
+            start = prefix[-1] if prefix else self.basepoint
+            key = ('vertex', start, len(prefix), self.N,
+                   self._constraint(l, len(prefix)))
+            suffixes = self.cache.get(key,
+                                      lambda: self._legSuffixes(l, prefix))
+            self.legCompletions.append([prefix + s for s in suffixes])
+        self._product = product(*self.legCompletions)
+
+    def _setup(self):
+        '''
+        Called before any leg is completed. Subclasses use it to prepare the
+        data their completions depend on.
+        '''
+        pass
 
-        # now pre-load the first completion.
-        for l in range(T):
-            prevPoint = self.originalMapping(l, len(self.legs[l]))
-            for p in range(len(self.legs[l]), self.N):
-                #get the completions list
-                cpl = prevPoint.ajacentCodomain()
-                self.completions[l].append(cpl)
-                self.legs[l].append(cpl[0])
-                prevPoint = cpl[0]
-        # signal that next() has not run yet
-        self.isFirst = True
-
-    def _vIncrement(self, l, p):
+    def _constraint(self, l, p):
+        '''
+        Return a hashable value which, together with the start vertex and
+        length, determines the completions of leg l from position p onward.
+        Full completions are unconstrained.
+        '''
+        return None
+
+    def _completions(self, l, p):
         '''
-        Increment stack counters l and p
+        Return the list of valid images of position p of leg l, given the
+        completion stack for that leg.
         '''
-        p += 1
-        if p >= self.N:
-            p = 0
-            l += 1
-        return l, p
+        if p == 0:
+            return self.basepoint.ajacentCodomain()
+        return self.legs[l][p-1].ajacentCodomain()
+
+    def _legSuffixes(self, l, prefix):
+        '''
+        Return a list of tuples holding the images of the remaining positions
+        of leg l for every completion of it, in order. Positions with no valid
+        images end their branch of the search.
+        '''
+        results = []
+        leg = self.legs[l] = list(prefix)
+
+        def extend(p):
+            if p == self.N:
+                results.append(tuple(leg[len(prefix):]))
+                return
+            try:
+                cpl = self._completions(l, p)
+            except StopIteration:
+                return
+            for v in cpl:
+                leg.append(v)
+                extend(p + 1)
+                leg.pop()
+
+        extend(len(prefix))
+        return results
 
     def next(self):
-        #special condition for first run of next()
-        if self.isFirst:
-            self.isFirst = False
-            mapList = [self.originalMapping(0, 0)] + self.legs
-            newMap = Mapping(mapList)
-            return newMap
-
-        # we always start off with the previous complete mapping
-        # Thus, we first move backwards down the mapping, finding the first
-        # vertex which is not already at its last possible completion.
-        l = T-1
-        p = self.N - 1
-        while self.legs[l][p] == self.completions[l][p][-1]:
-            #if we get all the way down to l=0, p=0, we're done
-            if l == 0 and (p == 0 or self.originalMapping(l, p) is not None):
-                raise StopIteration
-            if p == 0 or self.originalMapping(l, p) is not None:
-                p = self.N - 1
-                l -= 1
-            else:
-                p -= 1
-        # now we change that vertex to the next one in the completion list
-        # first find where we are at the moment in the completion line
-        i = 0
-        while self.legs[l][p] != self.completions[l][p][i]:
-            i += 1
-        # now go one higher and substitute that in
-        self.legs[l][p] = self.completions[l][p][i+1]
-        # and finally re-load the completion past that point
-        # remembering to take into consideration pre-completed portions of the
-        # mapping. First, complete the leg we're currently on, then the rest.
-        originalLeg = l
-        prevPoint = self.legs[l][p]
-        l, p = self._vIncrement(l, p)
-        while l == originalLeg:
-            cpl = prevPoint.ajacentCodomain()
-            self.completions[l][p] = cpl
-            self.legs[l][p] = cpl[0]
-            prevPoint = self.legs[l][p]
-            l, p = self._vIncrement(l, p)
-        # now do the remaining legs
-        for l in range(l, T):
-            p = 0
-            # increment p until original mapping stops being defined.
-            while self.originalMapping(l, p) is not None:
-                p += 1
-            # now get what the first completion should be from the completion
-            # map of the last point in the original mapping
-            prevPoint = self.originalMapping(l, p-1)
-            cpl = prevPoint.ajacentCodomain()
-            self.completions[l][p-1] = cpl
-            self.legs[l][p-1] = cpl[0]
-            p += 1
-            #now finish the leg
-            while p <= self.N:
-                prevPoint = self.legs[l][p-2]
-                cpl = prevPoint.ajacentCodomain()
-                self.completions[l][p-1] = cpl
-                self.legs[l][p-1] = cpl[0]
-                p += 1
-
-        #and now we have the next full mapping, so we can return it.
-        mapList = [self.originalMapping(0, 0)] + self.legs
+        # raises StopIteration for us once the product is exhausted.
+        legs = self._product.next()
+        mapList = [self.basepoint] + [list(leg) for leg in legs]
         newMap = Mapping(mapList)
         return newMap
 
@@ -302,7 +352,7 @@ class SurjectiveMappingIterator(FullMappingIterator):
               point which is listed in the endpoint map. Let Y be the distance
               between the endpoint vertex and the current point:
             - if X < Y, then the original mapping cannot be made to be
-              surjective, and StopIteration will be raised.
+              surjective, and the current branch has no completions.
             - if X == Y, then the only valid completion for this point will be
               in a direction toward the endpoint
             - if X == Y+1, then two valid completions exist: to remain on the
@@ -312,215 +362,509 @@ class SurjectiveMappingIterator(FullMappingIterator):
         4. Generate mapping completions in a way that is the same as
         FullMappingIterator, however replace the normal completion list
         generation with the one described above.
+
+    The leg completions are cached by the endpoints which are still pending
+    on the leg, as well as by the start vertex and length.
     '''
-    originalMapping = None
-    legs = None
-    completions = None
-    isFirst = False
-    failOnFirst = False
-    N = 0
+    pending = None
 
     def surjCompletions(self, l, p):
         '''
         Get the completion list for the current point using the method
         described above.
+
+        The image of the previous vertex on the leg is read straight from the
+        completion stack, and the pending endpoint and X for every position
+        are looked up in the table built by _pendingEndpoints, so no mapping
+        has to be rebuilt and the endpoint map is not rescanned.
         '''
-        # print '----'
-        # print 'getting surjective completion list for position', l, p
-        # first, generate an object representing the partial mapping so far
-        mapList = [self.originalMapping(0, 0)] + self.legs
-        mapp = Mapping(mapList)
-        # print '--working with mapping', mapp, '--'
-
-        lastVertex = mapp(Vertex(l, p))
-        # print 'lastVertex is', lastVertex
-        # find the lowest endpoint in the endpointlist which is not yet mapped
-        endpointIndex = None
-        for i in range(T):
-            v = None
-            try:
-                v = self.originalMapping.endpointMap[i]
-            except IndexError:
-                print "something went wrong!!!!!"
-                print "i is {}, epm is {}".format(i,
-                        self.originalMapping.endpointMap)
-                raise IndexError
-
-            # leg must be correct
-            if v[0] != l:
-                continue
-            # must be larger than current point
-            if v[1] <= p:
-                continue
-            # must be smallest in series
-            if endpointIndex is None or v[1] < \
-                    self.originalMapping.endpointMap[endpointIndex][1]:
-                endpointIndex = i
+        if p == 0:
+            lastVertex = self.basepoint
+        else:
+            lastVertex = self.legs[l][p-1]
+        pending = self.pending[l][p]
         # if no endpoint found, return completions in the usual way.
-        if endpointIndex is None:
-            # print 'found no endpoint'
-            # print 'returning:', lastVertex.ajacentCodomain()
+        if pending is None:
             return lastVertex.ajacentCodomain()
-        # print 'found endpoint, number=', endpointIndex
-        # generate X and Y
-        X = Vertex(l, p) - self.originalMapping.endpointMap[endpointIndex]
-        Y = mapp(Vertex(l, p)) - Vertex(endpointIndex, M)
-        # print 'x, y are', X, Y
+        X, endpoint = pending
+        Y = lastVertex - endpoint
         # mapping has no valid completions
         if X < Y:
-            # print 'no valid completions'
             raise StopIteration
         # we are one space away yet already at the endpoint. We can't move.
         elif X == 1 and Y == 0:
-            # print 'one off, only valid completion is to stay'
-            # print 'returning:', [lastVertex]
             return [lastVertex]
         # we are already here. We must stay.
         elif X == 0 and Y == 0:
-            # print 'were here, stay'
-            # print 'returning:', [lastVertex]
             return [lastVertex]
         # only valid completion is toward the endpoint
         elif X == Y:
-            # print 'only valid completion toward endpoint'
-            # print 'returning:', [lastVertex.toward(Vertex(endpointIndex, M))]
-            return [lastVertex.toward(Vertex(endpointIndex, M))]
+            return [lastVertex.toward(endpoint)]
         # remain in place or go towards
         elif X == Y + 1:
-            # print 'completions: remain in place or advance'
-            # print 'returning:', [lastVertex,
-            #                    lastVertex.toward(Vertex(endpointIndex, M))]
-            return [lastVertex, lastVertex.toward(Vertex(endpointIndex, M))]
+            return [lastVertex, lastVertex.toward(endpoint)]
         #otherwise we can go anywhere
         else:
-            # print 'go anywhere'
-            # print 'return:', lastVertex.ajacentCodomain()
             return lastVertex.ajacentCodomain()
 
-    def __init__(self, originalMapping, length=None):
-        self.N = N
-        # type checking
-        if not isinstance(originalMapping, Mapping):
-            raise TypeError("First argument must be of type 'Mapping'")
-        #redefine local N if length is specified.
+    def _pendingEndpoints(self):
+        '''
+        Build the table used by surjCompletions. pending[l][p] is None if no
+        vertex of the endpoint map lies on leg l beyond position p. Otherwise
+        it is a tuple (X, endpoint), where endpoint is the codomain endpoint
+        of the lowest such vertex, and X the distance from Vertex(l, p) to
+        that vertex.
+        '''
+        endpointMap = self.originalMapping.endpointMap
+        pending = []
+        for l in range(T):
+            legPending = []
+            for p in range(self.N):
+                # find the lowest endpoint in the endpointlist which is not
+                # yet mapped
+                endpointIndex = None
+                for i in range(T):
+                    v = endpointMap[i]
+                    # leg must be correct, and must be larger than current
+                    # point
+                    if v[0] != l or v[1] <= p:
+                        continue
+                    # must be smallest in series
+                    if endpointIndex is None or \
+                            v[1] < endpointMap[endpointIndex][1]:
+                        endpointIndex = i
+                if endpointIndex is None:
+                    legPending.append(None)
+                else:
+                    legPending.append((Vertex(l, p) -
+                                       endpointMap[endpointIndex],
+                                       Vertex(endpointIndex, M)))
+            pending.append(legPending)
+        return pending
+
+    def __init__(self, originalMapping, length=None, cache=None):
+        FullMappingIterator.__init__(self, originalMapping, length, cache)
+
+    def _setup(self):
+        # originalMapping should have an endpointmap
+        if len(self.originalMapping.endpointMap) != T:
+            raise ValueError("Original mapping must have endpoint map")
+        self.pending = self._pendingEndpoints()
+
+    def _constraint(self, l, p):
+        return tuple(self.pending[l][p:self.N])
+
+    def _completions(self, l, p):
+        return self.surjCompletions(l, p)
+
+    def next(self):
+        newMap = FullMappingIterator.next(self)
+        newMap.endpointMap = self.originalMapping.endpointMap
+        return newMap
+
+
+def encodedLegChoices(table, length, targets=None):
+    '''
+    Return a table of the valid images of every position of a single leg.
+    choices[p][last] is a tuple of the codes which position p (the vertex at
+    distance p+1 up the leg) may map to, given that position p-1 (or the
+    branch point if p is 0) maps to the codomain code last.
+
+    targets is a list of (dist, endpoint) tuples sorted by dist, where dist
+    is the distance up the leg of a domain vertex in the endpoint map and
+    endpoint is the code of the codomain endpoint it must map to. The
+    choices are then restricted in the same way as
+    SurjectiveMappingIterator.surjCompletions, and are empty if the endpoint
+    can no longer be reached. If targets is None, every ajacent codomain
+    vertex is a valid choice, as in FullMappingIterator.
+
+    Choices are listed in the same order as the mapping iterators try them.
+    '''
+    ajacent = table.codomainAjacent
+    distance = table.codomainDistance
+    toward = table.codomainToward
+    choices = []
+    for p in range(length):
+        # find the pending endpoint for this position
+        pending = None
+        for dist, endpoint in targets or ():
+            if dist > p:
+                pending = (dist - p, endpoint)
+                break
+        if pending is None:
+            choices.append(ajacent)
+            continue
+        X, endpoint = pending
+        row = []
+        for last in range(table.codomainSize):
+            Y = distance[last][endpoint]
+            if X < Y:
+                row.append(())
+            elif X == 1 and Y == 0:
+                row.append((last,))
+            elif X == Y:
+                row.append((toward[last][endpoint],))
+            elif X == Y + 1:
+                row.append((last, toward[last][endpoint]))
+            else:
+                row.append(ajacent[last])
+        choices.append(tuple(row))
+    return choices
+
+
+def encodedLegCompletions(table, start, prefixLength, length, targets=None):
+    '''
+    Return a list of tuples containing the images of leg positions
+    prefixLength up to length-1 for every completion of a single leg, where
+    the last defined vertex of the leg maps to the codomain code start.
+
+    targets restricts the completions as described in encodedLegChoices.
+    Completions are listed in the same order as the mapping iterators
+    generate them.
+    '''
+    choices = encodedLegChoices(table, length, targets)
+    results = []
+    path = []
+
+    def extend(p, last):
+        if p == length:
+            results.append(tuple(path))
+            return
+        for c in choices[p][last]:
+            path.append(c)
+            extend(p + 1, c)
+            path.pop()
+
+    extend(prefixLength, start)
+    return results
+
+
+def cachedLegCompletions(table, start, prefixLength, length, targets=None,
+                         cache=None):
+    '''
+    Same as encodedLegCompletions, but looks the completions up in a
+    LegCompletionCache first, which defaults to the shared cache of
+    legCache.py. Returns a tuple, which must not be modified.
+    '''
+    if cache is None:
+        cache = legCache
+    if targets is not None:
+        targets = tuple(targets)
+    key = ('encoded', table, start, prefixLength, length, targets)
+    return cache.get(key, lambda: encodedLegCompletions(
+        table, start, prefixLength, length, targets))
+
+
+def encodedLegTargets(table, endpointMap, l):
+    '''
+    Return the targets on leg l, as used by encodedLegChoices, of an
+    endpoint map given as a sequence of domain codes.
+    '''
+    targets = []
+    for i, c in enumerate(endpointMap):
+        if c != 0 and table.domainArm[c] == l:
+            targets.append((table.domainDist[c], table.codomainEndpoint[i]))
+    targets.sort()
+    return targets
+
+
+def encodedLegPrefix(table, originalMapping, l, length):
+    '''
+    Return the images of the vertices of leg l which are already defined in
+    an encoded mapping, up to the given length, as a tuple.
+    '''
+    offset = 1 + l*table.N
+    prefix = []
+    for p in range(length):
+        if originalMapping[offset + p] == UNDEFINED:
+            break
+        prefix.append(originalMapping[offset + p])
+    return tuple(prefix)
+
+
+class EncodedFullMappingIterator(MappingIterator):
+    '''
+    Encoded counterpart of FullMappingIterator. Takes an encoded partial
+    mapping and returns every valid completion of it as a new bytearray, in
+    the same order as FullMappingIterator.
+
+    Since every leg is completed independently of the others, the completions
+    of each leg are generated once, or looked up in a LegCompletionCache, and
+    the iterator walks their product.
+
+    The original mapping may also be a CompactMapping. The bytearrays returned
+    are not kept by the iterator, so they can be wrapped in a CompactMapping
+    without copying.
+    '''
+    table = None
+    length = 0
+    template = None
+    legCompletions = None
+    cache = None
+
+    def __init__(self, originalMapping, length=None, table=None, cache=None):
+        if table is None:
+            table = defaultTable
+        self.table = table
+        self.cache = cache
+        self.length = table.N
         if length is not None:
             if not isinstance(length, int):
                 raise TypeError("length argument must be int")
-            if length < 0 or length > N:
+            if length < 0 or length > table.N:
                 raise ValueError("length must be in range [0, N]")
-            self.N = length
-        # originalMapping should have an endpointmap
-        if len(originalMapping.endpointMap) != T:
+            self.length = length
+        if len(originalMapping) != table.domainSize:
+            raise ValueError("Original mapping has the wrong size")
+        if originalMapping[0] == UNDEFINED:
+            raise ValueError("Original mapping must have a basepoint")
+        # completions only define the first self.length vertices of each leg
+        self.template = bytearray([UNDEFINED]) * table.domainSize
+        self.template[0] = originalMapping[0]
+        self.legCompletions = []
+        for l in range(table.T):
+            prefix = encodedLegPrefix(table, originalMapping, l, self.length)
+            start = prefix[-1] if prefix else originalMapping[0]
+            self.legCompletions.append([
+                prefix + c for c in cachedLegCompletions(
+                    table, start, len(prefix), self.length,
+                    self._targets(l), self.cache)])
+        self._product = product(*self.legCompletions)
+
+    def _targets(self, l):
+        '''
+        Return the endpoint targets on leg l. Full completions have none.
+        '''
+        return None
+
+    def next(self):
+        # raises StopIteration for us once the product is exhausted.
+        legs = self._product.next()
+        mapp = bytearray(self.template)
+        n = self.table.N
+        for l in range(self.table.T):
+            mapp[1 + l*n:1 + l*n + self.length] = legs[l]
+        return mapp
+
+
+class EncodedSurjectiveMappingIterator(EncodedFullMappingIterator):
+    '''
+    Encoded counterpart of SurjectiveMappingIterator. The endpoint map is
+    given as a sequence of T domain codes, as produced by
+    VertexTable.encodeEndpointMap.
+    '''
+    endpointMap = None
+
+    def __init__(self, originalMapping, endpointMap, length=None,
+                 table=None, cache=None):
+        if table is None:
+            table = defaultTable
+        if len(endpointMap) != table.T:
             raise ValueError("Original mapping must have endpoint map")
-        self.originalMapping = originalMapping
-        self.legs = [[] for i in range(T)]
-        self.completions = [[] for i in range(T)]
+        self.endpointMap = tuple(endpointMap)
+        EncodedFullMappingIterator.__init__(self, originalMapping, length,
+                                            table, cache)
+
+    def _targets(self, l):
+        return encodedLegTargets(self.table, self.endpointMap, l)
 
-        # pre-fill arms and completions with what's already in the mapping.
-        for i in range(T):
-            oLeg = self.originalMapping.getLeg(i)
-            for j in range(self.N):
-                if oLeg[j] is None:
-                    break
-                # append to the completion stack
-                self.legs[i].append(oLeg[j])
-                # Also append to the completion stack, since it is the only
-                # 'valid completion' for that location
-                self.completions[i].append([oLeg[j]])
 
-        # now pre-load the first completion.
+class PairIndex(object):
+    '''
+    A bijection between pair ids and the pairs returned by
+    EndpointEmptyMappingPairIterator, so that any pair can be built directly
+    from its id, and the id of any pair found, without iterating.
+
+    The mappings returned by EndpointEmptyMappingIterator are listed once.
+    Two of them form a pair unless they share their basepoint or an entry of
+    their endpoint maps; these are the features of a mapping. The number of
+    partners of a mapping within a range of later mappings is counted by
+    inclusion-exclusion over the subsets of features they share, using a
+    sorted list of the mappings for every combination of feature values. No
+    list of pairs is kept, and both rank() and pair() take
+    O(2^(T+1) log^2 n) time for n mappings.
+
+    Pair ids start at 1, as in EndpointEmptyMappingPairIterator, and so do
+    mapping ids.
+    '''
+    mappings = None
+    size = 0
+
+    def __init__(self):
+        self.mappings = list(EndpointEmptyMappingIterator())
+        n = len(self.mappings)
+        self.features = [(m(0, 0),) + tuple(m.endpointMap)
+                         for m in self.mappings]
+        self.positions = dict((f, i) for i, f in enumerate(self.features))
+        self.subsets = [s for r in range(1, T + 2)
+                        for s in combinations(range(T + 1), r)]
+        self.groups = {}
+        for i, f in enumerate(self.features):
+            for s in self.subsets:
+                key = (s, tuple(f[k] for k in s))
+                self.groups.setdefault(key, []).append(i)
+        # rowStart[i] is the number of pairs whose first mapping comes
+        # before mapping i.
+        self.rowStart = [0] * (n + 1)
+        for i in range(n):
+            self.rowStart[i + 1] = self.rowStart[i] + \
+                self._partners(i, i + 1, n)
+        self.size = self.rowStart[n]
+
+    def __len__(self):
+        return self.size
+
+    def _partners(self, i, lo, hi):
+        '''
+        Return the number of mappings j with lo <= j < hi which form a pair
+        with mapping i.
+        '''
+        f = self.features[i]
+        count = hi - lo
+        for s in self.subsets:
+            group = self.groups[(s, tuple(f[k] for k in s))]
+            shared = bisect_left(group, hi) - bisect_left(group, lo)
+            if len(s) % 2:
+                count -= shared
+            else:
+                count += shared
+        return count
+
+    def _position(self, mapping):
         try:
-            for l in range(T):
-                for p in range(len(self.legs[l]), self.N):
-                    #get the completions list
-                    cpl = self.surjCompletions(l, p)
-                    self.completions[l].append(cpl)
-                    self.legs[l].append(cpl[0])
-            # signal that next() has not run yet
-        except StopIteration:
-            self.failOnFirst = True
-        self.isFirst = True
+            return self.positions[(mapping(0, 0),) +
+                                  tuple(mapping.endpointMap)]
+        except KeyError:
+            raise ValueError("Not an endpoint empty mapping")
 
-    def next(self):
-        #special condition for first run of next()
-        if self.isFirst:
-            if self.failOnFirst is True:
-                raise StopIteration
-            self.isFirst = False
-            mapList = [self.originalMapping(0, 0)] + self.legs
-            newMap = Mapping(mapList)
-            newMap.endpointMap = self.originalMapping.endpointMap
-            return newMap
-
-        # we always start off with the previous complete mapping
-        # Thus, we first move backwards down the mapping, finding the first
-        # vertex which is not already at its last possible completion.
-        l = T-1
-        p = self.N - 1
-        while self.legs[l][p] == self.completions[l][p][-1]:
-            #if we get all the way down to l=0, p=0, we're done
-            if l == 0 and (p == 0 or self.originalMapping(l, p) is not None):
-                raise StopIteration
-            if p == 0 or self.originalMapping(l, p) is not None:
-                p = self.N - 1
-                l -= 1
+    def _unrank(self, idnum):
+        '''
+        Return the positions (i, j) of the mappings of the pair with id
+        idnum.
+        '''
+        if idnum < 1 or idnum > self.size:
+            raise ValueError("Pair id must lie in [1, {}]".format(self.size))
+        k = idnum - 1
+        i = bisect_right(self.rowStart, k) - 1
+        k -= self.rowStart[i]
+        # find the smallest j with k+1 partners of i up to and including j
+        lo = i + 1
+        hi = len(self.mappings) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._partners(i, i + 1, mid + 1) > k:
+                hi = mid
             else:
-                p -= 1
-        # print 'mutating at', l, p
-        # print 'original point', self.legs[l][p]
-        # print 'possible completions are:', self.completions[l][p]
-        # now we change that vertex to the next one in the completion list
-        # first find where we are at the moment in the completion line
-        i = 0
-        while self.legs[l][p] != self.completions[l][p][i]:
-            i += 1
-        # now go one higher and substitute that in
-        self.legs[l][p] = self.completions[l][p][i+1]
-        # print 'mutated to', self.legs[l][p]
-        # and finally re-load the completion past that point
-        # remembering to take into consideration pre-completed portions of the
-        # mapping. First, complete the leg we're currently on, then the rest.
-        originalLeg = l
-        l, p = self._vIncrement(l, p)
-        while l == originalLeg:
-            cpl = self.surjCompletions(l, p)
-            self.completions[l][p] = cpl
-            self.legs[l][p] = cpl[0]
-            l, p = self._vIncrement(l, p)
-        # now do the remaining legs
-        for l in range(l, T):
-            p = 0
-            # increment p until original mapping stops being defined.
-            while self.originalMapping(l, p+1) is not None:
-                p += 1
-            #now finish the leg
-            while p < self.N:
-                cpl = self.surjCompletions(l, p)
-                self.completions[l][p] = cpl
-                self.legs[l][p] = cpl[0]
-                p += 1
-
-        #and now we have the next full mapping, so we can return it.
-        mapList = [self.originalMapping(0, 0)] + self.legs
-        newMap = Mapping(mapList)
-        newMap.endpointMap = self.originalMapping.endpointMap
-        return newMap
+                lo = mid + 1
+        return i, lo
+
+    def mapping(self, mapid):
+        '''
+        Return the endpoint empty mapping with id mapid.
+        '''
+        if mapid < 1 or mapid > len(self.mappings):
+            raise ValueError("Mapping id out of range")
+        return self.mappings[mapid - 1]
+
+    def mappingId(self, mapping):
+        '''
+        Return the id of an endpoint empty mapping.
+        '''
+        return self._position(mapping) + 1
+
+    def pair(self, idnum):
+        '''
+        Return the MappingPair with id idnum.
+        '''
+        i, j = self._unrank(idnum)
+        return MappingPair(idnum, self.mappings[i], self.mappings[j])
+
+    def rank(self, pair):
+        '''
+        Return the id of a pair of endpoint empty mappings, which must be
+        given in the same order as EndpointEmptyMappingPairIterator does.
+        '''
+        i = self._position(pair[0])
+        j = self._position(pair[1])
+        if i >= j or self._partners(i, j, j + 1) != 1:
+            raise ValueError("Not a valid pair")
+        return self.rowStart[i] + self._partners(i, i + 1, j) + 1
+
+    def combinations(self, idnum=1):
+        '''
+        Generate tuples of mappings in the same order as
+        combinations(EndpointEmptyMappingIterator(), 2), starting from the
+        pair with id idnum.
+        '''
+        if idnum > self.size:
+            return
+        i, j = self._unrank(idnum)
+        n = len(self.mappings)
+        for b in range(j, n):
+            yield self.mappings[i], self.mappings[b]
+        for a in range(i + 1, n):
+            for b in range(a + 1, n):
+                yield self.mappings[a], self.mappings[b]
+
+
+_defaultPairIndex = None
+
+
+def defaultPairIndex():
+    '''
+    Return the PairIndex shared by the iterators, building it on first use.
+    '''
+    global _defaultPairIndex
+    if _defaultPairIndex is None:
+        _defaultPairIndex = PairIndex()
+    return _defaultPairIndex
 
 
 class EndpointEmptyMappingPairIterator(object):
     '''
     Generates pairs of endpoint empty mapping iterators
+
+    If canonical is True, only the canonical representative of every orbit of
+    pairs under the arm permutations is returned (see symmetry.py), with its
+    orbitSize attribute set. Pair ids are still counted over all pairs, so a
+    representative has the same id as in a full run. The skip argument counts
+    the pairs returned.
+
+    Without canonical, skipping jumps straight to the first pair wanted using
+    the shared PairIndex. In canonical mode the skipped pairs are still
+    generated, since canonical pairs cannot be counted without them.
     '''
     gen = None
     idnum = 0
-
-    def __init__(self, skip=None):
+    canonical = False
+
+    def __init__(self, skip=None, canonical=False):
+        self.canonical = canonical
+        if canonical:
+            self.group = armPermutations()
+            self.keyCache = {}
+        if skip and not canonical:
+            self.gen = defaultPairIndex().combinations(skip + 1)
+            self.idnum = skip
+            return
         self.gen = combinations(EndpointEmptyMappingIterator(), 2)
         if skip is not None:
             for i in range(skip):
                 self.next()
 
     def next(self):
+        pp = self._nextPair()
+        if self.canonical:
+            isCanonical, orbitSize = canonicalPair(pp, self.group,
+                                                   cache=self.keyCache)
+            while not isCanonical:
+                pp = self._nextPair()
+                isCanonical, orbitSize = canonicalPair(pp, self.group,
+                                                       cache=self.keyCache)
+            pp.orbitSize = orbitSize
+        return pp
+
+    def _nextPair(self):
         class PairBad(Exception):
             def __init__(self):
                 pass
@@ -22,41 +22,155 @@ class DonePairMesage(Message):
     Message from worker indicating that it is done working on a pair and is
     requesting a new one.
 
-    Pair metrics are returned with the message.
+    Pair metrics are returned with the message, and the StageStats of the
+    pair if STAGE_STATS is set.
     '''
     countTotal = 0
     countFailures = 0
+    stats = None
 
-    def __init__(self, rank, total, failures):
+    def __init__(self, rank, total, failures, stats=None):
         self.sourceRank = rank
         self.countTotal = total
         self.countFailures = failures
+        self.stats = stats
+
+
+class DoneChunkMessage(Message):
+    '''
+    Message from worker indicating that it is done working on a chunk of
+    pairs, with a DonePairMesage for every pair of the chunk in order.
+    '''
+    replies = None
+
+    def __init__(self, rank, replies):
+        self.sourceRank = rank
+        self.replies = replies
 
 
 class StatusMessage(Message):
     '''
-    Message from a worker reporting partial status.
+    Message from a worker reporting partial status, with the StageStats of
+    the pair so far if STAGE_STATS is set.
     '''
     countTotal = 0
     countFailures = 0
+    stats = None
 
-    def __init__(self, rank, total, failures):
+    def __init__(self, rank, total, failures, stats=None):
         self.sourceRank = rank
         self.countTotal = total
         self.countFailures = failures
+        self.stats = stats
 
 
 class NewPairMessage(Message):
     '''
     Message from the master process to a worker containing a new pair of
     partial functions to operate on.
+
+    If halves is given, only those halves of the pair are to be processed
+    (see FactorizedPairEngine). serial identifies the assignment for steal
+    requests and returned work.
     '''
     pair = None
+    halves = None
+    serial = 0
 
-    def __init__(self, pair):
+    def __init__(self, pair, halves=None, serial=0):
         if not isinstance(pair, MappingPair):
             raise TypeError("Argument must be of type 'MappingPair'")
         self.pair = pair
+        self.halves = halves
+        self.serial = serial
+
+
+class NewPairIdMessage(Message):
+    '''
+    Message from the master process to a worker containing only the id of a
+    new pair to operate on. The worker builds the pair itself with a
+    PairIndex. halves and serial are as for NewPairMessage.
+    '''
+    idnum = 0
+    halves = None
+    serial = 0
+
+    def __init__(self, idnum, halves=None, serial=0):
+        if not isinstance(idnum, (int, long)):
+            raise TypeError("Argument must be an integer pair id")
+        self.idnum = idnum
+        self.halves = halves
+        self.serial = serial
+
+
+class NewChunkMessage(Message):
+    '''
+    Message from the master process to a worker containing a chunk of pairs
+    to operate on, one after the other. serial is as for NewPairMessage.
+    '''
+    pairs = None
+    serial = 0
+
+    def __init__(self, pairs, serial=0):
+        for pair in pairs:
+            if not isinstance(pair, MappingPair):
+                raise TypeError("Pairs must be of type 'MappingPair'")
+        self.pairs = pairs
+        self.serial = serial
+
+
+class NewChunkIdMessage(Message):
+    '''
+    Message from the master process to a worker containing only the ids of a
+    chunk of pairs to operate on. serial is as for NewPairMessage.
+    '''
+    idnums = None
+    serial = 0
+
+    def __init__(self, idnums, serial=0):
+        self.idnums = idnums
+        self.serial = serial
+
+
+class StealMessage(Message):
+    '''
+    Message from the master process to a busy worker asking it to give away
+    part of its current work. serial identifies the assignment the request
+    is meant for, and is returned in the SplitMessage.
+    '''
+    serial = 0
+
+    def __init__(self, serial):
+        self.serial = serial
+
+
+class SplitMessage(Message):
+    '''
+    Message from a worker answering a StealMessage, with the halves of its
+    pair it gave away and those it kept. given is empty if the worker could
+    not split its work.
+    '''
+    serial = 0
+    given = None
+    kept = None
+
+    def __init__(self, rank, serial, given, kept=None):
+        self.sourceRank = rank
+        self.serial = serial
+        self.given = given
+        self.kept = kept
+
+
+class ReturnWorkMessage(Message):
+    '''
+    Message from a worker answering a StealMessage by giving back the
+    assignments it had queued but not started, identified by their serials.
+    '''
+    serials = None
+
+    def __init__(self, rank, serials):
+        self.sourceRank = rank
+        self.serials = serials
 
 
 class StopMessage(Message):
@@ -82,3 +196,23 @@ class ReportPairMessage(Message):
         self.disjointnessNumber = dNumber
         self.commutativityNumber = cNumber
 
+
+class ReportBatchMessage(Message):
+    '''
+    Message from worker to master with the reports of a batch of pairs, all
+    completions of the pair with id idnum. Every report is a tuple (m1, m2,
+    disjointness number, commutativity number), where m1 and m2 are encoded
+    mappings as strings (see vertexTable.py) whose endpoint maps are the
+    domain codes epm1 and epm2.
+    '''
+    epm1 = None
+    epm2 = None
+    reports = None
+    idnum = 0
+
+    def __init__(self, rank, epm1, epm2, reports, idnum=0):
+        self.sourceRank = rank
+        self.epm1 = epm1
+        self.epm2 = epm2
+        self.reports = reports
+        self.idnum = idnum
@@ -6,82 +6,389 @@ are both disjoint as well as commutative.
 Changing of parameters is done in config.py.
 '''
 from __future__ import division
-from mpi4py import MPI
+import os
+import time
+import cProfile
+from collections import deque
 from config import LOGFILE, N, M, T, PAIRSKIP, WORKER_REPORT_INTERVAL
-from mappingIterators import SurjectiveMappingIterator
+from config import PAIR_ENGINE, CANONICAL_PAIRS, RUN_MODE, DISPATCH_PAIR_IDS
+from config import STATIC_SHARDING, WORK_STEALING
+from config import CHECKPOINT_FILE, CHECKPOINT_INTERVAL, PREFETCH_DEPTH
+from config import CHUNK_TIME, CHUNK_MAX
+from config import REPORT_BATCH_SIZE, REPORT_BATCH_INTERVAL, WIRE_FORMAT
+from config import TRANSPORT, TRANSPORT_PROCESSES, TRANSPORT_PORT
+from config import HIERARCHY_GROUP_SIZE, RESULT_FILE, STAGE_STATS
+from config import PROFILE_DIR
 from mappingIterators import EndpointEmptyMappingPairIterator
+from mappingIterators import defaultPairIndex
 from datetime import datetime
-from comparitors import checkCommutativity, checkDisjointness
+from comparitors import checkCommutativityEncoded
+from pairEngine import PAIR_ENGINES, CountingPairEngine
 from message import StopMessage, NewPairMessage, ReportPairMessage
 from message import StatusMessage, DonePairMesage, Message
-from mapping import MappingPair, Mapping
+from message import NewPairIdMessage, StealMessage, SplitMessage
+from message import ReportBatchMessage, ReturnWorkMessage
+from message import NewChunkMessage, NewChunkIdMessage, DoneChunkMessage
+from mapping import Mapping
+from vertexTable import defaultTable
+from symmetry import armPermutations, canonicalPair
+from legCache import legCache
+from scheduler import PairScheduler, count_pair
+from scheduler import read_checkpoint, write_checkpoint, Block
+from wireFormat import defaultWireFormat
+from asyncLog import AsyncLog
+from resultStore import ResultWriter
+from transport import MPITransport, ANY_SOURCE, run_processes
+from stageStats import StageStats
+from profileMerge import profile_filename
 
-# file object used by logger
+# AsyncLog used by logger
 f = None
-comm = MPI.COMM_WORLD
-rank = comm.Get_rank()
-num_workers = comm.Get_size()-1
+# ResultWriter the reported pairs are stored with, if RESULT_FILE is set
+results = None
+# StageStats of the pairs done, added up from the done messages received
+stageTotals = None
+# requests of the non-blocking sends of the master which may not be complete
+sendRequests = []
+# work messages received by a worker but not yet started
+workQueue = deque()
+# Transport to the other processes, set by start
+transport = None
+rank = 0
+# rank this process gets its work from, and the ranks it gives work to
+master = 0
+workers = []
 
 
 def main_master():
     '''
     Main function for master process.
     Responsible for generating, sending pairs and collecting input.
+
+    The work of every worker is tracked by a PairScheduler. If WORK_STEALING
+    is set, workers left without work once every pair has been given out
+    are not stopped: busy workers are asked to give back work they have
+    queued, or to split off part of their pair, for them instead.
+
+    Every worker is kept PREFETCH_DEPTH assignments ahead, with non-blocking
+    sends, so that it can start the next one as soon as it is done. If
+    CHUNK_TIME is set, assignments are chunks of pairs sized to take about
+    CHUNK_TIME seconds on the worker.
+
+    If CHECKPOINT_FILE is set, the state of the scheduler is saved to it
+    every CHECKPOINT_INTERVAL seconds, and a run started with an existing
+    checkpoint continues from it. The checkpoint is removed once the run
+    finishes.
+
+    In hierarchical mode, the workers of the master are the group leaders,
+    which are given blocks of pairs for their group, see main_leader.
     '''
-    global f
-    f = open(LOGFILE, 'a')
+    global f, results
+    state = master_readCheckpoint()
+    f = AsyncLog(LOGFILE)
+    if RESULT_FILE:
+        # a resumed run appends to the result file of the run it continues
+        runId = state.get('runId') if state is not None else None
+        results = ResultWriter(RESULT_FILE, runId=runId)
 
-    counts = {'pairsSent': 0, 'pairsDone': 0, 'totalCompletions': 0,
-              'completionsPassed': 0}
     # First, main_master prints startup information
     report("")
     report("---NEW TEST:: started: {}".format(str(datetime.now())))
     report("N = {}, M = {}, T = {}, PAIRSKIP:{}".format(N, M, T, PAIRSKIP))
-    report("Workers: {}".format(num_workers))
+    report("Run mode: {}".format(RUN_MODE))
+    report("Canonical pairs only: {}".format(CANONICAL_PAIRS))
+    report("Dispatch pair ids: {}".format(DISPATCH_PAIR_IDS))
+    report("Work stealing: {}".format(WORK_STEALING))
+    report("Prefetch depth: {}".format(PREFETCH_DEPTH))
+    report("Chunk time: {}".format(CHUNK_TIME))
+    report("Workers: {}".format(len(workers)))
+    if HIERARCHY_GROUP_SIZE:
+        report("Group leaders: {}, logs: {}".format(workers,
+                                                    shard_logfile('*')))
     report("")
     # then wait for all workers to print their init.
-    comm.Barrier()
+    transport.barrier()
     # workers working...
-    comm.Barrier()
-    # empty pair generator
-    pairgen = EndpointEmptyMappingPairIterator()
-    status = [True for i in range(num_workers+2)]
-    status[0] = False
+    transport.barrier()
+    scheduler = master_scheduler(state)
+    lastCheckpoint = time.time()
+    status = [False] * transport.size
+    for i in workers:
+        status[i] = True
     # send initial pairs
-    for i in range(1, num_workers+1):
-        try:
-            pair = pairgen.next()
-            report_startpair(i, pair)
-            comm.send(NewPairMessage(pair), dest=i)
-            counts['pairsSent'] += 1
-        # if we run out of pairs early, tell worker to stop
-        except StopIteration:
-            status[i] = False
-            comm.send(StopMessage(), dest=i)
+    for i in workers:
+        master_assign(scheduler, status, i)
 
     # now wait for replies and act accordingly
     while True in status:
+        if WORK_STEALING:
+            master_balance(scheduler, status)
+            if True not in status:
+                break
         # get reply
-        reply = comm.recv(source=MPI.ANY_SOURCE)
+        reply = recv_message()
+        if isinstance(reply, ReportBatchMessage):
+            # drop the reports written out before a restored checkpoint
+            del reply.reports[:scheduler.reported(
+                reply.sourceRank, reply.idnum, len(reply.reports))]
         i = handle_reply(reply)
-        # worker wanting more pairs
+        # worker wanting more work
         if i is not None:
-            counts['pairsDone'] += 1
-            try:
-                pair = pairgen.next()
-                report_startpair(i, pair)
-                comm.send(NewPairMessage(pair), dest=i)
-                counts['pairsSent'] += 1
-            # run out of pairs, tell worker to stop.
-            except StopIteration:
-                status[i] = False
-                comm.send(StopMessage(), dest=i)
+            scheduler.done(i, reply)
+            master_assign(scheduler, status, i)
+        elif isinstance(reply, SplitMessage):
+            scheduler.split(reply.sourceRank, reply.serial, reply.given,
+                            reply.kept)
+        elif isinstance(reply, ReturnWorkMessage):
+            scheduler.returned(reply.sourceRank, reply.serials)
+        if CHECKPOINT_FILE and \
+                time.time() - lastCheckpoint >= CHECKPOINT_INTERVAL:
+            master_checkpoint(scheduler)
+            lastCheckpoint = time.time()
     # by now, all workers have stopped.
+    transport.waitall(sendRequests)
     report("---FINISHED:: time: {}".format(str(datetime.now())))
+    report(scheduler.counts)
+    if stageTotals is not None:
+        report("Stages:\n\t{}".format(stageTotals))
+    f.close()
+    if results is not None:
+        results.close()
+    # the run is complete, so there is nothing left to resume
+    if CHECKPOINT_FILE and os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+
+    transport.barrier()
+    transport.finalize()
+
+
+def master_readCheckpoint():
+    '''
+    Return the state saved in CHECKPOINT_FILE, or None if there is none. A
+    checkpoint of a run with different parameters is rejected. The log and
+    result file are cut back to their size at the checkpoint, since the
+    work done after it is done again.
+    '''
+    if not CHECKPOINT_FILE:
+        return None
+    state = read_checkpoint(CHECKPOINT_FILE)
+    if state is None:
+        return None
+    if state.get('params') != checkpoint_params():
+        raise ValueError("Checkpoint {} is for a run with {}".format(
+            CHECKPOINT_FILE, state.get('params')))
+    truncate_file(LOGFILE, state['logSize'])
+    if RESULT_FILE and state['resultSize'] is not None:
+        truncate_file(RESULT_FILE, state['resultSize'])
+    return state
+
+
+def truncate_file(filename, size):
+    '''
+    Cut a file back to size bytes, if it exists.
+    '''
+    if os.path.exists(filename):
+        with open(filename, 'r+b') as out:
+            out.truncate(size)
+
+
+def master_scheduler(state=None):
+    '''
+    Return the PairScheduler for the run, restored from the checkpoint state
+    if there is one.
+    '''
+    if state is None:
+        pairgen = EndpointEmptyMappingPairIterator(canonical=CANONICAL_PAIRS)
+        return master_newScheduler(pairgen)
+    pairsSent = state['counts']['pairsSent']
+    pairgen = EndpointEmptyMappingPairIterator(skip=pairsSent,
+                                               canonical=CANONICAL_PAIRS)
+    scheduler = master_newScheduler(pairgen)
+    scheduler.restore(state, defaultPairIndex().pair)
+    report("Resumed from checkpoint {}: {} pairs sent, {} pieces to redo"
+           .format(CHECKPOINT_FILE, pairsSent, len(scheduler.pieces)))
+    report("Counts so far: {}".format(scheduler.counts))
+    report("")
+    return scheduler
+
+
+def master_newScheduler(pairgen):
+    '''
+    Return a PairScheduler for pairgen set up from config.py.
+    '''
+    total = len(defaultPairIndex()) if CHUNK_TIME else None
+    if HIERARCHY_GROUP_SIZE:
+        # blocks for a group leader are sized to keep every worker of the
+        # group busy for CHUNK_TIME. Leaders do not split their work
+        return PairScheduler(pairgen, False, PREFETCH_DEPTH,
+                             CHUNK_TIME * HIERARCHY_GROUP_SIZE,
+                             CHUNK_MAX * HIERARCHY_GROUP_SIZE, total,
+                             len(workers))
+    return PairScheduler(pairgen, WORK_STEALING, PREFETCH_DEPTH, CHUNK_TIME,
+                         CHUNK_MAX, total, len(workers))
+
+
+def master_checkpoint(scheduler):
+    '''
+    Save the state of the scheduler to CHECKPOINT_FILE, with the sizes of the
+    log and result file, and the run id of the result file.
+    '''
+    state = scheduler.checkpoint()
+    state['params'] = checkpoint_params()
+    # the log and results should have everything the checkpoint counts
+    f.flush()
+    state['logSize'] = os.path.getsize(LOGFILE)
+    state['resultSize'] = None
+    state['runId'] = None
+    if results is not None:
+        results.flush()
+        state['resultSize'] = os.path.getsize(RESULT_FILE)
+        state['runId'] = results.runId
+    write_checkpoint(CHECKPOINT_FILE, state)
+
+
+def checkpoint_params():
+    '''
+    Return the parameters a checkpoint has to agree with to be resumed.
+    '''
+    return {'N': N, 'M': M, 'T': T, 'canonical': CANONICAL_PAIRS,
+            'runMode': RUN_MODE, 'engine': PAIR_ENGINE}
+
+
+def master_assign(scheduler, status, i):
+    '''
+    Fill the queue of worker i with work. If there is none left and the
+    worker has nothing queued, it is stopped, unless it has been left idle
+    to wait for work to be split off.
+    '''
+    for k in range(scheduler.wanted(i)):
+        work = scheduler.nextWork(i)
+        if work is None:
+            break
+        master_send(i, work)
+    if i not in scheduler.assigned and i not in scheduler.idle:
+        # if we run out of pairs, tell worker to stop
+        status[i] = False
+        send_message(StopMessage(), dest=i)
+
+
+def master_send(i, work):
+    '''
+    Send an Assignment to worker i without waiting for it to be received.
+    '''
+    if len(work.pairs) > 1:
+        for pair in work.pairs:
+            report_startpair(i, pair)
+        message = newChunkMessage(work.pairs, work.serial)
+    else:
+        report_startpair(i, work.pair, work.halves)
+        message = newPairMessage(work.pair, work.halves, work.serial)
+    sendRequests.append(send_message(message, dest=i, block=False))
+    sendRequests[:] = [r for r in sendRequests if not r.Test()]
+
+
+def master_balance(scheduler, status):
+    '''
+    Hand waiting pieces to idle workers, ask busy workers to split their work
+    for the remaining idle ones, and stop the idle workers once all work is
+    done.
+    '''
+    for i, work in scheduler.assignIdle():
+        master_send(i, work)
+    for i, serial in scheduler.stealRequests():
+        send_message(StealMessage(serial), dest=i)
+    if scheduler.finished():
+        for i in scheduler.idle:
+            status[i] = False
+            send_message(StopMessage(), dest=i)
+        scheduler.idle = []
+
+
+def main_static():
+    '''
+    Main function for every process when STATIC_SHARDING is set.
+    There is no master: every rank, including rank 0, processes the pairs
+    whose id is congruent to its rank + 1 modulo the number of processes,
+    building them with the shared PairIndex. Reports are written to a log
+    file, and result file, per rank, and the counts of all ranks are
+    combined on rank 0 at the end with a single gather.
+    '''
+    global f, results
+    size = transport.size
+    f = AsyncLog(shard_logfile(rank))
+    if RESULT_FILE:
+        results = ResultWriter(shard_filename(RESULT_FILE, rank))
+    counts = {'pairsSent': 0, 'pairsDone': 0, 'pairsCovered': 0,
+              'totalCompletions': 0, 'completionsPassed': 0}
+    report("")
+    report("---NEW SHARD:: started: {}".format(str(datetime.now())))
+    report("N = {}, M = {}, T = {}".format(N, M, T))
+    report("Run mode: {}".format(RUN_MODE))
+    report("Canonical pairs only: {}".format(CANONICAL_PAIRS))
+    report("Shard: {} of {}".format(rank, size))
+    report("")
+    index = defaultPairIndex()
+    if CANONICAL_PAIRS:
+        group = armPermutations()
+        keyCache = {}
+    for idnum in xrange(rank + 1, len(index) + 1, size):
+        pair = index.pair(idnum)
+        if CANONICAL_PAIRS:
+            isCanonical, pair.orbitSize = canonicalPair(pair, group,
+                                                        cache=keyCache)
+            if not isCanonical:
+                continue
+        counts['pairsSent'] += 1
+        report_startpair(rank, pair)
+        reply = worker_processPair(pair, handle_reply)
+        handle_reply(reply)
+        count_pair(counts, reply, pair.orbitSize)
+    report("---FINISHED SHARD:: time: {}".format(str(datetime.now())))
     report(counts)
+    report(legCache)
+    if stageTotals is not None:
+        report("Stages:\n\t{}".format(stageTotals))
+    f.close()
+    if results is not None:
+        results.close()
+    # combine the counts, and stage stats, of every rank on rank 0
+    allCounts = transport.gather((counts, stageTotals), root=0)
+    if rank == 0:
+        total = dict((k, sum(c[k] for c, s in allCounts)) for k in counts)
+        stages = None
+        for c, s in allCounts:
+            if s is not None:
+                if stages is None:
+                    stages = StageStats()
+                stages.add(s)
+        f = AsyncLog(LOGFILE)
+        report("")
+        report("---STATIC RUN FINISHED:: time: {}".format(
+            str(datetime.now())))
+        report("N = {}, M = {}, T = {}".format(N, M, T))
+        report("Shards: {}, logs: {}".format(size, shard_logfile('*')))
+        report(total)
+        if stages is not None:
+            report("Stages:\n\t{}".format(stages))
+        f.close()
+    transport.barrier()
+    transport.finalize()
 
-    comm.Barrier()
-    MPI.Finalize()
+
+def shard_logfile(r):
+    '''
+    Return the name of the log file of rank r in static sharding mode, or of
+    group leader r in hierarchical mode.
+    '''
+    return shard_filename(LOGFILE, r)
+
+
+def shard_filename(filename, r):
+    '''
+    Return the name of the file of rank r for one of the files of a run.
+    '''
+    base, ext = os.path.splitext(filename)
+    return "{}.rank{}{}".format(base, r, ext)
 
 
 def main_worker():
@@ -91,109 +398,412 @@ def main_worker():
     master process.
     '''
     # wait for master to print initialization
-    comm.Barrier()
+    transport.barrier()
     print "Worker #{:0>2d} init".format(rank)
     # pass back to master
-    comm.Barrier()
+    transport.barrier()
     # main worker loop
     while True:
-        # recieve a message from any worker
-        message = comm.recv(source=0)
+        # take queued work first, otherwise wait for the master
+        if workQueue:
+            message = workQueue.popleft()
+        else:
+            message = recv_message(source=master)
         if isinstance(message, StopMessage):
             break
         elif isinstance(message, NewPairMessage):
             # do the pair completion and then return.
-            message = worker_processPair(message.pair)
-            comm.send(message)
+            message = worker_processPair(message.pair, halves=message.halves,
+                                         stealable=WORK_STEALING,
+                                         serial=message.serial)
+            send_message(message)
+        elif isinstance(message, NewPairIdMessage):
+            pair = defaultPairIndex().pair(message.idnum)
+            message = worker_processPair(pair, halves=message.halves,
+                                         stealable=WORK_STEALING,
+                                         serial=message.serial)
+            send_message(message)
+        elif isinstance(message, (NewChunkMessage, NewChunkIdMessage)):
+            if isinstance(message, NewChunkIdMessage):
+                pairs = [defaultPairIndex().pair(idnum)
+                         for idnum in message.idnums]
+            else:
+                pairs = message.pairs
+            # pairs of a chunk are not split, but queued work can be given
+            # back while they are processed
+            replies = [worker_processPair(pair, stealable=WORK_STEALING)
+                       for pair in pairs]
+            send_message(DoneChunkMessage(rank, replies))
+        elif isinstance(message, StealMessage):
+            # the work it was meant for is already done
+            send_message(SplitMessage(rank, message.serial, []))
         else:
             raise TypeError("Got bad message: {}".format(message))
+    print "Worker #{:0>2d} {}".format(rank, legCache)
     # done, wait for master and quit
-    comm.Barrier()
-    MPI.Finalize()
+    transport.barrier()
+    transport.finalize()
 
 
-def worker_processPair(pair):
+def main_leader():
+    '''
+    Main function for group leaders in hierarchical mode.
+    A leader is a worker of the master, and a master for the workers of its
+    group: the blocks of pairs it is given are handed out to its workers as
+    main_master would, with prefetching, chunks and work stealing inside the
+    group. Reports and status messages of the group are written to the log
+    file, and result file, of the leader, and only the merged counts of
+    every block are sent to the master, in the order the blocks were given.
+    '''
+    global f, results
+    f = AsyncLog(shard_logfile(rank))
+    if RESULT_FILE:
+        results = ResultWriter(shard_filename(RESULT_FILE, rank))
+    report("")
+    report("---NEW GROUP:: started: {}".format(str(datetime.now())))
+    report("N = {}, M = {}, T = {}".format(N, M, T))
+    report("Leader: {}, workers: {}".format(rank, workers))
+    report("")
+    transport.barrier()
+    transport.barrier()
+    # idle workers are kept waiting for the next block rather than stopped
+    scheduler = PairScheduler(iter(()), True, PREFETCH_DEPTH, CHUNK_TIME,
+                              CHUNK_MAX, None, len(workers))
+    # blocks not yet reported to the master, and the block and index in it
+    # of every pair they hold
+    blocks = deque()
+    where = {}
+    stopping = False
+    for i in workers:
+        leader_assign(scheduler, i)
+    while True:
+        message = recv_message()
+        if isinstance(message, StopMessage):
+            stopping = True
+        elif isinstance(message, StealMessage):
+            # blocks are handed out as soon as they arrive
+            send_message(SplitMessage(rank, message.serial, []))
+        elif isinstance(message, (NewPairMessage, NewPairIdMessage,
+                                  NewChunkMessage, NewChunkIdMessage)):
+            block = leader_block(message)
+            blocks.append(block)
+            for k, pair in enumerate(block.pairs):
+                where[id(pair)] = (block, k)
+            if isinstance(message, (NewPairMessage, NewPairIdMessage)) and \
+                    message.halves is not None:
+                scheduler.addPiece(block.pairs[0], message.halves)
+            else:
+                scheduler.feed(block.pairs)
+            for i in scheduler.idle[:]:
+                scheduler.idle.remove(i)
+                leader_assign(scheduler, i)
+        else:
+            i = handle_reply(message)
+            if i is not None:
+                replies = getattr(message, 'replies', [message])
+                work = scheduler.done(i, message)
+                for pair, reply in zip(work.pairs, replies):
+                    block, k = where[id(pair)]
+                    block.count(k, reply)
+                leader_assign(scheduler, i)
+            elif isinstance(message, SplitMessage):
+                piece = scheduler.split(message.sourceRank, message.serial,
+                                        message.given, message.kept)
+                if piece is not None:
+                    block, k = where[id(piece.pair)]
+                    block.left[k] += 1
+            elif isinstance(message, ReturnWorkMessage):
+                scheduler.returned(message.sourceRank, message.serials)
+        if WORK_STEALING:
+            for i, work in scheduler.assignIdle():
+                master_send(i, work)
+            for i, serial in scheduler.stealRequests():
+                send_message(StealMessage(serial), dest=i)
+        # report finished blocks in order
+        while blocks and blocks[0].finished():
+            block = blocks.popleft()
+            for pair in block.pairs:
+                del where[id(pair)]
+            send_message(block.reply(rank))
+        if stopping and not blocks and scheduler.finished():
+            break
+    for i in workers:
+        send_message(StopMessage(), dest=i)
+    transport.waitall(sendRequests)
+    report("---FINISHED GROUP:: time: {}".format(str(datetime.now())))
+    report(scheduler.counts)
+    if stageTotals is not None:
+        report("Stages:\n\t{}".format(stageTotals))
+    f.close()
+    if results is not None:
+        results.close()
+    transport.barrier()
+    transport.finalize()
+
+
+def leader_block(message):
+    '''
+    Return the Block for a message from the master giving work to a group
+    leader.
+    '''
+    if isinstance(message, NewChunkIdMessage):
+        pairs = [defaultPairIndex().pair(idnum) for idnum in message.idnums]
+    elif isinstance(message, NewChunkMessage):
+        pairs = message.pairs
+    elif isinstance(message, NewPairIdMessage):
+        pairs = [defaultPairIndex().pair(message.idnum)]
+    else:
+        pairs = [message.pair]
+    return Block(pairs, isinstance(message, (NewChunkMessage,
+                                             NewChunkIdMessage)))
+
+
+def leader_assign(scheduler, i):
+    '''
+    Fill the queue of worker i of a group leader with work. A worker left
+    without work is idle until the next block arrives.
+    '''
+    for k in range(scheduler.wanted(i)):
+        work = scheduler.nextWork(i)
+        if work is None:
+            break
+        master_send(i, work)
+
+
+def newPairMessage(pair, halves=None, serial=0):
+    '''
+    Return the message which assigns a pair, or the given halves of it, to a
+    worker: only its id if DISPATCH_PAIR_IDS is set, otherwise the whole
+    pair.
+    '''
+    if DISPATCH_PAIR_IDS:
+        return NewPairIdMessage(pair.idnum, halves, serial)
+    return NewPairMessage(pair, halves, serial)
+
+
+def newChunkMessage(pairs, serial=0):
+    '''
+    Return the message which assigns a chunk of pairs to a worker, as for
+    newPairMessage.
+    '''
+    if DISPATCH_PAIR_IDS:
+        return NewChunkIdMessage([pair.idnum for pair in pairs], serial)
+    return NewChunkMessage(pairs, serial)
+
+
+def worker_processPair(pair, send=None, halves=None, stealable=False,
+                       serial=0):
     '''
     Actual processing of a pair by a worker goes here.
 
     Returns a DonePairMesage when complete  
 
+    Reports and status messages are passed to send, which defaults to
+    sending them to the master. A status message is sent every
+    WORKER_REPORT_INTERVAL completions, failed ones included.
+
+    If halves is given, only those halves of the pair are processed. If
+    stealable is True, the worker answers steal requests from the master
+    for the assignment serial while it works.
+
+    Disjoint pairs are reported in ReportBatchMessages of at most
+    REPORT_BATCH_SIZE pairs, sent when full, when REPORT_BATCH_INTERVAL
+    seconds have passed since the last one, and before returning.
+
+    The pair is processed by the engine selected by PAIR_ENGINE in
+    config.py, which works on the integer-encoded vertex model of
+    vertexTable.py. Only pairs which are reported back are decoded into
+    Mapping objects. If RUN_MODE is 'count', only the counts are computed
+    and no pairs are reported.
+
+    If STAGE_STATS is set, the time spent in every stage and the counts of
+    the engine are kept in a StageStats, sent with the status messages and
+    the DonePairMesage. See stageStats.py.
     '''
-    countTotal = 0
-    countFailures = 0
     # unpack the pair
     map1 = pair[0]
     map2 = pair[1]
     #perform type-checking just in case
     if not (isinstance(map1, Mapping) and isinstance(map2, Mapping)):
         raise TypeError("map1 and map2 must be mapping objects")
-    # start by completing half way and checking disjointness
-    halfLength = N // 2
-    for pm1 in SurjectiveMappingIterator(map1, length=halfLength):
-        for pm2 in SurjectiveMappingIterator(map2, length=halfLength):
-            #if mappings are not disjoint, try again
-            if checkDisjointness(pm1, pm2) == 0:
-                countTotal += 1
-                countFailures += 1
-                worker_periodicReport(countTotal, countFailures)
-                continue
-            #finish completion
-            for m1 in SurjectiveMappingIterator(pm1):
-                for m2 in SurjectiveMappingIterator(pm2):
-                    djnum = checkDisjointness(m1, m2)
-                    if djnum == 0:
-                        countTotal += 1
-                        countFailures += 1
-                        worker_periodicReport(countTotal, countFailures)
-                        continue
-                    # if we pass disjointness, then report the pair
-                    countTotal += 1
-                    worker_periodicReport(countTotal, countFailures)
-                    comnum = checkCommutativity(m1, m2)
-                    report = ReportPairMessage(rank, MappingPair(m1, m2),
-                                               djnum, comnum)
-                    comm.send(report)
+    table = defaultTable
+    stats = StageStats(table) if STAGE_STATS else None
+    if RUN_MODE == 'count':
+        engine = CountingPairEngine(pair, table)
+    elif halves is not None:
+        engine = PAIR_ENGINES[PAIR_ENGINE](pair, table, halves=halves)
+    else:
+        engine = PAIR_ENGINES[PAIR_ENGINE](pair, table)
+    if send is None:
+        send = send_message
+    if stats is not None:
+        stats.lap('engine')
+    # countTotal at the last status check. Engines count failures in bulk,
+    # so progress is checked after setting up the engine, for every pair
+    # generated, from inside the search if the engine can, and at the end
+    checked = [0]
+
+    def progress():
+        worker_periodicReport(engine.countTotal, engine.countFailures,
+                              checked[0], send, stats, engine)
+        checked[0] = engine.countTotal
+
+    if hasattr(engine, 'progress'):
+        engine.progress = progress
+        engine.progressInterval = WORKER_REPORT_INTERVAL
+    progress()
+    batch = []
+    lastBatch = time.time()
+    for m1, m2, djnum in engine.pairs():
+        if stats is not None:
+            stats.lap('enumerate')
+        # every pair generated passes disjointness, so report it
+        progress()
+        if stealable and transport.probe(source=master):
+            worker_poll(engine, serial)
+        if stats is not None:
+            stats.lap('messaging')
+        comnum = checkCommutativityEncoded(m1, m2)
+        if stats is not None:
+            stats.lap('commutativity')
+        batch.append((str(m1), str(m2), djnum, comnum))
+        if len(batch) >= REPORT_BATCH_SIZE or \
+                time.time() - lastBatch >= REPORT_BATCH_INTERVAL:
+            send(ReportBatchMessage(rank, engine.epm1, engine.epm2, batch,
+                                    pair.idnum))
+            batch = []
+            lastBatch = time.time()
+        if stats is not None:
+            stats.lap('messaging')
+    if stats is not None:
+        stats.lap('enumerate')
+    if batch:
+        send(ReportBatchMessage(rank, engine.epm1, engine.epm2, batch,
+                                pair.idnum))
+    progress()
+    countTotal = engine.countTotal
+    countFailures = engine.countFailures
+    if stats is not None:
+        stats.lap('messaging')
+        stats = stats.withEngine(engine)
     # done pair. Return a DonePair message
-    message = DonePairMesage(rank, countTotal, countFailures)
+    message = DonePairMesage(rank, countTotal, countFailures, stats)
     return message
 
 
-def worker_periodicReport(countTotal, countFail):
-    if countTotal % WORKER_REPORT_INTERVAL == 0:
-        report = StatusMessage(rank, countTotal, countFail)
-        comm.send(report)
+def worker_poll(engine, serial):
+    '''
+    Receive the messages waiting from the master while working on the
+    assignment serial with engine. Work is queued, and steal requests are
+    answered.
+    '''
+    while transport.probe(source=master):
+        message = recv_message(source=master)
+        if isinstance(message, StealMessage):
+            worker_steal(engine, serial, message)
+        elif isinstance(message, (NewPairMessage, NewPairIdMessage,
+                                  NewChunkMessage, NewChunkIdMessage,
+                                  StopMessage)):
+            workQueue.append(message)
+        else:
+            raise TypeError("Got bad message: {}".format(message))
+
+
+def worker_steal(engine, serial, message):
+    '''
+    Answer a steal request from the master. Queued work is given back whole
+    if there is any, otherwise part of the work of the engine is given away,
+    if it can be split and the request is for the current assignment.
+    '''
+    queued = [m for m in workQueue if not isinstance(m, StopMessage)]
+    if queued:
+        for m in queued:
+            workQueue.remove(m)
+        send_message(ReturnWorkMessage(rank, [m.serial for m in queued]))
+        return
+    if hasattr(engine, 'steal') and message.serial == serial:
+        given = engine.steal()
+        kept = engine.assignedHalves
+    else:
+        given = []
+        kept = None
+    send_message(SplitMessage(rank, message.serial, given, kept))
+
+
+def send_message(message, dest=None, block=True):
+    '''
+    Send a message to rank dest, by default the master of this process,
+    through the transport. If block is False, the send may be non-blocking,
+    and its request is returned.
+    '''
+    if dest is None:
+        dest = master
+    return transport.send(message, dest=dest, block=block)
+
+
+def recv_message(source=ANY_SOURCE):
+    '''
+    Receive a message from rank source, or from any rank, through the
+    transport.
+    '''
+    return transport.recv(source=source)
+
+
+def worker_periodicReport(countTotal, countFail, previousTotal=None,
+                          send=None, stats=None, engine=None):
+    '''
+    Send a status report if countTotal has passed a multiple of
+    WORKER_REPORT_INTERVAL since previousTotal, which defaults to
+    countTotal - 1. If stats is given, the report carries them with the
+    counts of engine so far.
+    '''
+    if send is None:
+        send = send_message
+    if previousTotal is None:
+        previousTotal = countTotal - 1
+    if countTotal // WORKER_REPORT_INTERVAL > \
+            previousTotal // WORKER_REPORT_INTERVAL:
+        if stats is not None:
+            stats = stats.withEngine(engine)
+        report = StatusMessage(rank, countTotal, countFail, stats)
+        send(report)
 
 
 def report(s):
     '''
-    Report the supplied string to both standard out and the log file.
+    Report the supplied string to both standard out and the log file. The
+    line is written by the writer thread of the log, see asyncLog.py.
     '''
-    global f
-    print s
     f.write(str(s) + '\n')
-    f.flush()
 
 
-def report_startpair(i, pair):
+def report_startpair(i, pair, halves=None):
     '''
-    report that worker i is starting pair 'pair'
+    report that worker i is starting pair 'pair', or the given halves of it
     '''
-    report("Worker #{:0>2d} starting pair:".format(i))
-    report("\tPair id: {}".format(pair.idnum))
-    report("\tMap 1: {}".format(pair[0]))
-    report("\tMap 1 epm: {}".format(pair[0].endpointMap))
-    report("\tMap 2: {}".format(pair[1]))
-    report("\tMap 2 epm: {}".format(pair[1].endpointMap))
-    report("")
+    lines = ["Worker #{:0>2d} starting pair:".format(i),
+             "\tPair id: {}".format(pair.idnum)]
+    if halves is not None:
+        lines.append("\tHalves: {}".format(halves))
+    if CANONICAL_PAIRS:
+        lines.append("\tOrbit size: {}".format(pair.orbitSize))
+    lines.append("\tMap 1: {}".format(pair[0]))
+    lines.append("\tMap 1 epm: {}".format(pair[0].endpointMap))
+    lines.append("\tMap 2: {}".format(pair[1]))
+    lines.append("\tMap 2 epm: {}".format(pair[1].endpointMap))
+    lines.append("")
+    report("\n".join(lines))
 
 
 def handle_reply(reply):
     '''
     Responsible for handling responses of the worker processes
 
-    If a 'done pair' message is recieved, return the rank of the messaging
-    process. Otherwise, return None.
+    If a 'done pair' or 'done chunk' message is recieved, return the rank of
+    the messaging process. Otherwise, return None. The StageStats of done
+    messages are added to stageTotals.
     '''
+    global stageTotals
     if not isinstance(reply, Message):
         raise TypeError("reply must be of type 'Message'")
     if isinstance(reply, StatusMessage):
@@ -202,30 +812,138 @@ def handle_reply(reply):
         wfail = reply.countFailures
         report("STATUS: worker#{}: total:{} fail:{}".format(wrank, wtotal,
                                                             wfail))
+        if reply.stats is not None:
+            report("STAGES: worker#{}:\n\t{}".format(wrank, reply.stats))
     elif isinstance(reply, DonePairMesage):
         wrank = reply.sourceRank
         wtotal = reply.countTotal
         wfail = reply.countFailures
         report("DONEPAIR: worker#{}: total:{} fail:{}".format(wrank, wtotal,
                                                               wfail))
+        if reply.stats is not None:
+            if stageTotals is None:
+                stageTotals = StageStats()
+            stageTotals.add(reply.stats)
         return wrank
+    elif isinstance(reply, DoneChunkMessage):
+        for r in reply.replies:
+            handle_reply(r)
+        return reply.sourceRank
     elif isinstance(reply, ReportPairMessage):
         wrank = reply.sourceRank
         djnum = reply.disjointnessNumber
         comnum = reply.commutativityNumber
         wpair = reply.pair
-        report("PAIR REPORT")
-        report("\tmap1:{}".format(wpair[0]))
-        report("\tmap2:{}".format(wpair[1]))
-        report("\tdisjointness number:{}".format(djnum))
-        report("\tcommutativity number:{}".format(comnum))
-
+        report("\n".join(["PAIR REPORT",
+                          "\tmap1:{}".format(wpair[0]),
+                          "\tmap2:{}".format(wpair[1]),
+                          "\tdisjointness number:{}".format(djnum),
+                          "\tcommutativity number:{}".format(comnum)]))
+        if results is not None:
+            results.addPair(reply)
+    elif isinstance(reply, ReportBatchMessage) and reply.reports:
+        table = defaultTable
+        lines = []
+        for m1, m2, djnum, comnum in reply.reports:
+            lines.append("PAIR REPORT")
+            lines.append("\tmap1:{}".format(
+                table.decodeMapping(bytearray(m1), reply.epm1)))
+            lines.append("\tmap2:{}".format(
+                table.decodeMapping(bytearray(m2), reply.epm2)))
+            lines.append("\tdisjointness number:{}".format(djnum))
+            lines.append("\tcommutativity number:{}".format(comnum))
+        report("\n".join(lines))
+        if results is not None:
+            results.addBatch(reply)
+    elif isinstance(reply, ReturnWorkMessage):
+        report("RETURN: worker#{}: gave back assignments:{}".format(
+            reply.sourceRank, reply.serials))
+    elif isinstance(reply, SplitMessage):
+        if reply.given:
+            report("SPLIT: worker#{}: gave away halves:{} kept:{}".format(
+                reply.sourceRank, reply.given, reply.kept))
     else:
         return
 
 
+def start(t):
+    '''
+    Run this process as rank t.rank of a run over the transport t.
+    '''
+    global transport, rank, master, workers
+    if HIERARCHY_GROUP_SIZE and not STATIC_SHARDING and not t.peerSends:
+        # group leaders send work to their workers
+        raise ValueError("Hierarchical mode needs the 'mpi' or "
+                         "'multiprocessing' TRANSPORT, {} can only send to "
+                         "rank 0".format(type(t).__name__))
+    transport = t
+    rank = t.rank
+    workers = range(1, t.size)
+    groups = {}
+    if HIERARCHY_GROUP_SIZE and not STATIC_SHARDING:
+        groups = hierarchy_groups(t.size, HIERARCHY_GROUP_SIZE)
+        if rank == 0:
+            workers = sorted(groups)
+        elif rank in groups:
+            workers = groups[rank]
+        else:
+            master = [r for r in groups if rank in groups[r]][0]
+    if STATIC_SHARDING:
+        main, role = main_static, 'static'
+    elif rank == 0:
+        main, role = main_master, 'master'
+    elif rank in groups:
+        main, role = main_leader, 'leader'
+    else:
+        main, role = main_worker, 'worker'
+    if PROFILE_DIR:
+        profile_run(main, role)
+    else:
+        main()
+
+
+def profile_run(main, role):
+    '''
+    Run main under cProfile, and save the stats to the profile of this rank
+    in PROFILE_DIR once it has stopped. See profileMerge.py.
+    '''
+    try:
+        os.makedirs(PROFILE_DIR)
+    except OSError:
+        # made by another rank, or already there
+        if not os.path.isdir(PROFILE_DIR):
+            raise
+    profile = cProfile.Profile()
+    try:
+        profile.runcall(main)
+    finally:
+        profile.dump_stats(profile_filename(PROFILE_DIR, rank, role))
+
+
+def hierarchy_groups(size, groupSize):
+    '''
+    Return a dictionary of the workers of every group leader, for ranks 1 to
+    size - 1 split into groups of a leader followed by up to groupSize
+    workers. A rank left over at the end joins the group before it.
+    '''
+    if size < 3:
+        raise ValueError("Hierarchical mode needs a leader and a worker")
+    groups = {}
+    ranks = range(1, size)
+    for k in range(0, len(ranks), groupSize + 1):
+        group = ranks[k:k + groupSize + 1]
+        if len(group) > 1:
+            groups[group[0]] = group[1:]
+        else:
+            groups[max(groups)].extend(group)
+    return groups
+
+
 if __name__ == '__main__':
-    if rank == 0:
-        main_master()
+    # messages are pickled unless WIRE_FORMAT selects the binary encoding
+    wire = defaultWireFormat if WIRE_FORMAT == 'binary' else None
+    if TRANSPORT == 'mpi':
+        start(MPITransport(wire))
     else:
-        main_worker()
+        run_processes(TRANSPORT_PROCESSES, start, TRANSPORT, wire,
+                      TRANSPORT_PORT)
@@ -0,0 +1,533 @@
+'''
+pairEngine.py - Engines which process a MappingPair in a worker.
+
+An engine takes a MappingPair of endpoint-empty mappings and produces the same
+results as completing both mappings half way, checking disjointness, and then
+completing and checking them fully:
+    - countTotal and countFailures, as reported in a DonePairMesage. Every
+      non-disjoint pair of half completions counts once, as does every pair
+      of full completions of a disjoint pair of half completions.
+    - every disjoint pair of full completions, with its disjointness number.
+
+Every engine has a pairs() method which generates the disjoint pairs. While
+it runs, countTotal and countFailures hold running totals; once it is
+exhausted they hold the totals for the whole pair. halfFailures and
+halfPassed count the pairs of half completions which fail and pass the
+disjointness check at half length, the first stage of the counts of
+stageStats.py.
+
+The engine used by the workers is selected with PAIR_ENGINE in config.py.
+CountingPairEngine only computes the counts, and is used instead when
+RUN_MODE is 'count'.
+'''
+from mapping import Mapping
+from compactMapping import CompactMapping
+from vertexTable import defaultTable
+from mappingIterators import cachedLegCompletions, encodedLegTargets
+from mappingIterators import encodedLegPrefix, encodedLegChoices
+from comparitors import checkLegDisjointnessEncoded
+from itertools import product
+
+
+def encodePairMapping(mapping, table=defaultTable):
+    '''
+    Return the encoded mapping and encoded endpoint map of a Mapping or
+    CompactMapping.
+    '''
+    if isinstance(mapping, CompactMapping):
+        return mapping.buffer, mapping.endpointCodes
+    if not isinstance(mapping, Mapping):
+        raise TypeError("map1 and map2 must be mapping objects")
+    return (table.encodeMapping(mapping),
+            table.encodeEndpointMap(mapping.endpointMap))
+
+
+def legCountTables(table, buf, epm, halfLength):
+    '''
+    Return the choice tables of every leg of an encoded mapping with an
+    encoded endpoint map, and the half and full count tables of every leg.
+    half[l][p][last] is the number of ways to complete leg l from position p
+    up to halfLength, given the image last of the previous position, and
+    full[l][p][last] the number of ways to complete it from position
+    p >= halfLength up to full length.
+    '''
+    h = halfLength
+    choices = []
+    halves = []
+    fulls = []
+    for l in range(table.T):
+        choice = encodedLegChoices(table, table.N,
+                                   encodedLegTargets(table, epm, l))
+        # vertices already defined are fixed during the half stage.
+        for p, c in enumerate(encodedLegPrefix(table, buf, l, h)):
+            choice[p] = ((c,),) * table.codomainSize
+        half = [None] * (h + 1)
+        half[h] = (1,) * table.codomainSize
+        for p in range(h - 1, -1, -1):
+            half[p] = tuple(sum(half[p + 1][c] for c in row)
+                            for row in choice[p])
+        full = [None] * (table.N + 1)
+        full[table.N] = (1,) * table.codomainSize
+        for p in range(table.N - 1, h - 1, -1):
+            full[p] = tuple(sum(full[p + 1][c] for c in row)
+                            for row in choice[p])
+        choices.append(choice)
+        halves.append(half)
+        fulls.append(full)
+    return choices, halves, fulls
+
+
+class FactorizedPairEngine(object):
+    '''
+    Processes a pair by treating each leg separately.
+
+    Both the surjective completions of a mapping and the disjointness check
+    work on every leg independently, given the basepoints. The disjoint pairs
+    of completions are therefore the product over all legs of the disjoint
+    pairs of leg completions, and their disjointness number is the smallest
+    one over all legs. The engine enumerates the compatible pairs of leg
+    completions once per leg, after which the counts are computed directly
+    and the disjoint pairs are generated as a product.
+
+    A pair can be split into subproblems by the half completions of map1 on
+    splitLeg, the leg where map1 has the most of them (splitSize). The
+    optional halves argument lists the indices of the half completions the
+    engine covers, and defaults to all of them; the counts of subproblems
+    add up to those of the whole pair. pairs() works through the halves in
+    order, and steal() takes away some of those not started yet which have
+    disjoint pairs, so that they can be handed to another worker.
+
+    After construction the following are available:
+        - countFailures: as reported in a DonePairMesage. countTotal starts
+          out equal to it and is incremented by pairs().
+        - countPassed: the number of disjoint pairs of full completions
+        - halfFailures, halfPassed: the numbers of pairs of half completions
+          which are not disjoint, and which are
+        - legPairs: for every leg, a list of (legA, legB, dist) tuples for
+          every disjoint pair of full leg completions.
+        - assignedHalves: the indices of the halves the engine covers.
+        - remaining: the indices of the halves pairs() has not started.
+
+    Leg completions are looked up in the LegCompletionCache given, or the
+    shared one of legCache.py, so they are only generated once across the
+    pairs a worker processes.
+    '''
+    table = None
+    halfLength = 0
+    countTotal = 0
+    countFailures = 0
+    countPassed = 0
+    halfFailures = 0
+    halfPassed = 0
+    legPairs = None
+    cache = None
+    splitLeg = 0
+    splitSize = 0
+    splitHalves = None
+    assignedHalves = None
+    remaining = None
+
+    def __init__(self, pair, table=None, cache=None, halves=None):
+        if table is None:
+            table = defaultTable
+        self.table = table
+        self.cache = cache
+        self.halfLength = table.N // 2
+        self.buf1, self.epm1 = encodePairMapping(pair[0], table)
+        self.buf2, self.epm2 = encodePairMapping(pair[1], table)
+        legs = []
+        for l in range(table.T):
+            half1, ext1 = self._legCompletions(self.buf1, self.epm1, l)
+            half2, ext2 = self._legCompletions(self.buf2, self.epm2, l)
+            legs.append((half1, ext1, half2, ext2))
+        self.splitLeg = max(range(table.T), key=lambda l: len(legs[l][0]))
+        self.splitSize = len(legs[self.splitLeg][0])
+        if halves is None:
+            halves = range(self.splitSize)
+        self.assignedHalves = list(halves)
+        self.remaining = list(halves)
+        # products over the legs which are not split
+        halfCount1 = 1
+        halfCount2 = 1
+        halfPassed = 1
+        fullTotal = 1
+        passed = 1
+        self.legPairs = []
+        for l, (half1, ext1, half2, ext2) in enumerate(legs):
+            if l == self.splitLeg:
+                self.legPairs.append(None)
+                continue
+            halfPairs, extPairs, legPairs = self._legPairs(half1, ext1,
+                                                           half2, ext2)
+            halfCount1 *= len(half1)
+            halfCount2 *= len(half2)
+            halfPassed *= halfPairs
+            fullTotal *= extPairs
+            passed *= len(legPairs)
+            self.legPairs.append(legPairs)
+        # failures, number passed, leg pairs, and failures and number
+        # passed at half length of every half on splitLeg
+        half1, ext1, half2, ext2 = legs[self.splitLeg]
+        self.splitHalves = []
+        for a in half1:
+            halfPairs, extPairs, legPairs = self._legPairs([a], ext1,
+                                                           half2, ext2)
+            halfFailures = halfCount1 * len(half2) * halfCount2 - \
+                halfPairs * halfPassed
+            countPassed = len(legPairs) * passed
+            self.splitHalves.append((halfFailures + extPairs * fullTotal -
+                                countPassed, countPassed, legPairs,
+                                halfFailures, halfPairs * halfPassed))
+        self.legPairs[self.splitLeg] = [p for k in self.remaining
+                                        for p in self.splitHalves[k][2]]
+        self.countFailures = sum(self.splitHalves[k][0]
+                                 for k in self.remaining)
+        self.countPassed = sum(self.splitHalves[k][1]
+                               for k in self.remaining)
+        self.halfFailures = sum(self.splitHalves[k][3]
+                                for k in self.remaining)
+        self.halfPassed = sum(self.splitHalves[k][4] for k in self.remaining)
+        self.countTotal = self.countFailures
+
+    def _legCompletions(self, buf, epm, l):
+        '''
+        Return the half completions of leg l, and a dictionary mapping each
+        of them to the list of their full completions.
+        '''
+        table = self.table
+        targets = encodedLegTargets(table, epm, l)
+        prefix = encodedLegPrefix(table, buf, l, self.halfLength)
+        start = prefix[-1] if prefix else buf[0]
+        half = [prefix + c for c in cachedLegCompletions(
+            table, start, len(prefix), self.halfLength, targets, self.cache)]
+        ext = {}
+        for a in half:
+            start = a[-1] if a else buf[0]
+            ext[a] = [a + c for c in cachedLegCompletions(
+                table, start, self.halfLength, table.N, targets, self.cache)]
+        return half, ext
+
+    def _legPairs(self, half1, ext1, half2, ext2):
+        '''
+        Return the number of disjoint pairs of half leg completions, the
+        number of pairs of full leg completions they lead to, and the list of
+        disjoint pairs of full leg completions among those.
+        '''
+        halfPairs = 0
+        extPairs = 0
+        legPairs = []
+        for a in half1:
+            for b in half2:
+                if self._legDist(a, b) == 0:
+                    continue
+                halfPairs += 1
+                extPairs += len(ext1[a]) * len(ext2[b])
+                for x in ext1[a]:
+                    for y in ext2[b]:
+                        d = self._legDist(x, y)
+                        if d != 0:
+                            legPairs.append((x, y, d))
+        return halfPairs, extPairs, legPairs
+
+    def _legDist(self, legA, legB):
+        return checkLegDisjointnessEncoded(self.buf1[0], self.buf2[0], legA,
+                                           legB, self.table)
+
+    def steal(self):
+        '''
+        Take away the later half, rounded up, of the halves pairs() has not
+        started which have disjoint pairs to generate, and remove their
+        counts. Returns their indices. Halves without any are kept, since
+        their counts are known and there is no work in them to give away.
+        '''
+        work = [k for k in self.remaining if self.splitHalves[k][1]]
+        n = len(work)
+        given = work[n - (n + 1) // 2:]
+        for k in given:
+            self.remaining.remove(k)
+            self.assignedHalves.remove(k)
+            self.countFailures -= self.splitHalves[k][0]
+            self.countTotal -= self.splitHalves[k][0]
+            self.countPassed -= self.splitHalves[k][1]
+            self.halfFailures -= self.splitHalves[k][3]
+            self.halfPassed -= self.splitHalves[k][4]
+        return given
+
+    def pairs(self):
+        '''
+        Generate every disjoint pair of full completions as a tuple
+        (m1, m2, disjointness number), where m1 and m2 are new encoded
+        mappings.
+        '''
+        base1 = bytearray(self.buf1[0:1])
+        base2 = bytearray(self.buf2[0:1])
+        split = self.splitLeg
+        others = self.legPairs[:split] + self.legPairs[split + 1:]
+        while self.remaining:
+            k = self.remaining.pop(0)
+            for first in self.splitHalves[k][2]:
+                for rest in product(*others):
+                    combination = rest[:split] + (first,) + rest[split:]
+                    m1 = bytearray(base1)
+                    m2 = bytearray(base2)
+                    for legA, legB, d in combination:
+                        m1.extend(legA)
+                        m2.extend(legB)
+                    self.countTotal += 1
+                    yield m1, m2, min(d for legA, legB, d in combination)
+
+
+class JointPairEngine(object):
+    '''
+    Processes a pair with a single depth-first search which extends both
+    mappings together, one domain vertex at a time, and checks the
+    disjointness conditions of checkDisjointness as it goes. As soon as the
+    images of a vertex co-incide or cross, the whole subtree below it is
+    skipped.
+
+    Vertices are visited in the same order as the half and full completions
+    are made: first every leg up to half length, then every leg up to full
+    length. The size of a skipped subtree is counted from precomputed
+    per-leg completion counts, so countTotal and countFailures agree with
+    the other engines.
+
+    depthVisits holds the number of pairs of vertex images tried so far at
+    every depth of the search, and nodesVisited their sum.
+
+    Failures are counted as the search goes, and a long stretch of it can
+    yield no pair. If progress is set, it is called with no arguments
+    whenever skipped subtrees take countTotal past a multiple of
+    progressInterval.
+    '''
+    table = None
+    halfLength = 0
+    countTotal = 0
+    countFailures = 0
+    depthVisits = ()
+    halfFailures = 0
+    halfPassed = 0
+    progress = None
+    progressInterval = 1
+
+    def __init__(self, pair, table=None):
+        if table is None:
+            table = defaultTable
+        self.table = table
+        self.halfLength = table.N // 2
+        self.buf1, self.epm1 = encodePairMapping(pair[0], table)
+        self.buf2, self.epm2 = encodePairMapping(pair[1], table)
+        # choice and count tables for both mappings
+        self.choices1, self.half1, self.full1 = legCountTables(
+            table, self.buf1, self.epm1, self.halfLength)
+        self.choices2, self.half2, self.full2 = legCountTables(
+            table, self.buf2, self.epm2, self.halfLength)
+
+    @property
+    def nodesVisited(self):
+        return sum(self.depthVisits)
+
+    def pairs(self):
+        '''
+        Generate every disjoint pair of full completions as a tuple
+        (m1, m2, disjointness number), where m1 and m2 are new encoded
+        mappings.
+        '''
+        table = self.table
+        n = table.N
+        h = self.halfLength
+        T = table.T
+        distance = table.codomainDistance
+        baseA = self.buf1[0]
+        baseB = self.buf2[0]
+        choices1 = self.choices1
+        choices2 = self.choices2
+        half1 = self.half1
+        half2 = self.half2
+        full1 = self.full1
+        full2 = self.full2
+        # number of half completions of the legs after each leg
+        laterHalf1 = [1] * (T + 1)
+        laterHalf2 = [1] * (T + 1)
+        for l in range(T - 1, -1, -1):
+            laterHalf1[l] = laterHalf1[l + 1] * half1[l][0][baseA]
+            laterHalf2[l] = laterHalf2[l + 1] * half2[l][0][baseB]
+        self.countTotal = 0
+        self.countFailures = 0
+        self.halfFailures = 0
+        self.halfPassed = 0
+        # the (leg, position) of every step, half stage first
+        steps = [(l, p) for l in range(T) for p in range(h)] + \
+                [(l, p) for l in range(T) for p in range(h, n)]
+        halfSteps = T * h
+        nsteps = len(steps)
+        visits = self.depthVisits = [0] * nsteps
+        progress = self.progress
+        interval = self.progressInterval
+        nextProgress = interval
+        if baseA == baseB:
+            self.countTotal = self.countFailures = self.halfFailures = \
+                laterHalf1[0] * laterHalf2[0]
+            return
+        imgA = [baseA] * T
+        imgB = [baseB] * T
+        m1 = bytearray([baseA]) * table.domainSize
+        m2 = bytearray([baseB]) * table.domainSize
+        # per depth: candidate image pairs, position in them, images of the
+        # previous vertex on the leg, and the disjointness so far.
+        cands = [None] * nsteps
+        index = [0] * nsteps
+        prevA = [0] * nsteps
+        prevB = [0] * nsteps
+        dists = [0] * nsteps
+        depth = 0
+        if halfSteps == 0:
+            self.halfPassed = 1
+        l, p = steps[0]
+        cands[0] = list(product(choices1[l][p][baseA], choices2[l][p][baseB]))
+        prevA[0] = baseA
+        prevB[0] = baseB
+        dists[0] = distance[baseA][baseB]
+        while depth >= 0:
+            l, p = steps[depth]
+            if index[depth] == len(cands[depth]):
+                # subtree exhausted, restore the leg and go back up
+                imgA[l] = prevA[depth]
+                imgB[l] = prevB[depth]
+                depth -= 1
+                continue
+            a, b = cands[depth][index[depth]]
+            index[depth] += 1
+            visits[depth] += 1
+            pa = prevA[depth]
+            pb = prevB[depth]
+            if a == b or (a == pb and b == pa):
+                # count the pairs of completions below this one as failures
+                if depth < halfSteps:
+                    skipped = half1[l][p + 1][a] * laterHalf1[l + 1] * \
+                        half2[l][p + 1][b] * laterHalf2[l + 1]
+                    self.halfFailures += skipped
+                else:
+                    skipped = full1[l][p + 1][a] * full2[l][p + 1][b]
+                    for later in range(l + 1, T):
+                        skipped *= full1[later][h][imgA[later]] * \
+                            full2[later][h][imgB[later]]
+                self.countTotal += skipped
+                self.countFailures += skipped
+                if progress is not None and self.countTotal >= nextProgress:
+                    progress()
+                    nextProgress = (self.countTotal // interval + 1) * \
+                        interval
+                continue
+            d = distance[a][b]
+            if dists[depth] < d:
+                d = dists[depth]
+            slot = 1 + l*n + p
+            m1[slot] = a
+            m2[slot] = b
+            imgA[l] = a
+            imgB[l] = b
+            depth += 1
+            if depth == halfSteps:
+                self.halfPassed += 1
+            if depth == nsteps:
+                depth -= 1
+                self.countTotal += 1
+                yield bytearray(m1), bytearray(m2), d
+                continue
+            l, p = steps[depth]
+            prevA[depth] = imgA[l]
+            prevB[depth] = imgB[l]
+            cands[depth] = list(product(choices1[l][p][imgA[l]],
+                                        choices2[l][p][imgB[l]]))
+            index[depth] = 0
+            dists[depth] = d
+
+
+class CountingPairEngine(object):
+    '''
+    Computes the counts of a pair without enumerating any completions.
+
+    For every leg, a dynamic programming pass runs over the pairs of codomain
+    codes the previous vertex of the leg maps to under both mappings. A
+    transition is allowed when the images of the next vertex do not
+    co-incide or cross, so after the half stage the states count the
+    disjoint pairs of half leg completions, and after the full stage those
+    of full leg completions. As in FactorizedPairEngine, the totals are then
+    products over the legs.
+
+    The counts are available after construction:
+        - countTotal and countFailures: as reported in a DonePairMesage
+        - countPassed: the number of disjoint pairs of full completions
+        - halfFailures, halfPassed: the numbers of pairs of half completions
+          which are not disjoint, and which are
+    pairs() generates nothing, so the engine can stand in for the
+    enumerating ones when only the counts are needed.
+    '''
+    table = None
+    halfLength = 0
+    countTotal = 0
+    countFailures = 0
+    countPassed = 0
+    halfFailures = 0
+    halfPassed = 0
+
+    def __init__(self, pair, table=None):
+        if table is None:
+            table = defaultTable
+        self.table = table
+        self.halfLength = table.N // 2
+        self.buf1, self.epm1 = encodePairMapping(pair[0], table)
+        self.buf2, self.epm2 = encodePairMapping(pair[1], table)
+        choices1, half1, full1 = legCountTables(table, self.buf1, self.epm1,
+                                                self.halfLength)
+        choices2, half2, full2 = legCountTables(table, self.buf2, self.epm2,
+                                                self.halfLength)
+        h = self.halfLength
+        baseA = self.buf1[0]
+        baseB = self.buf2[0]
+        halfCount = 1
+        halfPassed = 1
+        fullTotal = 1
+        self.countPassed = 1
+        for l in range(table.T):
+            halfCount *= half1[l][0][baseA] * half2[l][0][baseB]
+            states = {}
+            if baseA != baseB:
+                states[(baseA, baseB)] = 1
+            for p in range(h):
+                states = self._step(states, choices1[l][p], choices2[l][p])
+            halfPassed *= sum(states.itervalues())
+            fullTotal *= sum(n * full1[l][h][a] * full2[l][h][b]
+                             for (a, b), n in states.iteritems())
+            for p in range(h, table.N):
+                states = self._step(states, choices1[l][p], choices2[l][p])
+            self.countPassed *= sum(states.itervalues())
+        self.countTotal = halfCount - halfPassed + fullTotal
+        self.countFailures = self.countTotal - self.countPassed
+        self.halfFailures = halfCount - halfPassed
+        self.halfPassed = halfPassed
+
+    def _step(self, states, choice1, choice2):
+        '''
+        Advance the states by one position of a leg, keeping the pairs of
+        images which neither co-incide nor cross.
+        '''
+        result = {}
+        for (pa, pb), n in states.iteritems():
+            for a in choice1[pa]:
+                for b in choice2[pb]:
+                    if a == b or (a == pb and b == pa):
+                        continue
+                    result[(a, b)] = result.get((a, b), 0) + n
+        return result
+
+    def pairs(self):
+        '''
+        Generate nothing; the counts are computed on construction.
+        '''
+        return iter(())
+
+
+# engines by name, as used by PAIR_ENGINE in config.py
+PAIR_ENGINES = {'factorized': FactorizedPairEngine,
+                'joint': JointPairEngine}
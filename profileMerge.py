@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+'''
+profileMerge.py - Merges the profiles of the ranks of a run.
+
+If PROFILE_DIR is set in config.py, every rank of the overseer runs under
+cProfile and saves its stats when it stops, to PROFILE_DIR/ROLE.rankR.prof,
+where ROLE is master, leader, worker or static. Only the main thread of a
+rank is profiled, not the writer thread of its log.
+
+This tool adds up the profiles of the ranks into one profile of the master
+side (the master and the group leaders) and one of the worker side (the
+workers, or the ranks of a static run), saved as master.prof and worker.prof
+for pstats or other viewers, and prints the time of every rank and the top
+functions of both sides.
+
+Usage:
+    python profileMerge.py PROFILE_DIR [--sort cumulative] [--limit 30]
+'''
+import os
+import re
+import sys
+import glob
+import pstats
+import argparse
+
+# side of the run every role of a rank is on
+SIDES = {'master': 'master', 'leader': 'master', 'worker': 'worker',
+         'static': 'worker'}
+# name of a profile of a rank
+PROFILE_NAME = re.compile(r'^(\w+)\.rank(\d+)\.prof$')
+
+
+def profile_filename(directory, rank, role):
+    '''
+    Return the name of the profile of a rank with the given role.
+    '''
+    return os.path.join(directory, "{}.rank{}.prof".format(role, rank))
+
+
+def rank_profiles(directory):
+    '''
+    Return a sorted list of (rank, role, filename) of the profiles of the
+    ranks in a directory.
+    '''
+    profiles = []
+    for filename in glob.glob(os.path.join(directory, '*.rank*.prof')):
+        match = PROFILE_NAME.match(os.path.basename(filename))
+        if match and match.group(1) in SIDES:
+            profiles.append((int(match.group(2)), match.group(1), filename))
+    return sorted(profiles)
+
+
+def merge(directory):
+    '''
+    Return a dictionary of the merged pstats.Stats of every side of the run
+    which has profiles in directory.
+    '''
+    merged = {}
+    for rank, role, filename in rank_profiles(directory):
+        side = SIDES[role]
+        if side in merged:
+            merged[side].add(filename)
+        else:
+            merged[side] = pstats.Stats(filename)
+    return merged
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Merge the profiles of the ranks of a run")
+    parser.add_argument('directory', help="PROFILE_DIR of the run")
+    parser.add_argument('--sort', default='cumulative',
+                        help="pstats sort key of the top functions")
+    parser.add_argument('--limit', type=int, default=30,
+                        help="number of top functions printed")
+    args = parser.parse_args(argv)
+
+    profiles = rank_profiles(args.directory)
+    if not profiles:
+        sys.exit("No rank profiles in {}".format(args.directory))
+    print "{:>6} {:<8} {:>12}".format("rank", "role", "time (s)")
+    for rank, role, filename in profiles:
+        print "{:>6} {:<8} {:>12.3f}".format(rank, role,
+                                             pstats.Stats(filename).total_tt)
+    for side, stats in sorted(merge(args.directory).iteritems()):
+        filename = os.path.join(args.directory, side + '.prof')
+        stats.dump_stats(filename)
+        print
+        print "---{} side: {} ranks, saved to {}".format(
+            side, sum(SIDES[role] == side for r, role, f in profiles),
+            filename)
+        stats.sort_stats(args.sort).print_stats(args.limit)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+'''
+resultIndex.py - Sorted indexes over a result file, and a command line tool
+to query them.
+
+A ResultIndex keeps, for every key in KEYS, the record numbers of a
+ResultStore sorted by that key: the disjointness number, the commutativity
+number, the basepoints (codomain codes of the images of the branch point of
+m1 and m2) and the endpoint maps (domain codes of epm1 and epm2). Range and
+top-k queries are answered by binary search in these orders, reading only
+the records they need from the mapped file.
+
+Indexes are saved next to the result file, in RESULTFILE.idx, with the run
+id and size of the file, and rebuilt when records have been added since or
+the file has been written by another run.
+
+Usage, for example all pairs with disjointness number at least 2 and the
+smallest commutativity number among those, grouped by basepoints:
+
+    python resultIndex.py mapping-results.bin --disjointness 2: \\
+        --minimal commutativity --group basepoints
+'''
+import os
+import sys
+import array
+import cPickle
+import argparse
+from resultStore import ResultStore
+
+# version of the index file format
+INDEX_VERSION = 2
+# key of a record (pair id, m1, m2, epm1, epm2, disjointness number,
+# commutativity number) in every index
+KEYS = {
+    'disjointness': lambda r: r[5],
+    'commutativity': lambda r: r[6],
+    'basepoints': lambda r: (ord(r[1][0]), ord(r[2][0])),
+    'endpoints': lambda r: (tuple(bytearray(r[3])), tuple(bytearray(r[4]))),
+}
+
+
+class ResultIndex(object):
+    '''
+    Sorted indexes over the records of a ResultStore. Records with equal keys
+    are in file order.
+    '''
+    def __init__(self, store, filename=None):
+        '''
+        The indexes are read from filename if it is up to date, otherwise
+        built, and saved to filename if one is given.
+        '''
+        self.store = store
+        self.orders = None
+        if filename is not None:
+            self.orders = read_index(filename, store)
+        if self.orders is None:
+            self.orders = self.build()
+            if filename is not None:
+                write_index(filename, store, self.orders)
+
+    def build(self):
+        '''
+        Return the record numbers sorted by every key, in one pass over the
+        store.
+        '''
+        keys = dict((name, []) for name in KEYS)
+        for record in self.store:
+            for name, key in KEYS.iteritems():
+                keys[name].append(key(record))
+        orders = {}
+        for name, values in keys.iteritems():
+            orders[name] = array.array(
+                'L', sorted(xrange(len(values)), key=values.__getitem__))
+        return orders
+
+    def key(self, name, k):
+        '''
+        Return the key of record k in the index name.
+        '''
+        return KEYS[name](self.store[k])
+
+    def _bisect(self, name, value, right):
+        order = self.orders[name]
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = self.key(name, order[mid])
+            if key < value or (right and key == value):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _bounds(self, name, low, high):
+        lo = 0 if low is None else self._bisect(name, low, False)
+        hi = len(self.store) if high is None else \
+            self._bisect(name, high, True)
+        return lo, max(lo, hi)
+
+    def range(self, name, low=None, high=None):
+        '''
+        Return the record numbers whose key in the index name is between low
+        and high, both included, in key order. A bound of None is open.
+        '''
+        lo, hi = self._bounds(name, low, high)
+        return list(self.orders[name][lo:hi])
+
+    def query(self, ranges):
+        '''
+        Return the record numbers, in file order, matching every (low, high)
+        range in the dictionary ranges of index names. Only the records in
+        the narrowest range are read.
+        '''
+        if not ranges:
+            return range(len(self.store))
+        sizes = []
+        for name, (low, high) in ranges.iteritems():
+            lo, hi = self._bounds(name, low, high)
+            sizes.append((hi - lo, name))
+        n, narrowest = min(sizes)
+        found = []
+        for k in self.range(narrowest, *ranges[narrowest]):
+            record = self.store[k]
+            if all((low is None or KEYS[name](record) >= low) and
+                   (high is None or KEYS[name](record) <= high)
+                   for name, (low, high) in ranges.iteritems()):
+                found.append(k)
+        return sorted(found)
+
+    def top(self, name, k, records=None, largest=False):
+        '''
+        Return the k record numbers with the smallest keys in the index name,
+        or the largest, out of records or the whole store.
+        '''
+        if records is None:
+            order = self.orders[name]
+            if largest:
+                return list(reversed(order[max(len(order) - k, 0):]))
+            return list(order[:k])
+        records = sorted(records, key=lambda r: self.key(name, r),
+                         reverse=largest)
+        return records[:k]
+
+    def minimal(self, name, records):
+        '''
+        Return the records with the smallest key in the index name.
+        '''
+        keys = [(self.key(name, r), r) for r in records]
+        if not keys:
+            return []
+        least = min(keys)[0]
+        return [r for key, r in keys if key == least]
+
+    def group(self, name, records):
+        '''
+        Return a list of (key, record numbers) of the records grouped by
+        their key in the index name, in key order.
+        '''
+        groups = {}
+        for r in records:
+            groups.setdefault(self.key(name, r), []).append(r)
+        return sorted(groups.items())
+
+
+def read_index(filename, store):
+    '''
+    Return the orders saved in an index file, or None if there is none, or it
+    is not for the records of store.
+    '''
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'rb') as indexFile:
+        state = cPickle.load(indexFile)
+    if state.get('version') != INDEX_VERSION or \
+            state['runId'] != store.runId or \
+            state['size'] != len(store.map) or state['count'] != len(store):
+        return None
+    orders = {}
+    for name, data in state['orders'].iteritems():
+        orders[name] = array.array('L')
+        orders[name].fromstring(data)
+    return orders
+
+
+def write_index(filename, store, orders):
+    '''
+    Save the orders of an index of the records of store to an index file.
+    '''
+    state = {'version': INDEX_VERSION, 'runId': store.runId,
+             'size': len(store.map), 'count': len(store),
+             'orders': dict((name, order.tostring())
+                            for name, order in orders.iteritems())}
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'wb') as indexFile:
+        cPickle.dump(state, indexFile, cPickle.HIGHEST_PROTOCOL)
+    os.rename(tmpname, filename)
+
+
+def describe(store, k, maps=False):
+    '''
+    Return a line describing record k of a store, followed by its mappings
+    if maps is True.
+    '''
+    idnum, m1, m2, epm1, epm2, djnum, comnum = store[k]
+    cv = store.table.codomainVertices
+    dv = store.table.domainVertices
+    line = "record {}: pair {} disjointness {} commutativity {} " \
+           "basepoints {} {} epm1 {} epm2 {}".format(
+               k, idnum, djnum, comnum, cv[ord(m1[0])], cv[ord(m2[0])],
+               [dv[c] for c in bytearray(epm1)],
+               [dv[c] for c in bytearray(epm2)])
+    if maps:
+        map1, map2 = store.pair(k)
+        line += "\n\tmap1:{}\n\tmap2:{}".format(map1, map2)
+    return line
+
+
+def parse_range(text):
+    '''
+    Parse a range of integers from the command line: "2" is 2 only, "2:"
+    2 and up, ":3" up to 3 and "1:3" 1 to 3.
+    '''
+    if ':' not in text:
+        return int(text), int(text)
+    low, high = text.split(':', 1)
+    return (int(low) if low else None, int(high) if high else None)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Query the pairs in a result file")
+    parser.add_argument('resultfile')
+    parser.add_argument('--disjointness', type=parse_range, metavar='LOW:HIGH',
+                        help="range of disjointness numbers")
+    parser.add_argument('--commutativity', type=parse_range,
+                        metavar='LOW:HIGH',
+                        help="range of commutativity numbers")
+    parser.add_argument('--minimal', choices=sorted(KEYS),
+                        help="keep only the pairs with the smallest key")
+    parser.add_argument('--top', type=int, metavar='K',
+                        help="keep the K pairs with the smallest key of --by")
+    parser.add_argument('--by', choices=sorted(KEYS), default='commutativity')
+    parser.add_argument('--largest', action='store_true',
+                        help="--top takes the largest keys instead")
+    parser.add_argument('--group', choices=sorted(KEYS),
+                        help="group the pairs by a key")
+    parser.add_argument('--count', action='store_true',
+                        help="print only the number of pairs")
+    parser.add_argument('--maps', action='store_true',
+                        help="print the mappings of every pair")
+    args = parser.parse_args(argv)
+
+    store = ResultStore(args.resultfile)
+    index = ResultIndex(store, args.resultfile + '.idx')
+    ranges = {}
+    if args.disjointness:
+        ranges['disjointness'] = args.disjointness
+    if args.commutativity:
+        ranges['commutativity'] = args.commutativity
+    if ranges or args.minimal or args.top is None:
+        records = index.query(ranges)
+    else:
+        records = None
+    if args.minimal:
+        records = index.minimal(args.minimal, records)
+    if args.top is not None:
+        records = index.top(args.by, args.top, records, args.largest)
+    if args.count:
+        print len(records)
+    elif args.group:
+        for key, group in index.group(args.group, records):
+            print "{} {}: {} pairs".format(args.group, key, len(group))
+            for k in group:
+                print "\t" + describe(store, k, args.maps)
+    else:
+        for k in records:
+            print describe(store, k, args.maps)
+    store.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
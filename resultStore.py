@@ -0,0 +1,194 @@
+'''
+resultStore.py - Append-only binary file of the pairs reported in a run.
+
+The log file lists every reported pair as text, which is slow to search in a
+large run. The master also appends every reported pair to a result file as a
+fixed size record, in the encoded form of vertexTable.py:
+
+    pair id         8 byte integer
+    m1, m2          domainSize bytes each, encoded mappings
+    epm1, epm2      T bytes each, domain codes of the endpoint maps
+    disjointness    2 byte integer
+    commutativity   2 byte integer
+
+all little-endian and unaligned, after a 48 byte header giving the format
+version, N, M, T, the record size and a random 16 byte id of the run. A file
+only ever holds the records of one run: a writer only appends to a file with
+its own run id, which a run resumed from a checkpoint keeps. A record cut
+short by a crash is ignored by the reader, and dropped when the file is next
+opened for writing.
+
+ResultStore maps a result file into memory. Records can be read one at a
+time, or, if NumPy is installed, viewed as a structured array for filtering
+and aggregation without copying the file.
+'''
+import os
+import mmap
+import uuid
+import struct
+from itertools import chain
+from vertexTable import VertexTable, defaultTable
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# file signature, and version of the record layout
+MAGIC = 'TRIODRES'
+VERSION = 2
+# signature, version, N, M, T, domainSize, record size and run id
+HEADER = struct.Struct('<8s6I16s')
+
+
+def record_format(table):
+    '''
+    Return the struct format of a record for the mappings of a VertexTable,
+    without the byte order.
+    '''
+    L = table.domainSize
+    T = table.T
+    return 'q{}s{}s{}s{}shh'.format(L, L, T, T)
+
+
+class ResultWriter(object):
+    '''
+    Appends the reports of workers to a result file, creating it if needed.
+    Records are buffered by the file object, and are only sure to be in the
+    file after flush or close.
+
+    runId is the id of the run the records are from, a new one by default.
+    An existing file is only appended to if it has the same run id, and the
+    same N, M and T.
+    '''
+    def __init__(self, filename, table=defaultTable, runId=None):
+        self.table = table
+        self.format = record_format(table)
+        self.record = struct.Struct('<' + self.format)
+        if runId is None:
+            runId = uuid.uuid4().bytes
+        self.runId = runId
+        header = HEADER.pack(MAGIC, VERSION, table.N, table.M, table.T,
+                             table.domainSize, self.record.size, runId)
+        size = os.path.getsize(filename) if os.path.exists(filename) else 0
+        if size:
+            with open(filename, 'rb') as resultFile:
+                found = resultFile.read(HEADER.size)
+            if found[:-16] != header[:-16]:
+                raise ValueError("{} is not a result file for this run"
+                                 .format(filename))
+            if found != header:
+                raise ValueError("{} holds the results of another run"
+                                 .format(filename))
+            # drop a record cut short
+            whole = (size - HEADER.size) // self.record.size
+            size = HEADER.size + whole * self.record.size
+        self.file = open(filename, 'r+b' if size else 'wb', 1 << 20)
+        if size:
+            self.file.truncate(size)
+            self.file.seek(size)
+        else:
+            self.file.write(header)
+
+    def addBatch(self, message):
+        '''
+        Append the reports of a ReportBatchMessage.
+        '''
+        epm1 = str(bytearray(message.epm1))
+        epm2 = str(bytearray(message.epm2))
+        n = len(message.reports)
+        self.file.write(struct.pack(
+            '<' + self.format * n, *chain.from_iterable(
+                (message.idnum, m1, m2, epm1, epm2, djnum, comnum)
+                for m1, m2, djnum, comnum in message.reports)))
+
+    def addPair(self, message):
+        '''
+        Append the pair of a ReportPairMessage.
+        '''
+        t = self.table
+        pair = message.pair
+        self.file.write(self.record.pack(
+            pair.idnum, str(t.encodeMapping(pair[0])),
+            str(t.encodeMapping(pair[1])),
+            str(bytearray(t.encodeEndpointMap(pair[0].endpointMap))),
+            str(bytearray(t.encodeEndpointMap(pair[1].endpointMap))),
+            message.disjointnessNumber, message.commutativityNumber))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ResultStore(object):
+    '''
+    Read-only view of a result file, mapped into memory. Records are
+    (pair id, m1, m2, epm1, epm2, disjointness number, commutativity number)
+    with the mappings and endpoint maps as encoded strings. runId is the id
+    of the run which wrote them.
+    '''
+    def __init__(self, filename):
+        with open(filename, 'rb') as resultFile:
+            self.map = mmap.mmap(resultFile.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        magic, version, n, m, t, L, size, self.runId = \
+            HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError("{} is not a result file".format(filename))
+        if version != VERSION:
+            raise ValueError("Unknown result file version: {}".format(
+                version))
+        self.table = VertexTable(n, m, t)
+        self.record = struct.Struct('<' + record_format(self.table))
+        if size != self.record.size:
+            raise ValueError("Bad record size in {}".format(filename))
+        self.count = (len(self.map) - HEADER.size) // size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, k):
+        if k < 0:
+            k += self.count
+        if not 0 <= k < self.count:
+            raise IndexError("Record index out of range")
+        return self.record.unpack_from(self.map,
+                                       HEADER.size + k * self.record.size)
+
+    def __iter__(self):
+        for k in xrange(self.count):
+            yield self[k]
+
+    def pair(self, k):
+        '''
+        Return the Mappings of record k, with their endpoint maps.
+        '''
+        idnum, m1, m2, epm1, epm2, djnum, comnum = self[k]
+        t = self.table
+        return (t.decodeMapping(bytearray(m1), bytearray(epm1)),
+                t.decodeMapping(bytearray(m2), bytearray(epm2)))
+
+    def dtype(self):
+        '''
+        Return the NumPy dtype of a record.
+        '''
+        L = self.table.domainSize
+        T = self.table.T
+        return numpy.dtype([('idnum', '<i8'), ('m1', 'u1', (L,)),
+                            ('m2', 'u1', (L,)), ('epm1', 'u1', (T,)),
+                            ('epm2', 'u1', (T,)), ('disjointness', '<i2'),
+                            ('commutativity', '<i2')])
+
+    def array(self):
+        '''
+        Return the records as a read-only NumPy structured array sharing the
+        memory of the file.
+        '''
+        if numpy is None:
+            raise ImportError("ResultStore.array needs NumPy")
+        return numpy.frombuffer(self.map, self.dtype(), self.count,
+                                HEADER.size)
+
+    def close(self):
+        self.map.close()
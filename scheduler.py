@@ -0,0 +1,467 @@
+'''
+scheduler.py - Bookkeeping of the work the master hands out to workers.
+
+The master assigns pairs from a pair iterator to workers. With work stealing,
+a pair can also be split while a worker processes it: the worker gives away
+some of the halves of the pair which it has not started (see
+FactorizedPairEngine), and those are assigned to an idle worker as a piece of
+the pair. The counts of all pieces of a pair are merged, and the pair is only
+counted as done once every piece is.
+
+Every worker has a queue of assignments: the one it is working on, and up to
+depth - 1 more which it starts as soon as it is done, without waiting for
+the master. Work queued but not started can be given back by the worker, so
+that it can be assigned to an idle worker instead.
+
+With chunking, an assignment can be a chunk of several pairs, sized from the
+time the worker took per pair so far so that it takes about chunkTime
+seconds. As in guided self-scheduling, chunks are also kept below a share of
+the pairs left, so they shrink towards the end of the run. Chunks are not
+split; pieces of split pairs are always given out on their own.
+
+PairScheduler does no communication itself; main_master in overseer.py sends
+the messages it asks for.
+
+In hierarchical mode, group leaders run a PairScheduler for the workers of
+their group, fed with the blocks of pairs the root gives them, and keep the
+counts of every block in a Block until it can be reported back whole.
+
+The state of a PairScheduler can be saved to a checkpoint file and restored
+in a new run. Pairs are taken from the pair iterator in order, so the state
+is small: the number of pairs taken, the counts, and the work given out but
+not finished. A restored run gives out that work again before any new pair.
+The number of reports the master had already received of every pair of that
+work is saved with it, and as many of the reports of the pair are dropped
+when it is done again, so that no pair is reported twice.
+'''
+import os
+import time
+import cPickle
+from math import ceil
+from itertools import chain
+from message import DonePairMesage, DoneChunkMessage
+
+# version of the checkpoint file format
+CHECKPOINT_VERSION = 2
+
+
+class Assignment(object):
+    '''
+    Work given to a worker: a pair, and the indices of the halves of it to
+    process, or None for the whole pair. serial identifies the assignment, so
+    that replies to steal requests can be matched to it.
+
+    A chunk of several pairs is given as a list of pairs, and is always
+    processed whole.
+
+    reported holds the number of reports of every pair of the assignment
+    the master has written out, and skip the number of its next reports to
+    drop because they were written out before a restored checkpoint.
+    '''
+    pairs = None
+    halves = None
+    serial = 0
+    reported = None
+    skip = None
+
+    def __init__(self, pair, halves=None, serial=0):
+        if isinstance(pair, list):
+            self.pairs = pair
+        else:
+            self.pairs = [pair]
+        self.halves = halves
+        self.serial = serial
+        self.reported = {}
+        self.skip = {}
+
+    @property
+    def pair(self):
+        '''
+        The pair of an assignment of a single pair.
+        '''
+        return self.pairs[0]
+
+    def __str__(self):
+        if len(self.pairs) > 1:
+            return "pairs {}".format([p.idnum for p in self.pairs])
+        if self.halves is None:
+            return "pair {}".format(self.pair.idnum)
+        return "pair {} halves {}".format(self.pair.idnum, self.halves)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class PairScheduler(object):
+    '''
+    Keeps track of the assignment of every worker, the pieces of split pairs
+    waiting for a worker and the run counts.
+
+    In canonical mode, pairsCovered, totalCompletions and completionsPassed
+    are weighted by orbit size, so that they count every pair.
+    '''
+    pairgen = None
+    stealing = False
+    exhausted = False
+    serial = 0
+
+    depth = 1
+    chunkTime = 0
+    maxChunk = 1
+    total = None
+    workers = 1
+    lastId = 0
+
+    def __init__(self, pairgen, stealing=False, depth=1, chunkTime=0,
+                 maxChunk=1, total=None, workers=1):
+        '''
+        Without chunkTime, every assignment is a single pair. Otherwise
+        chunks of up to maxChunk pairs are given out. total is the number of
+        pair ids, used to estimate the pairs left, and workers the number of
+        workers.
+        '''
+        self.pairgen = pairgen
+        self.stealing = stealing
+        self.depth = depth
+        self.chunkTime = chunkTime
+        self.maxChunk = maxChunk
+        self.total = total
+        self.workers = workers
+        # time every busy worker started its current assignment, and the
+        # average time per pair of its past assignments
+        self.started = {}
+        self.pairTime = {}
+        # queue of Assignments of every busy worker, the first in progress
+        self.assigned = {}
+        # pieces of split pairs waiting for a worker
+        self.pieces = []
+        # number of unfinished pieces of every pair in progress, by id
+        self.unfinished = {}
+        # workers with nothing to do while waiting for pieces
+        self.idle = []
+        # busy workers with a steal request outstanding, and those which
+        # refused one for their current assignment
+        self.asked = set()
+        self.refused = set()
+        self.counts = {'pairsSent': 0, 'pairsDone': 0, 'pairsCovered': 0,
+                       'totalCompletions': 0, 'completionsPassed': 0,
+                       'piecesSplit': 0}
+
+    def nextWork(self, worker):
+        '''
+        Queue and return the next Assignment for a worker, or None if there
+        is no work left to give out. With work stealing, a worker left
+        without work becomes idle.
+        '''
+        if self.pieces:
+            work = self.pieces.pop(0)
+        else:
+            work = None
+            pairs = []
+            size = self.chunkSize(worker)
+            while len(pairs) < size and not self.exhausted:
+                try:
+                    pairs.append(self.pairgen.next())
+                except StopIteration:
+                    self.exhausted = True
+            for pair in pairs:
+                self.counts['pairsSent'] += 1
+                self.unfinished[pair.idnum] = 1
+                self.lastId = pair.idnum
+            if pairs:
+                work = Assignment(pairs if len(pairs) > 1 else pairs[0])
+        if work is None:
+            if self.stealing and worker not in self.assigned and \
+                    worker not in self.idle:
+                self.idle.append(worker)
+            return None
+        self.serial += 1
+        work.serial = self.serial
+        if worker not in self.assigned:
+            self.assigned[worker] = []
+            self.refused.discard(worker)
+            self.started[worker] = time.time()
+        self.assigned[worker].append(work)
+        return work
+
+    def feed(self, pairs):
+        '''
+        Give out pairs after those left in the pair iterator, which may
+        already have run out.
+        '''
+        if self.exhausted:
+            self.pairgen = iter(pairs)
+            self.exhausted = False
+        else:
+            self.pairgen = chain(self.pairgen, pairs)
+
+    def addPiece(self, pair, halves, reported=0):
+        '''
+        Queue the given halves of a pair, not taken from the pair iterator,
+        to be given out first. The first reported reports of the piece are
+        dropped, as they have already been written out.
+        '''
+        piece = Assignment(pair, halves)
+        if reported:
+            piece.reported[pair.idnum] = reported
+            piece.skip[pair.idnum] = reported
+        self.pieces.append(piece)
+        self.unfinished[pair.idnum] = self.unfinished.get(pair.idnum, 0) + 1
+
+    def chunkSize(self, worker):
+        '''
+        Return the number of pairs to give a worker in its next assignment.
+        '''
+        if not self.chunkTime or worker not in self.pairTime:
+            return 1
+        size = self.chunkTime / max(self.pairTime[worker], 1e-6)
+        if self.total and self.lastId:
+            left = (self.total - self.lastId) * \
+                self.counts['pairsSent'] / float(self.lastId)
+            size = min(size, ceil(left / (2 * self.workers)))
+        return int(max(1, min(size, self.maxChunk)))
+
+    def wanted(self, worker):
+        '''
+        Return the number of assignments needed to fill the queue of a
+        worker.
+        '''
+        return self.depth - len(self.assigned.get(worker, ()))
+
+    def done(self, worker, reply):
+        '''
+        Merge the counts of a DonePairMesage, or DoneChunkMessage, from a
+        worker, and return the Assignment it finished, the first in its
+        queue.
+        '''
+        queue = self.assigned[worker]
+        work = queue.pop(0)
+        if not queue:
+            del self.assigned[worker]
+        self.asked.discard(worker)
+        self.refused.discard(worker)
+        now = time.time()
+        pairTime = (now - self.started[worker]) / len(work.pairs)
+        if worker in self.pairTime:
+            pairTime = (pairTime + self.pairTime[worker]) / 2
+        self.pairTime[worker] = pairTime
+        self.started[worker] = now
+        if isinstance(reply, DoneChunkMessage):
+            replies = reply.replies
+        else:
+            replies = [reply]
+        for pair, pairReply in zip(work.pairs, replies):
+            idnum = pair.idnum
+            self.unfinished[idnum] -= 1
+            pairFinished = self.unfinished[idnum] == 0
+            if pairFinished:
+                del self.unfinished[idnum]
+            count_pair(self.counts, pairReply, pair.orbitSize, pairFinished)
+        return work
+
+    def reported(self, worker, idnum, n):
+        '''
+        Record n reports of the pair idnum from the assignment a worker is
+        working on. Returns the number of them, from the first, which were
+        already written out before the checkpoint the run was restored from,
+        and are to be dropped.
+        '''
+        work = self.assigned[worker][0]
+        skip = min(work.skip.get(idnum, 0), n)
+        if skip:
+            work.skip[idnum] -= skip
+        work.reported[idnum] = work.reported.get(idnum, 0) + n - skip
+        return skip
+
+    def split(self, worker, serial, given, kept):
+        '''
+        Record the reply of a worker to a steal request: the halves it gave
+        away and those it kept. Returns the new piece, or None if the worker
+        gave nothing away or the reply is for an earlier assignment.
+        '''
+        queue = self.assigned.get(worker)
+        if not queue or queue[0].serial != serial:
+            return None
+        work = queue[0]
+        self.asked.discard(worker)
+        if not given:
+            self.refused.add(worker)
+            return None
+        work.halves = list(kept)
+        piece = Assignment(work.pair, list(given))
+        self.pieces.append(piece)
+        self.unfinished[work.pair.idnum] += 1
+        self.counts['piecesSplit'] += 1
+        return piece
+
+    def returned(self, worker, serials):
+        '''
+        Take back the queued assignments a worker gave back, and put them
+        first in line for other workers.
+        '''
+        self.asked.discard(worker)
+        queue = self.assigned.get(worker, [])
+        back = [work for work in queue if work.serial in serials]
+        queue[:] = [work for work in queue if work.serial not in serials]
+        if not queue:
+            self.assigned.pop(worker, None)
+        self.pieces[0:0] = back
+        return back
+
+    def assignIdle(self):
+        '''
+        Return a list of (worker, Assignment) for idle workers which can be
+        given a waiting piece.
+        '''
+        assignments = []
+        while self.idle and self.pieces:
+            worker = self.idle.pop(0)
+            assignments.append((worker, self.nextWork(worker)))
+        return assignments
+
+    def stealRequests(self):
+        '''
+        Return a list of (worker, serial) of busy workers to ask for part of
+        their work, one for every idle worker which cannot otherwise be given
+        work. Workers with queued work are asked first, as they can give it
+        back whole, then those with the oldest assignments.
+        '''
+        if not self.stealing or not self.exhausted or self.pieces:
+            return []
+        wanted = len(self.idle) - len(self.asked)
+        candidates = sorted((-len(queue), queue[0].serial, worker)
+                            for worker, queue in self.assigned.iteritems()
+                            if worker not in self.asked and
+                            worker not in self.refused)
+        requests = []
+        for n, serial, worker in candidates[:max(wanted, 0)]:
+            self.asked.add(worker)
+            requests.append((worker, serial))
+        return requests
+
+    def finished(self):
+        '''
+        Return True once every pair has been given out and processed.
+        '''
+        return self.exhausted and not self.pieces and not self.assigned
+
+    def checkpoint(self):
+        '''
+        Return the state of the run as a dictionary of plain values. Work in
+        progress is listed as (pair id, orbit size, halves, reports written
+        out), and its counts are not included, so it has to be processed
+        again on restore.
+        '''
+        work = sorted((w for queue in self.assigned.itervalues()
+                       for w in queue), key=lambda w: w.serial)
+        work += self.pieces
+        return {'version': CHECKPOINT_VERSION,
+                'counts': dict(self.counts),
+                'work': [(p.idnum, p.orbitSize, w.halves,
+                          w.reported.get(p.idnum, 0))
+                         for w in work for p in w.pairs]}
+
+    def restore(self, state, pair):
+        '''
+        Continue a run from a state returned by checkpoint. The pair
+        iterator given to the scheduler must already be past the
+        state['counts']['pairsSent'] pairs taken before, and pair is a
+        function returning the pair with a given id. The unfinished work is
+        queued to be given out first.
+        '''
+        if state.get('version') != CHECKPOINT_VERSION:
+            raise ValueError("Unknown checkpoint version: {}".format(
+                state.get('version')))
+        self.counts.update(state['counts'])
+        pairs = {}
+        for idnum, orbitSize, halves, reported in state['work']:
+            if idnum not in pairs:
+                pairs[idnum] = pair(idnum)
+                pairs[idnum].orbitSize = orbitSize
+            self.addPiece(pairs[idnum], halves, reported)
+
+
+class Block(object):
+    '''
+    Work a group leader was given by the root, as one assignment: pairs,
+    or the halves of one pair, and the counts, and StageStats if the
+    workers send them, merged from every piece of them done in the group.
+    chunk tells whether the root sent a chunk, and expects a
+    DoneChunkMessage back.
+    '''
+    def __init__(self, pairs, chunk):
+        self.pairs = pairs
+        self.chunk = chunk
+        self.totals = [0] * len(pairs)
+        self.failures = [0] * len(pairs)
+        self.stats = [None] * len(pairs)
+        # unfinished pieces of every pair
+        self.left = [1] * len(pairs)
+
+    def count(self, k, reply):
+        '''
+        Merge the counts of a DonePairMesage for a piece of pair k.
+        '''
+        self.totals[k] += reply.countTotal
+        self.failures[k] += reply.countFailures
+        self.left[k] -= 1
+        if reply.stats is not None:
+            if self.stats[k] is None:
+                self.stats[k] = reply.stats.copy()
+            else:
+                self.stats[k].add(reply.stats)
+
+    def finished(self):
+        '''
+        Return True once every piece of every pair is done.
+        '''
+        return not any(self.left)
+
+    def reply(self, rank):
+        '''
+        Return the message reporting the counts of the block to the root.
+        '''
+        replies = [DonePairMesage(rank, total, failures, stats)
+                   for total, failures, stats in zip(self.totals,
+                                                     self.failures,
+                                                     self.stats)]
+        if self.chunk:
+            return DoneChunkMessage(rank, replies)
+        return replies[0]
+
+
+def write_checkpoint(filename, state):
+    '''
+    Write a checkpoint state to a file. The file is replaced atomically, so
+    a run killed while writing leaves the previous checkpoint intact.
+    '''
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'wb') as out:
+        cPickle.dump(state, out, cPickle.HIGHEST_PROTOCOL)
+        out.flush()
+        os.fsync(out.fileno())
+    os.rename(tmpname, filename)
+
+
+def read_checkpoint(filename):
+    '''
+    Return the state saved in a checkpoint file, or None if there is none.
+    '''
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'rb') as checkpointFile:
+        return cPickle.load(checkpointFile)
+
+
+def count_pair(counts, reply, weight, pairFinished=True):
+    '''
+    Add the counts of a DonePairMesage for a pair standing for weight pairs
+    to the run totals. If the reply is for a piece of a pair, pairFinished
+    tells whether it was the last piece.
+    '''
+    if pairFinished:
+        counts['pairsDone'] += 1
+        counts['pairsCovered'] += weight
+    counts['totalCompletions'] += reply.countTotal * weight
+    counts['completionsPassed'] += \
+        (reply.countTotal - reply.countFailures) * weight
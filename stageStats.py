@@ -0,0 +1,145 @@
+'''
+stageStats.py - Counters and timers of the stages a worker goes through on a
+pair.
+
+A worker processes a pair in stages: the engine is set up (leg completions,
+and for the factorized engine the disjointness checks of leg pairs), pairs
+of half completions are checked for disjointness and pruned, the pairs of
+full completions below the disjoint ones are checked, and every disjoint
+pair found is checked for commutativity and reported. With STAGE_STATS set
+in config.py, worker_processPair keeps a StageStats of the pair, which is
+sent in its status and done messages, and the master adds up those of every
+pair of the run.
+
+Counters:
+    pairs           pairs, or pieces of pairs, processed
+    halfChecked     pairs of half completions checked for disjointness
+    halfPruned      those which were not disjoint, and not completed further
+    fullChecked     pairs of full completions checked for disjointness
+    fullPassed      those which were disjoint, and were reported
+Timers, in seconds:
+    engine          setting up the pair engine
+    enumerate       generating the disjoint pairs of full completions, which
+                    includes the disjointness checks of the joint engine
+    commutativity   checkCommutativityEncoded
+    messaging       status reports, polling the master and sending reports
+nodes holds the number of pairs of vertex images tried at every depth of the
+search of the joint engine, and is all 0 for the others.
+'''
+import time
+from vertexTable import defaultTable
+
+# names of the counters and timers, in the order they are encoded
+COUNTERS = ('pairs', 'halfChecked', 'halfPruned', 'fullChecked',
+            'fullPassed')
+TIMERS = ('engine', 'enumerate', 'commutativity', 'messaging')
+
+
+class StageStats(object):
+    '''
+    Counters and timers of the stages of the work on one or more pairs, and
+    the nodes visited per depth, for the mappings of a VertexTable.
+    '''
+    def __init__(self, table=defaultTable):
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.times = dict.fromkeys(TIMERS, 0.0)
+        # one depth per domain vertex other than the branch point
+        self.nodes = [0] * (table.domainSize - 1)
+        self.last = time.time()
+
+    def lap(self, name):
+        '''
+        Add the time since the last lap, or since the stats were made, to
+        the timer name.
+        '''
+        now = time.time()
+        self.times[name] += now - self.last
+        self.last = now
+
+    def withEngine(self, engine):
+        '''
+        Return a copy of the stats with the counts of a pair engine so far
+        added, as one more pair.
+        '''
+        stats = self.copy()
+        counts = stats.counts
+        counts['pairs'] += 1
+        counts['halfChecked'] += engine.halfFailures + engine.halfPassed
+        counts['halfPruned'] += engine.halfFailures
+        counts['fullChecked'] += engine.countTotal - engine.halfFailures
+        counts['fullPassed'] += engine.countTotal - engine.countFailures
+        for depth, n in enumerate(getattr(engine, 'depthVisits', ())):
+            stats.nodes[depth] += n
+        return stats
+
+    def add(self, other):
+        '''
+        Add the counters, timers and nodes of other to these.
+        '''
+        for name in COUNTERS:
+            self.counts[name] += other.counts[name]
+        for name in TIMERS:
+            self.times[name] += other.times[name]
+        for depth, n in enumerate(other.nodes):
+            self.nodes[depth] += n
+
+    def copy(self):
+        stats = StageStats.__new__(StageStats)
+        stats.counts = dict(self.counts)
+        stats.times = dict(self.times)
+        stats.nodes = list(self.nodes)
+        stats.last = self.last
+        return stats
+
+    def values(self):
+        '''
+        Return the counters, timers and nodes as one tuple, in the order of
+        COUNTERS and TIMERS.
+        '''
+        return tuple([self.counts[name] for name in COUNTERS] +
+                     [self.times[name] for name in TIMERS] + self.nodes)
+
+    @staticmethod
+    def fromValues(values):
+        '''
+        Return the StageStats of a tuple returned by values.
+        '''
+        stats = StageStats.__new__(StageStats)
+        c = len(COUNTERS)
+        t = len(TIMERS)
+        stats.counts = dict(zip(COUNTERS, values[:c]))
+        stats.times = dict(zip(TIMERS, values[c:c + t]))
+        stats.nodes = list(values[c + t:])
+        stats.last = time.time()
+        return stats
+
+    def pruneRate(self):
+        '''
+        Return the fraction of the pairs of half completions pruned.
+        '''
+        checked = self.counts['halfChecked']
+        return self.counts['halfPruned'] / float(checked) if checked else 0.0
+
+    def __eq__(self, other):
+        return isinstance(other, StageStats) and \
+            self.values() == other.values()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __str__(self):
+        counts = self.counts
+        times = self.times
+        total = sum(times.values())
+        lines = ["pairs:{} half checked:{} pruned:{} ({:.1%}) full checked:{}"
+                 " passed:{}".format(counts['pairs'], counts['halfChecked'],
+                                     counts['halfPruned'], self.pruneRate(),
+                                     counts['fullChecked'],
+                                     counts['fullPassed']),
+                 "time: " + " ".join(
+                     "{}:{:.3f}s ({:.1%})".format(
+                         name, times[name], times[name] / total if total
+                         else 0.0) for name in TIMERS)]
+        if any(self.nodes):
+            lines.append("nodes per depth: {}".format(self.nodes))
+        return "\n\t".join(lines)
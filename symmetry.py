@@ -0,0 +1,172 @@
+'''
+symmetry.py - Arm permutation symmetries of mappings and mapping pairs.
+
+A permutation g of the arms acts on a mapping f by conjugation: the arms of
+both the domain and the codomain are relabelled, giving g.f.g^-1. The
+endpoint map is relabelled in the same way, so the domain vertex which maps
+to codomain endpoint g(i) is the image under g of the one which mapped to
+endpoint i.
+
+Conjugation preserves everything the workers compute for a pair: surjective
+completions, disjointness numbers and commutativity numbers. It also maps
+the pairs generated by EndpointEmptyMappingPairIterator onto themselves.
+(Permuting only the domain arms preserves the measures as well, but not the
+set of generated pairs, since EndpointEmptyMappingIterator compares endpoint
+map entries against the basepoint image.)
+
+The canonical representative of a pair is the member of its orbit with the
+smallest key, where the key of a mapping is its encoded form and the key of
+a pair is the sorted tuple of the keys of its two mappings.
+'''
+from itertools import permutations
+from vertexTable import defaultTable
+
+
+class ArmPermutation(object):
+    '''
+    A permutation of the arms, acting on encoded mappings by conjugation.
+    perm[a] is the arm that arm a is sent to.
+    '''
+    def __init__(self, perm, table=None):
+        if table is None:
+            table = defaultTable
+        if sorted(perm) != range(table.T):
+            raise ValueError("perm must be a permutation of range(T)")
+        self.perm = tuple(perm)
+        self.table = table
+        # code -> code of the image vertex
+        self.domainCodes = tuple(
+            table.domainCode(perm[table.domainArm[c]], table.domainDist[c])
+            for c in range(table.domainSize))
+        self.codomainCodes = tuple(
+            table.codomainCode(perm[table.codomainArm[c]],
+                               table.codomainDist[c])
+            for c in range(table.codomainSize))
+
+    def __str__(self):
+        return "g" + str(self.perm)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def isIdentity(self):
+        return self.perm == tuple(range(len(self.perm)))
+
+    def applyEncoded(self, buf, endpointMap=None):
+        '''
+        Return the conjugate of an encoded mapping, and of its endpoint map
+        (a sequence of domain codes) if given.
+        '''
+        image = bytearray(buf)
+        for c in range(self.table.domainSize):
+            image[self.domainCodes[c]] = self.codomainCodes[buf[c]] \
+                if buf[c] < self.table.codomainSize else buf[c]
+        if endpointMap is None:
+            return image, None
+        epm = [None] * len(endpointMap)
+        for i, c in enumerate(endpointMap):
+            epm[self.perm[i]] = self.domainCodes[c]
+        return image, tuple(epm)
+
+    def applyMapping(self, mapping):
+        '''
+        Return the conjugate of a Mapping, including its endpoint map.
+        '''
+        table = self.table
+        epm = None
+        if len(mapping.endpointMap) == table.T:
+            epm = table.encodeEndpointMap(mapping.endpointMap)
+        buf, epm = self.applyEncoded(table.encodeMapping(mapping), epm)
+        return table.decodeMapping(buf, epm)
+
+
+def armPermutations(table=None):
+    '''
+    Return every ArmPermutation, starting with the identity.
+    '''
+    if table is None:
+        table = defaultTable
+    return [ArmPermutation(p, table) for p in permutations(range(table.T))]
+
+
+def mappingKey(buf, endpointMap):
+    '''
+    Return a hashable, ordered key for an encoded mapping and endpoint map.
+    '''
+    return (bytes(buf), tuple(endpointMap) if endpointMap else ())
+
+
+def mappingImageKeys(mapping, group, table=None):
+    '''
+    Return the list of keys of the images of a Mapping under every element
+    of the group, in the order of the group.
+    '''
+    if table is None:
+        table = defaultTable
+    buf = table.encodeMapping(mapping)
+    epm = table.encodeEndpointMap(mapping.endpointMap)
+    return [mappingKey(*g.applyEncoded(buf, epm)) for g in group]
+
+
+def pairOrbit(keys1, keys2):
+    '''
+    Return the set of keys of the members of the orbit of an unordered pair,
+    given the image keys of both of its mappings.
+    '''
+    return set(min(k1, k2) + max(k1, k2) for k1, k2 in zip(keys1, keys2))
+
+
+def canonicalPair(pair, group=None, table=None, cache=None):
+    '''
+    Return (isCanonical, orbitSize) for a MappingPair: whether it is the
+    canonical representative of its orbit, and the size of the orbit.
+
+    If cache is given, it is a dictionary used to remember the image keys of
+    mappings by their id.
+    '''
+    if group is None:
+        group = armPermutations(table)
+    keys = []
+    for mapping in pair:
+        if cache is None:
+            keys.append(mappingImageKeys(mapping, group, table))
+            continue
+        if mapping.id not in cache:
+            cache[mapping.id] = mappingImageKeys(mapping, group, table)
+        keys.append(cache[mapping.id])
+    orbit = pairOrbit(*keys)
+    # the identity comes first in the group
+    key1 = keys[0][0]
+    key2 = keys[1][0]
+    return min(key1, key2) + max(key1, key2) == min(orbit), len(orbit)
+
+
+def burnsideOrbitCount(pairs, group=None, table=None):
+    '''
+    Count the orbits of an iterable of MappingPairs, closed under the group
+    and with mapping ids as given by EndpointEmptyMappingIterator, with
+    Burnside's lemma: the number of orbits is the average number of
+    pairs fixed by an element of the group.
+
+    Used as a cross-check of the canonical pair iterator, which should emit
+    exactly this many pairs.
+    '''
+    if group is None:
+        group = armPermutations(table)
+    fixed = 0
+    cache = {}
+    for pair in pairs:
+        for mapping in pair:
+            if mapping.id not in cache:
+                cache[mapping.id] = mappingImageKeys(mapping, group, table)
+        keys1 = cache[pair[0].id]
+        keys2 = cache[pair[1].id]
+        key1 = keys1[0]
+        key2 = keys2[0]
+        for image1, image2 in zip(keys1, keys2):
+            # the pair is unordered, so g may also swap its two mappings
+            if (image1, image2) in ((key1, key2), (key2, key1)):
+                fixed += 1
+    if fixed % len(group):
+        raise ValueError("Pairs are not closed under the group")
+    return fixed // len(group)
@@ -0,0 +1,411 @@
+'''
+transport.py - Communication between the master and worker processes.
+
+The overseer loops only talk to a Transport, which sends and receives
+Message objects between ranks 0 to size - 1. There are three backends:
+
+    MPITransport - mpi4py, for cluster runs started with mpirun or sqsub.
+    QueueTransport - multiprocessing queues, for a single node. Use
+        run_processes to start the ranks as processes of one program.
+    TCPTransport - localhost sockets, for ranks started as separate
+        programs. Rank 0 listens, and every other rank connects to it, so
+        messages can only be sent between rank 0 and the other ranks, which
+        is all the overseer needs.
+
+Messages are pickled, or encoded with a WireFormat if one is given (see
+wireFormat.py). mpi4py is only imported by MPITransport, so the other
+backends work without an MPI install.
+'''
+import sys
+import time
+import socket
+import struct
+import cPickle
+import threading
+import multiprocessing
+import Queue
+from abc import ABCMeta, abstractmethod
+
+# source meaning any rank
+ANY_SOURCE = -1
+# kinds of traffic: messages of the overseer, and the collective operations
+MESSAGE, BARRIER, GATHER = range(3)
+
+
+class DoneRequest(object):
+    '''
+    Request of a send which completed before it was returned.
+    '''
+    def Test(self):
+        return True
+
+    def Wait(self):
+        pass
+
+
+class Transport(object):
+    '''
+    Sends and receives Messages between ranks. Abstract.
+    '''
+    __metaclass__ = ABCMeta
+
+    rank = 0
+    size = 1
+    wire = None
+    # whether every rank can send to every other rank, not only to rank 0
+    peerSends = True
+
+    @abstractmethod
+    def send(self, message, dest=0, block=True):
+        '''
+        Send a message to rank dest. If block is False, the send may still
+        be in progress when send returns, and a request with a Test method
+        is returned.
+        '''
+        pass
+
+    @abstractmethod
+    def recv(self, source=ANY_SOURCE):
+        '''
+        Receive the next message from rank source, or from any rank.
+        '''
+        pass
+
+    @abstractmethod
+    def probe(self, source=ANY_SOURCE):
+        '''
+        Return True if a message from rank source, or any rank, is waiting.
+        '''
+        pass
+
+    @abstractmethod
+    def barrier(self):
+        '''
+        Wait for every rank to reach the barrier.
+        '''
+        pass
+
+    @abstractmethod
+    def gather(self, obj, root=0):
+        '''
+        Return the list of the objects given by every rank on rank root,
+        and None on the others.
+        '''
+        pass
+
+    def waitall(self, requests):
+        '''
+        Wait for the requests of non-blocking sends to complete.
+        '''
+        for request in requests:
+            request.Wait()
+
+    def finalize(self):
+        '''
+        Shut the transport down.
+        '''
+        pass
+
+    def encode(self, message):
+        if self.wire is not None:
+            return str(self.wire.encode(message))
+        return cPickle.dumps(message, cPickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data):
+        if self.wire is not None:
+            return self.wire.decode(bytearray(data))
+        return cPickle.loads(data)
+
+
+class MPITransport(Transport):
+    '''
+    Transport over MPI.COMM_WORLD with mpi4py. Encoded messages are sent
+    with the buffer based Send and Recv, pickled ones with send and recv.
+    '''
+    def __init__(self, wire=None):
+        from mpi4py import MPI
+        self.MPI = MPI
+        self.comm = MPI.COMM_WORLD
+        self.rank = self.comm.Get_rank()
+        self.size = self.comm.Get_size()
+        self.wire = wire
+
+    def send(self, message, dest=0, block=True):
+        comm = self.comm
+        if self.wire is not None:
+            buf = [self.wire.encode(message), self.MPI.BYTE]
+            if not block:
+                return comm.Isend(buf, dest=dest)
+            comm.Send(buf, dest=dest)
+        elif not block:
+            return comm.isend(message, dest=dest)
+        else:
+            comm.send(message, dest=dest)
+
+    def recv(self, source=ANY_SOURCE):
+        MPI = self.MPI
+        if source == ANY_SOURCE:
+            source = MPI.ANY_SOURCE
+        if self.wire is not None:
+            status = MPI.Status()
+            self.comm.Probe(source=source, status=status)
+            buf = bytearray(status.Get_count(MPI.BYTE))
+            self.comm.Recv([buf, MPI.BYTE], source=status.Get_source())
+            return self.wire.decode(buf)
+        return self.comm.recv(source=source)
+
+    def probe(self, source=ANY_SOURCE):
+        if source == ANY_SOURCE:
+            source = self.MPI.ANY_SOURCE
+        return self.comm.Iprobe(source=source)
+
+    def barrier(self):
+        self.comm.Barrier()
+
+    def gather(self, obj, root=0):
+        return self.comm.gather(obj, root=root)
+
+    def waitall(self, requests):
+        self.MPI.Request.Waitall(requests)
+
+    def finalize(self):
+        self.MPI.Finalize()
+
+
+class LocalTransport(Transport):
+    '''
+    Base of the transports which deliver (source, kind, data) tuples to an
+    inbox. Messages received while waiting for another source or kind are
+    kept until asked for. Collective operations are done through rank 0.
+    '''
+    __metaclass__ = ABCMeta
+
+    def __init__(self, rank, size, wire=None):
+        self.rank = rank
+        self.size = size
+        self.wire = wire
+        self.pending = []
+
+    @abstractmethod
+    def _put(self, dest, item):
+        '''
+        Deliver item to the inbox of rank dest.
+        '''
+        pass
+
+    @abstractmethod
+    def _get(self, block):
+        '''
+        Return the next item of the inbox, or None if block is False and
+        there is none.
+        '''
+        pass
+
+    def _take(self, source, kind, block):
+        for k, item in enumerate(self.pending):
+            if item[1] == kind and source in (ANY_SOURCE, item[0]):
+                del self.pending[k]
+                return item
+        while True:
+            item = self._get(block)
+            if item is None:
+                return None
+            if item[1] == kind and source in (ANY_SOURCE, item[0]):
+                return item
+            self.pending.append(item)
+
+    def send(self, message, dest=0, block=True):
+        self._put(dest, (self.rank, MESSAGE, self.encode(message)))
+        if not block:
+            return DoneRequest()
+
+    def recv(self, source=ANY_SOURCE):
+        return self.decode(self._take(source, MESSAGE, True)[2])
+
+    def probe(self, source=ANY_SOURCE):
+        item = self._take(source, MESSAGE, False)
+        if item is None:
+            return False
+        self.pending.insert(0, item)
+        return True
+
+    def barrier(self):
+        if self.rank == 0:
+            for i in range(1, self.size):
+                self._take(ANY_SOURCE, BARRIER, True)
+            for i in range(1, self.size):
+                self._put(i, (0, BARRIER, ''))
+        else:
+            self._put(0, (self.rank, BARRIER, ''))
+            self._take(0, BARRIER, True)
+
+    def gather(self, obj, root=0):
+        if root != 0:
+            raise ValueError("Only rank 0 can gather")
+        if self.rank != 0:
+            self._put(0, (self.rank, GATHER, cPickle.dumps(obj, 2)))
+            return None
+        objs = [obj] + [None] * (self.size - 1)
+        for i in range(1, self.size):
+            source, kind, data = self._take(ANY_SOURCE, GATHER, True)
+            objs[source] = cPickle.loads(data)
+        return objs
+
+
+class QueueTransport(LocalTransport):
+    '''
+    Transport between processes of one node, with a multiprocessing queue
+    as the inbox of every rank.
+    '''
+    def __init__(self, rank, queues, wire=None):
+        LocalTransport.__init__(self, rank, len(queues), wire)
+        self.queues = queues
+
+    def _put(self, dest, item):
+        self.queues[dest].put(item)
+
+    def _get(self, block):
+        try:
+            return self.queues[self.rank].get(block)
+        except Queue.Empty:
+            return None
+
+
+class TCPTransport(LocalTransport):
+    '''
+    Transport over localhost TCP connections. Rank 0 listens on port and
+    every other rank connects to it, retrying for up to timeout seconds, so
+    only rank 0 can send to every rank. A thread per connection reads the
+    frames into the inbox.
+    '''
+    # frame header: length of the data, source rank and kind
+    header = struct.Struct('<Iib')
+    peerSends = False
+
+    def __init__(self, rank, size, port, wire=None, host='127.0.0.1',
+                 timeout=60):
+        LocalTransport.__init__(self, rank, size, wire)
+        self.inbox = Queue.Queue()
+        self.sockets = {}
+        self.locks = {}
+        if rank == 0:
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((host, port))
+            server.listen(size)
+            for i in range(1, size):
+                sock, address = server.accept()
+                peer, = struct.unpack('<i', self._read(sock, 4))
+                self._connect(peer, sock)
+            server.close()
+        else:
+            sock = self._dial(host, port, timeout)
+            sock.sendall(struct.pack('<i', rank))
+            self._connect(0, sock)
+
+    def _dial(self, host, port, timeout):
+        # rank 0 may not be listening yet
+        deadline = time.time() + timeout
+        while True:
+            try:
+                return socket.create_connection((host, port))
+            except socket.error:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def _connect(self, peer, sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sockets[peer] = sock
+        self.locks[peer] = threading.Lock()
+        reader = threading.Thread(target=self._reader, args=(sock,))
+        reader.daemon = True
+        reader.start()
+
+    def _read(self, sock, n):
+        chunks = []
+        while n:
+            chunk = sock.recv(n)
+            if not chunk:
+                raise EOFError("Connection closed")
+            chunks.append(chunk)
+            n -= len(chunk)
+        return ''.join(chunks)
+
+    def _reader(self, sock):
+        try:
+            while True:
+                n, source, kind = self.header.unpack(
+                    self._read(sock, self.header.size))
+                self.inbox.put((source, kind, self._read(sock, n)))
+        except (EOFError, socket.error):
+            return
+
+    def _put(self, dest, item):
+        if dest not in self.sockets:
+            raise ValueError("Ranks other than 0 can only send to rank 0")
+        source, kind, data = item
+        with self.locks[dest]:
+            self.sockets[dest].sendall(
+                self.header.pack(len(data), source, kind) + data)
+
+    def _get(self, block):
+        try:
+            return self.inbox.get(block)
+        except Queue.Empty:
+            return None
+
+    def finalize(self):
+        for sock in self.sockets.values():
+            sock.close()
+
+
+def run_processes(size, target, backend='multiprocessing', wire=None,
+                  port=0):
+    '''
+    Run target(transport) in size processes on this node, connected by
+    QueueTransports, or TCPTransports on localhost if backend is 'tcp'.
+    Rank 0 runs in the calling process. Returns the result of target on
+    rank 0 once every process has exited. If target raises on rank 0, the
+    other processes are terminated and the exception is raised again.
+    '''
+    if backend == 'tcp':
+        if not port:
+            port = free_port()
+        makeTransport = lambda r: TCPTransport(r, size, port, wire)
+    else:
+        queues = [multiprocessing.Queue() for i in range(size)]
+        makeTransport = lambda r: QueueTransport(r, queues, wire)
+
+    processes = [multiprocessing.Process(target=lambda r: target(
+                     makeTransport(r)), args=(r,))
+                 for r in range(1, size)]
+    for p in processes:
+        p.start()
+    try:
+        result = target(makeTransport(0))
+    except BaseException:
+        # the other ranks would wait for rank 0 forever
+        error = sys.exc_info()
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.join()
+        raise error[0], error[1], error[2]
+    for p in processes:
+        p.join()
+    failed = [p.exitcode for p in processes if p.exitcode != 0]
+    if failed:
+        raise RuntimeError("Worker processes failed: {}".format(failed))
+    return result
+
+
+def free_port():
+    '''
+    Return a free TCP port on localhost.
+    '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
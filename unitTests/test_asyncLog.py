@@ -0,0 +1,103 @@
+'''
+Tests for the log file written by a background thread.
+'''
+import unittest
+import os
+import time
+import tempfile
+import threading
+from asyncLog import AsyncLog
+
+
+class Test_asyncLog(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.filename = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def contents(self):
+        with open(self.filename) as logFile:
+            return logFile.read()
+
+    def test_flush(self):
+        '''
+        Lines should be in the file, in order, once flushed, even when the
+        queue fills up.
+        '''
+        log = AsyncLog(self.filename, echo=False, queueSize=5,
+                       flushInterval=60, batchSize=3)
+        lines = ["line {}\n".format(i) for i in range(100)]
+        for line in lines:
+            log.write(line)
+        log.flush()
+        self.assertEqual(self.contents(), ''.join(lines))
+        log.write("last\n")
+        log.close()
+        self.assertEqual(self.contents(), ''.join(lines) + "last\n")
+        # closing again does nothing
+        log.close()
+
+    def test_interval(self):
+        '''
+        Lines should be flushed by the writer within the flush interval.
+        '''
+        log = AsyncLog(self.filename, echo=False, flushInterval=0.01)
+        log.write("line\n")
+        log.thread.join(0.2)
+        self.assertEqual(self.contents(), "line\n")
+        log.close()
+
+    def test_flushDuringTimeout(self):
+        '''
+        A flush asked for while the writer flushes after a queue timeout
+        should still wait for the lines written before it.
+        '''
+        log = AsyncLog(self.filename, echo=False, flushInterval=0.01)
+        slow = SlowFlushFile(log.file)
+        log.file = slow
+        slow.flushing.wait(5)
+        log.write("line\n")
+        log.flush()
+        self.assertEqual(self.contents(), "line\n")
+        log.close()
+
+    def test_sync(self):
+        '''
+        Without a queue, every write should be in the file at once.
+        '''
+        log = AsyncLog(self.filename, echo=False, queueSize=0)
+        self.assertIsNone(log.thread)
+        log.write("line\n")
+        self.assertEqual(self.contents(), "line\n")
+        log.close()
+        self.assertTrue(log.file.closed)
+
+
+class SlowFlushFile(object):
+    '''
+    File whose writes take a while, and whose first flush signals flushing,
+    then takes a while.
+    '''
+    def __init__(self, f):
+        self.file = f
+        self.flushing = threading.Event()
+
+    def write(self, text):
+        time.sleep(0.1)
+        self.file.write(text)
+
+    def flush(self):
+        if not self.flushing.is_set():
+            self.flushing.set()
+            time.sleep(0.2)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
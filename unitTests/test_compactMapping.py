@@ -0,0 +1,69 @@
+'''
+Tests for CompactMapping and its interoperation with the comparitors.
+'''
+import unittest
+import cPickle
+from itertools import islice
+from mapping import Vertex as v
+from mapping import Mapping
+from compactMapping import CompactMapping
+from mappingIterators import EndpointEmptyMappingIterator
+from mappingIterators import SurjectiveMappingIterator
+from comparitors import checkDisjointness
+
+
+class Test_compactMapping(unittest.TestCase):
+
+    def setUp(self):
+        self.empty = list(islice(EndpointEmptyMappingIterator(), 0, 510, 51))
+
+    def test_call(self):
+        '''
+        A CompactMapping should dereference vertices like the Mapping it was
+        built from.
+        '''
+        m = Mapping([v(0, 1), [v(0, 2), v(0, 1)], [], [v(0, 0)]])
+        c = CompactMapping.fromMapping(m)
+        self.assertEqual(str(c), str(m))
+        for arm in range(3):
+            for t in range(5):
+                self.assertEqual(c(arm, t), m(arm, t))
+                self.assertEqual(c(v(arm, t)), m(v(arm, t)))
+        self.assertEqual(str(c.toMapping()), str(m))
+
+    def test_copyFree(self):
+        '''
+        The buffer handed to the constructor should be shared, not copied.
+        '''
+        c = CompactMapping.fromMapping(self.empty[0])
+        d = CompactMapping(c.buffer, c.endpointCodes)
+        self.assertIs(d.buffer, c.buffer)
+        self.assertIsNot(c.copy().buffer, c.buffer)
+
+    def test_pickle(self):
+        '''
+        Pickling should preserve the mapping, endpoint map and id.
+        '''
+        c = CompactMapping.fromMapping(self.empty[1])
+        d = cPickle.loads(cPickle.dumps(c, 2))
+        self.assertEqual(str(d), str(c))
+        self.assertEqual(d.endpointMap, self.empty[1].endpointMap)
+        self.assertEqual(d.id, self.empty[1].id)
+
+    def test_disjointness(self):
+        '''
+        checkDisjointness should give the same result for compact mappings,
+        mixed arguments and Mapping objects.
+        '''
+        for m1, m2 in zip(self.empty, self.empty[1:]):
+            for a in islice(SurjectiveMappingIterator(m1), 0, None, 11):
+                for b in islice(SurjectiveMappingIterator(m2), 0, None, 11):
+                    ca = CompactMapping.fromMapping(a)
+                    cb = CompactMapping.fromMapping(b)
+                    expected = checkDisjointness(a, b)
+                    self.assertEqual(checkDisjointness(ca, cb), expected)
+                    self.assertEqual(checkDisjointness(a, cb), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
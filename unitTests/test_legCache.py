@@ -0,0 +1,77 @@
+'''
+Tests for the leg completion cache and the iterators which use it.
+'''
+import unittest
+from itertools import islice
+from legCache import LegCompletionCache
+from mappingIterators import EndpointEmptyMappingIterator
+from mappingIterators import SurjectiveMappingIterator, FullMappingIterator
+from mappingIterators import EncodedSurjectiveMappingIterator
+from vertexTable import defaultTable
+
+
+class Test_legCache(unittest.TestCase):
+
+    def setUp(self):
+        self.empty = list(islice(EndpointEmptyMappingIterator(), 0, 510, 17))
+
+    def test_lru(self):
+        '''
+        The least recently used entry should be evicted first, and lookups
+        should be counted.
+        '''
+        cache = LegCompletionCache(2)
+        self.assertEqual(cache.get('a', lambda: [1]), (1,))
+        cache.get('b', lambda: [2])
+        # 'a' is now the most recently used
+        self.assertEqual(cache.get('a', lambda: [3]), (1,))
+        cache.get('c', lambda: [4])
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a', lambda: [5]), (1,))
+        self.assertEqual(cache.get('b', lambda: [6]), (6,))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']),
+                         (2, 4, 2))
+        cache.clear()
+        self.assertEqual((len(cache), cache.hits, cache.misses), (0, 0, 0))
+
+    def test_disabled(self):
+        '''
+        A cache of size 0 should never store anything.
+        '''
+        cache = LegCompletionCache(0)
+        cache.get('a', lambda: [1])
+        cache.get('a', lambda: [1])
+        self.assertEqual((len(cache), cache.hits, cache.misses), (0, 0, 2))
+
+    def test_iterators(self):
+        '''
+        Iterators should give the same mappings with a warm, cold or disabled
+        cache.
+        '''
+        t = defaultTable
+        cache = LegCompletionCache(64)
+        for m in self.empty:
+            for length in (1, 2, None):
+                expected = [str(c) for c in SurjectiveMappingIterator(
+                    m, length, LegCompletionCache(0))]
+                for i in range(2):
+                    got = [str(c) for c in SurjectiveMappingIterator(
+                        m, length, cache)]
+                    self.assertEqual(got, expected)
+                    got = [str(t.decodeMapping(c)) for c in
+                           EncodedSurjectiveMappingIterator(
+                               t.encodeMapping(m),
+                               t.encodeEndpointMap(m.endpointMap), length,
+                               cache=cache)]
+                    self.assertEqual(got, expected)
+            expected = [str(c) for c in FullMappingIterator(
+                m, 2, LegCompletionCache(0))]
+            got = [str(c) for c in FullMappingIterator(m, 2, cache)]
+            self.assertEqual(got, expected)
+        self.assertGreater(cache.hits, cache.misses)
+        self.assertLessEqual(len(cache), 64)
+
+
+if __name__ == "__main__":
+    unittest.main()
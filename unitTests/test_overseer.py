@@ -0,0 +1,45 @@
+'''
+Tests for the work of a worker on a pair in overseer.py.
+'''
+import unittest
+import overseer
+from message import StatusMessage, DonePairMesage
+from mappingIterators import EndpointEmptyMappingPairIterator
+
+
+class Test_overseer(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = (overseer.WORKER_REPORT_INTERVAL, overseer.PAIR_ENGINE)
+        overseer.WORKER_REPORT_INTERVAL = 1000
+        # every one of its 6568 completions fails disjointness
+        self.pair = EndpointEmptyMappingPairIterator(skip=30000).next()
+
+    def tearDown(self):
+        overseer.WORKER_REPORT_INTERVAL, overseer.PAIR_ENGINE = self.saved
+
+    def statusTotals(self, engine):
+        overseer.PAIR_ENGINE = engine
+        sent = []
+        done = overseer.worker_processPair(self.pair, send=sent.append)
+        self.assertIsInstance(done, DonePairMesage)
+        self.assertEqual((done.countTotal, done.countFailures), (6568, 6568))
+        return [m.countTotal for m in sent if isinstance(m, StatusMessage)]
+
+    def test_statusWithoutPairs(self):
+        '''
+        Status messages should count failed completions, and be sent for a
+        pair with no disjoint completions, at most once per interval.
+        '''
+        for engine in ('factorized', 'joint'):
+            totals = self.statusTotals(engine)
+            self.assertTrue(totals)
+            steps = [t // 1000 for t in totals]
+            self.assertEqual(steps, sorted(set(steps)))
+            self.assertTrue(all(0 < t <= 6568 for t in totals))
+        # the joint engine counts failures as it searches
+        self.assertGreater(len(self.statusTotals('joint')), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
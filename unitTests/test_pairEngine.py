@@ -0,0 +1,137 @@
+'''
+Tests for the pair engines, which must agree with completing both mappings of
+a pair half way, checking disjointness and then completing them fully.
+'''
+import unittest
+from mappingIterators import EndpointEmptyMappingPairIterator
+from mappingIterators import EncodedSurjectiveMappingIterator
+from comparitors import checkDisjointnessEncoded
+from vertexTable import defaultTable
+from pairEngine import FactorizedPairEngine, JointPairEngine
+from pairEngine import CountingPairEngine
+
+
+def nestedReference(pair):
+    '''
+    Process a pair with the nested loops originally used by the workers.
+    Returns countTotal, countFailures, a sorted list of passing pairs, the
+    numbers of pairs of half completions which fail and pass, and the number
+    of pairs of vertex images the disjointness checks look at.
+    '''
+    t = defaultTable
+    epm1 = t.encodeEndpointMap(pair[0].endpointMap)
+    epm2 = t.encodeEndpointMap(pair[1].endpointMap)
+    total = 0
+    failures = 0
+    passed = []
+    halfFailures = 0
+    halfPassed = 0
+    nodes = 0
+    for pm1 in EncodedSurjectiveMappingIterator(t.encodeMapping(pair[0]),
+                                                epm1, length=t.N // 2):
+        for pm2 in EncodedSurjectiveMappingIterator(t.encodeMapping(pair[1]),
+                                                    epm2, length=t.N // 2):
+            nodes += t.T * (t.N // 2)
+            if checkDisjointnessEncoded(pm1, pm2) == 0:
+                total += 1
+                failures += 1
+                halfFailures += 1
+                continue
+            halfPassed += 1
+            for m1 in EncodedSurjectiveMappingIterator(pm1, epm1):
+                for m2 in EncodedSurjectiveMappingIterator(pm2, epm2):
+                    total += 1
+                    nodes += t.T * t.N
+                    d = checkDisjointnessEncoded(m1, m2)
+                    if d == 0:
+                        failures += 1
+                    else:
+                        passed.append((str(m1), str(m2), d))
+    return total, failures, sorted(passed), halfFailures, halfPassed, nodes
+
+
+class Test_pairEngine(unittest.TestCase):
+
+    def setUp(self):
+        # a few pairs with and without disjoint completions
+        self.pairs = [EndpointEmptyMappingPairIterator(skip=s).next()
+                      for s in (0, 2462, 8999, 13499, 30000)]
+        self.expected = [nestedReference(p) for p in self.pairs]
+
+    def test_factorized(self):
+        '''
+        FactorizedPairEngine should give the same counts and pairs.
+        '''
+        for pair, expected in zip(self.pairs, self.expected):
+            engine = FactorizedPairEngine(pair)
+            got = sorted((str(m1), str(m2), d) for m1, m2, d in
+                         engine.pairs())
+            self.assertEqual((engine.countTotal, engine.countFailures),
+                             expected[:2])
+            self.assertEqual(engine.countPassed, len(expected[2]))
+            self.assertEqual(got, expected[2])
+            self.assertEqual((engine.halfFailures, engine.halfPassed),
+                             expected[3:5])
+
+    def test_factorizedHalves(self):
+        '''
+        Splitting a pair part way through should give the same counts and
+        pairs as processing it whole, and only halves with pairs to generate
+        should be given away.
+        '''
+        stolen = 0
+        for pair, expected in zip(self.pairs, self.expected):
+            engine = FactorizedPairEngine(pair)
+            pairs = engine.pairs()
+            got = [next(pairs, None)]
+            given = engine.steal()
+            self.assertTrue(all(engine.splitHalves[k][1] for k in given))
+            stolen += len(given)
+            piece = FactorizedPairEngine(pair, halves=given)
+            got.extend(pairs)
+            got.extend(piece.pairs())
+            got = sorted((str(m1), str(m2), d) for m1, m2, d in
+                         filter(None, got))
+            self.assertEqual((engine.countTotal + piece.countTotal,
+                              engine.countFailures + piece.countFailures),
+                             expected[:2])
+            self.assertEqual(got, expected[2])
+            self.assertEqual((engine.halfFailures + piece.halfFailures,
+                              engine.halfPassed + piece.halfPassed),
+                             expected[3:5])
+        self.assertGreater(stolen, 0)
+
+    def test_joint(self):
+        '''
+        JointPairEngine should give the same counts and pairs, visiting
+        fewer pairs of vertex images than the nested loops check.
+        '''
+        for pair, expected in zip(self.pairs, self.expected):
+            engine = JointPairEngine(pair)
+            got = sorted((str(m1), str(m2), d) for m1, m2, d in
+                         engine.pairs())
+            self.assertEqual((engine.countTotal, engine.countFailures),
+                             expected[:2])
+            self.assertEqual(got, expected[2])
+            self.assertEqual((engine.halfFailures, engine.halfPassed),
+                             expected[3:5])
+            # the search skips whole subtrees the nested loops go through
+            self.assertLess(engine.nodesVisited, expected[5])
+
+    def test_counting(self):
+        '''
+        CountingPairEngine should give the same counts without generating
+        any pairs.
+        '''
+        for pair, expected in zip(self.pairs, self.expected):
+            engine = CountingPairEngine(pair)
+            self.assertEqual(list(engine.pairs()), [])
+            self.assertEqual((engine.countTotal, engine.countFailures),
+                             expected[:2])
+            self.assertEqual(engine.countPassed, len(expected[2]))
+            self.assertEqual((engine.halfFailures, engine.halfPassed),
+                             expected[3:5])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+'''
+Tests for PairIndex and the iterators which skip with it.
+'''
+import unittest
+from itertools import permutations
+from mappingIterators import PairIndex, permutationRank
+from mappingIterators import EndpointEmptyMappingPairIterator
+from mappingIterators import EndpointEmptyMappingIterator
+
+
+def describe(pair):
+    return (pair.idnum, pair[0].id, pair[1].id, str(pair[0]),
+            pair[0].endpointMap, str(pair[1]), pair[1].endpointMap)
+
+
+class Test_pairIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PairIndex()
+        gen = EndpointEmptyMappingPairIterator()
+        self.pairs = [gen.next() for i in range(3000)]
+
+    def test_permutationRank(self):
+        for n, k in ((5, 3), (4, 4), (6, 1)):
+            for r, p in enumerate(permutations(range(n), k)):
+                self.assertEqual(permutationRank(p, n), r)
+
+    def test_rank(self):
+        '''
+        pair() and rank() should agree with the ids given by the iterator.
+        '''
+        for p in self.pairs[::13]:
+            self.assertEqual(describe(self.index.pair(p.idnum)), describe(p))
+            self.assertEqual(self.index.rank(p), p.idnum)
+        last = self.index.pair(len(self.index))
+        self.assertEqual(self.index.rank(last), len(self.index))
+        self.assertRaises(ValueError, self.index.pair, 0)
+        self.assertRaises(ValueError, self.index.pair, len(self.index) + 1)
+
+    def test_skip(self):
+        '''
+        Skipping should give the same pairs and mappings as iterating.
+        '''
+        for s in (1, 100, 2997):
+            gen = EndpointEmptyMappingPairIterator(skip=s)
+            got = [describe(gen.next()) for i in range(3)]
+            self.assertEqual(got, [describe(p) for p in self.pairs[s:s + 3]])
+        gen = EndpointEmptyMappingPairIterator(skip=len(self.index))
+        self.assertRaises(StopIteration, gen.next)
+        mappings = list(EndpointEmptyMappingIterator())
+        for s in (1, 77, len(mappings) - 1, len(mappings)):
+            got = [(m.id, str(m), m.endpointMap) for m in
+                   EndpointEmptyMappingIterator(skip=s)]
+            self.assertEqual(got, [(m.id, str(m), m.endpointMap)
+                                   for m in mappings[s:]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+'''
+Tests for merging the profiles of the ranks of a run.
+'''
+import unittest
+import os
+import shutil
+import tempfile
+import cProfile
+from profileMerge import profile_filename, rank_profiles, merge
+
+
+def busy(n):
+    return sum(range(n))
+
+
+class Test_profileMerge(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for rank, role in [(0, 'master'), (1, 'leader'), (2, 'worker'),
+                           (3, 'worker')]:
+            profile = cProfile.Profile()
+            profile.runcall(busy, 1000 * (rank + 1))
+            profile.dump_stats(profile_filename(self.directory, rank, role))
+        # not the profile of a rank
+        open(os.path.join(self.directory, 'worker.prof'), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_merge(self):
+        '''
+        The profiles of the master and leaders, and of the workers, should
+        be added up separately.
+        '''
+        self.assertEqual([(rank, role) for rank, role, f in
+                          rank_profiles(self.directory)],
+                         [(0, 'master'), (1, 'leader'), (2, 'worker'),
+                          (3, 'worker')])
+        merged = merge(self.directory)
+        self.assertEqual(sorted(merged), ['master', 'worker'])
+        for side, calls in (('master', 2), ('worker', 2)):
+            found = [v for k, v in merged[side].stats.iteritems()
+                     if k[2] == 'busy']
+            self.assertEqual(len(found), 1)
+            self.assertEqual(found[0][1], calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
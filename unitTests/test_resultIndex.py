@@ -0,0 +1,114 @@
+'''
+Tests for the indexes over result files.
+'''
+import unittest
+import os
+import tempfile
+from resultStore import ResultWriter, ResultStore
+from resultIndex import ResultIndex
+from message import ReportBatchMessage
+from vertexTable import defaultTable
+
+
+class Test_resultIndex(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.filename = tempfile.mkstemp()
+        os.close(handle)
+        os.remove(self.filename)
+        self.indexname = self.filename + '.idx'
+        # (basepoint of m1, basepoint of m2, disjointness, commutativity)
+        self.keys = [(k % 3, 1, k % 4, (7 * k) % 5) for k in range(20)]
+        self.write(self.keys)
+        self.store = ResultStore(self.filename)
+
+    def write(self, keys):
+        '''
+        Write a result file of a new run with a record for every key.
+        '''
+        L = defaultTable.domainSize
+        writer = ResultWriter(self.filename)
+        for k, (b1, b2, djnum, comnum) in enumerate(keys):
+            reports = [(chr(b1) * L, chr(b2) * L, djnum, comnum)]
+            writer.addBatch(ReportBatchMessage(1, (1, 2, 3), (k % 2, 0, 0),
+                                               reports, 9000 + k))
+        writer.close()
+
+    def tearDown(self):
+        self.store.close()
+        for name in (self.filename, self.indexname):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def test_range(self):
+        '''
+        Range queries should find the records a scan would, and the saved
+        indexes should be reused until records are added.
+        '''
+        index = ResultIndex(self.store, self.indexname)
+        found = index.range('disjointness', 2)
+        self.assertEqual(sorted(found), [k for k in range(20)
+                                         if self.keys[k][2] >= 2])
+        self.assertEqual([index.key('disjointness', k) for k in found],
+                         sorted(self.keys[k][2] for k in found))
+        self.assertEqual(index.range('commutativity', 3, 3),
+                         [k for k in range(20) if self.keys[k][3] == 3])
+        self.assertEqual(index.range('commutativity', 9), [])
+        self.assertEqual(index.query({'disjointness': (2, None),
+                                      'commutativity': (None, 1)}),
+                         [k for k in range(20) if self.keys[k][2] >= 2 and
+                          self.keys[k][3] <= 1])
+        self.assertEqual(index.query({'endpoints': (((1, 2, 3), (1, 0, 0)),
+                                                    ((1, 2, 3), (1, 0, 0)))}),
+                         range(1, 20, 2))
+        saved = ResultIndex(self.store, self.indexname)
+        self.assertEqual(saved.orders, index.orders)
+        writer = ResultWriter(self.filename, runId=self.store.runId)
+        writer.addBatch(ReportBatchMessage(1, (1, 2, 3), (0, 0, 0),
+                                           [('\0' * 13, '\0' * 13, 0, 0)]))
+        writer.close()
+        store = ResultStore(self.filename)
+        self.assertEqual(len(ResultIndex(store, self.indexname).orders[
+            'disjointness']), 21)
+        store.close()
+
+    def test_otherRun(self):
+        '''
+        A saved index should be rebuilt for a result file written again by
+        another run, with as many records in another order.
+        '''
+        ResultIndex(self.store, self.indexname)
+        self.store.close()
+        os.remove(self.filename)
+        keys = self.keys[::-1]
+        self.write(keys)
+        self.store = ResultStore(self.filename)
+        index = ResultIndex(self.store, self.indexname)
+        self.assertEqual(index.range('disjointness', 3),
+                         [k for k in range(20) if keys[k][2] == 3])
+        self.assertEqual([keys[k][2] for k in index.top('disjointness', 5)],
+                         [0] * 5)
+
+    def test_top(self):
+        '''
+        Top-k and minimal queries should pick the smallest keys, and groups
+        should be in key order.
+        '''
+        index = ResultIndex(self.store)
+        self.assertEqual(index.top('commutativity', 4), [0, 5, 10, 15])
+        self.assertEqual([index.key('commutativity', k) for k in
+                          index.top('commutativity', 3, largest=True)],
+                         [4, 4, 4])
+        records = index.query({'disjointness': (2, None)})
+        least = index.minimal('commutativity', records)
+        self.assertEqual(least, [k for k in records if self.keys[k][3] ==
+                                 min(self.keys[r][3] for r in records)])
+        groups = index.group('basepoints', records)
+        self.assertEqual([key for key, group in groups],
+                         sorted(set((self.keys[k][0], 1) for k in records)))
+        self.assertEqual(sum(len(group) for key, group in groups),
+                         len(records))
+
+
+if __name__ == "__main__":
+    unittest.main()
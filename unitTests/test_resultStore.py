@@ -0,0 +1,116 @@
+'''
+Tests for writing and reading result files.
+'''
+import unittest
+import os
+import tempfile
+from resultStore import ResultWriter, ResultStore, numpy
+from message import ReportBatchMessage, ReportPairMessage
+from mapping import MappingPair
+from mappingIterators import EndpointEmptyMappingPairIterator
+from mappingIterators import SurjectiveMappingIterator
+from vertexTable import defaultTable
+
+
+class Test_resultStore(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.filename = tempfile.mkstemp()
+        os.close(handle)
+        os.remove(self.filename)
+        t = defaultTable
+        pair = EndpointEmptyMappingPairIterator(skip=9000).next()
+        it1 = SurjectiveMappingIterator(pair[0])
+        it2 = SurjectiveMappingIterator(pair[1])
+        self.maps = [(it1.next(), it2.next()) for i in range(3)]
+        self.epm1 = t.encodeEndpointMap(pair[0].endpointMap)
+        self.epm2 = t.encodeEndpointMap(pair[1].endpointMap)
+        self.reports = [(str(t.encodeMapping(m1)), str(t.encodeMapping(m2)),
+                         k, k % 2) for k, (m1, m2) in enumerate(self.maps)]
+        self.fullPair = MappingPair(9001, *self.maps[0])
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def write(self, runId=None):
+        writer = ResultWriter(self.filename, runId=runId)
+        writer.addBatch(ReportBatchMessage(2, self.epm1, self.epm2,
+                                           self.reports, 9001))
+        writer.addPair(ReportPairMessage(3, self.fullPair, 1, 0))
+        writer.close()
+        return writer.runId
+
+    def test_roundTrip(self):
+        '''
+        Records should read back as written, and decode to the mappings
+        reported.
+        '''
+        self.write()
+        store = ResultStore(self.filename)
+        self.assertEqual(len(store), 4)
+        epm1 = str(bytearray(self.epm1))
+        epm2 = str(bytearray(self.epm2))
+        self.assertEqual(list(store)[:3], [(9001, m1, m2, epm1, epm2, d, c)
+                                           for m1, m2, d, c in self.reports])
+        self.assertEqual(store[-1][0], 9001)
+        self.assertEqual(store[-1][5:], (1, 0))
+        m1, m2 = store.pair(1)
+        self.assertEqual(str(m1), str(self.maps[1][0]))
+        self.assertEqual(str(m2), str(self.maps[1][1]))
+        self.assertEqual(m1.endpointMap, self.maps[1][0].endpointMap)
+        self.assertRaises(IndexError, store.__getitem__, 4)
+        store.close()
+
+    def test_append(self):
+        '''
+        A writer should append to an existing file of its run, after
+        dropping a record cut short, and refuse a file which is not a result
+        file.
+        '''
+        runId = self.write()
+        with open(self.filename, 'ab') as resultFile:
+            resultFile.write('partial')
+        self.assertEqual(len(ResultStore(self.filename)), 4)
+        self.assertEqual(self.write(runId), runId)
+        store = ResultStore(self.filename)
+        self.assertEqual(len(store), 8)
+        self.assertEqual(store[4], store[0])
+        self.assertEqual(store.runId, runId)
+        store.close()
+        with open(self.filename, 'wb') as resultFile:
+            resultFile.write('not a result file' * 4)
+        self.assertRaises(ValueError, ResultWriter, self.filename)
+        self.assertRaises(ValueError, ResultStore, self.filename)
+
+    def test_otherRun(self):
+        '''
+        A writer of a new run should refuse to append to the file of another
+        run, and leave it as it was.
+        '''
+        runId = self.write()
+        size = os.path.getsize(self.filename)
+        self.assertRaises(ValueError, ResultWriter, self.filename)
+        self.assertRaises(ValueError, ResultWriter, self.filename,
+                          runId='\0' * 16)
+        self.assertEqual(os.path.getsize(self.filename), size)
+        store = ResultStore(self.filename)
+        self.assertEqual((len(store), store.runId), (4, runId))
+        store.close()
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_array(self):
+        '''
+        The NumPy view should hold the same records as the reader.
+        '''
+        self.write()
+        store = ResultStore(self.filename)
+        records = store.array()
+        self.assertEqual(len(records), 4)
+        self.assertEqual(list(records['disjointness']), [0, 1, 2, 1])
+        self.assertEqual(records['m1'][2].tostring(), store[2][1])
+        self.assertEqual(int((records['commutativity'] == 0).sum()), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,255 @@
+'''
+Tests for the bookkeeping of PairScheduler.
+'''
+import unittest
+import os
+import tempfile
+from scheduler import PairScheduler, read_checkpoint, write_checkpoint, Block
+from message import DonePairMesage, DoneChunkMessage
+from stageStats import StageStats
+
+
+class FakePair(object):
+    orbitSize = 1
+
+    def __init__(self, idnum):
+        self.idnum = idnum
+
+
+class Test_scheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.pairs = [FakePair(i) for i in (1, 2, 3)]
+
+    def test_plain(self):
+        '''
+        Without stealing, workers are given pairs in order, and nothing once
+        the pairs run out.
+        '''
+        s = PairScheduler(iter(self.pairs))
+        self.assertEqual(s.nextWork(1).pair.idnum, 1)
+        self.assertEqual(s.nextWork(2).pair.idnum, 2)
+        s.done(1, DonePairMesage(1, 10, 4))
+        self.assertEqual(s.nextWork(1).pair.idnum, 3)
+        s.done(2, DonePairMesage(2, 5, 5))
+        self.assertIsNone(s.nextWork(2))
+        self.assertEqual(s.idle, [])
+        self.assertEqual(s.stealRequests(), [])
+        self.assertFalse(s.finished())
+        s.done(1, DonePairMesage(1, 1, 0))
+        self.assertTrue(s.finished())
+        self.assertEqual((s.counts['pairsDone'], s.counts['totalCompletions'],
+                          s.counts['completionsPassed']), (3, 16, 7))
+
+    def test_stealing(self):
+        '''
+        Idle workers should be given the pieces split off busy workers, and a
+        pair should be counted once, when its last piece is done.
+        '''
+        s = PairScheduler(iter(self.pairs[:1]), stealing=True)
+        work = s.nextWork(1)
+        self.assertIsNone(s.nextWork(2))
+        self.assertEqual(s.idle, [2])
+        self.assertEqual(s.stealRequests(), [(1, work.serial)])
+        # a request is not repeated while it is outstanding
+        self.assertEqual(s.stealRequests(), [])
+        # a reply for an earlier assignment is ignored
+        self.assertIsNone(s.split(1, work.serial - 1, [3], [0, 1, 2]))
+        piece = s.split(1, work.serial, [2, 3], [0, 1])
+        self.assertEqual(piece.halves, [2, 3])
+        self.assertEqual(work.halves, [0, 1])
+        self.assertEqual(s.assignIdle(), [(2, piece)])
+        self.assertNotEqual(piece.serial, work.serial)
+        s.done(1, DonePairMesage(1, 6, 2))
+        self.assertEqual(s.counts['pairsDone'], 0)
+        self.assertIsNone(s.nextWork(1))
+        # worker 2 refuses, and is not asked again for the same piece
+        self.assertEqual(s.stealRequests(), [(2, piece.serial)])
+        self.assertIsNone(s.split(2, piece.serial, [], None))
+        self.assertEqual(s.stealRequests(), [])
+        s.done(2, DonePairMesage(2, 4, 4))
+        self.assertTrue(s.finished())
+        self.assertEqual((s.counts['pairsDone'], s.counts['totalCompletions'],
+                          s.counts['completionsPassed'],
+                          s.counts['piecesSplit']), (1, 10, 4, 1))
+
+    def test_prefetch(self):
+        '''
+        Workers should be kept depth assignments ahead, and queued work given
+        back should go to the next worker which asks.
+        '''
+        pairs = [FakePair(i) for i in range(1, 6)]
+        s = PairScheduler(iter(pairs), stealing=True, depth=2)
+        for worker in (1, 2):
+            while s.wanted(worker):
+                s.nextWork(worker)
+        self.assertEqual(s.wanted(1), 0)
+        self.assertEqual([w.pair.idnum for w in s.assigned[2]], [3, 4])
+        s.done(1, DonePairMesage(1, 1, 1))
+        self.assertEqual(s.wanted(1), 1)
+        self.assertEqual(s.nextWork(1).pair.idnum, 5)
+        s.done(1, DonePairMesage(1, 1, 1))
+        s.done(1, DonePairMesage(1, 1, 1))
+        self.assertIsNone(s.nextWork(1))
+        self.assertEqual(s.idle, [1])
+        # worker 2 has work queued, so it is asked and gives it back
+        queued = s.assigned[2][1]
+        self.assertEqual(s.stealRequests(), [(2, s.assigned[2][0].serial)])
+        self.assertEqual(s.returned(2, [queued.serial]), [queued])
+        self.assertEqual(s.assignIdle(), [(1, queued)])
+        s.done(2, DonePairMesage(2, 1, 1))
+        s.done(1, DonePairMesage(1, 1, 1))
+        self.assertTrue(s.finished())
+        self.assertEqual((s.counts['pairsSent'], s.counts['pairsDone']),
+                         (5, 5))
+
+    def test_chunks(self):
+        '''
+        Chunks should be sized from the time per pair of a worker, shrink
+        towards the end of the run, and be counted pair by pair.
+        '''
+        pairs = [FakePair(i) for i in range(1, 201)]
+        s = PairScheduler(iter(pairs), chunkTime=2, maxChunk=50, total=200,
+                          workers=2)
+        # nothing is known about the worker yet
+        self.assertEqual(len(s.nextWork(1).pairs), 1)
+        s.pairTime[1] = 0.1
+        work = s.nextWork(1)
+        self.assertEqual([p.idnum for p in work.pairs], range(2, 22))
+        s.pairTime[1] = 0.001
+        self.assertEqual(s.chunkSize(1), 45)
+        s.lastId = 190
+        s.counts['pairsSent'] = 190
+        self.assertEqual(s.chunkSize(1), 3)
+        s.done(1, DonePairMesage(1, 3, 1))
+        s.done(1, DoneChunkMessage(1, [DonePairMesage(1, 2, 1)] * 20))
+        self.assertEqual((s.counts['pairsDone'], s.counts['totalCompletions'],
+                          s.counts['completionsPassed']), (21, 43, 22))
+        self.assertEqual(s.unfinished, {})
+        s.pairTime[2] = 0.001
+        work = s.nextWork(2)
+        state = s.checkpoint()
+        self.assertEqual([w[0] for w in state['work']],
+                         [p.idnum for p in work.pairs])
+
+    def test_checkpoint(self):
+        '''
+        A run restored from a checkpoint should redo the unfinished work, then
+        continue with the pairs not yet taken, and reach the same counts.
+        '''
+        s = PairScheduler(iter(self.pairs), stealing=True)
+        work = s.nextWork(1)
+        s.nextWork(2)
+        s.done(2, DonePairMesage(2, 7, 3))
+        s.nextWork(2)
+        s.split(1, work.serial, [5, 6], [0, 1, 2, 3, 4])
+        handle, filename = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            write_checkpoint(filename, s.checkpoint())
+            state = read_checkpoint(filename)
+        finally:
+            os.remove(filename)
+        self.assertEqual(state['work'], [(1, 1, [0, 1, 2, 3, 4], 0),
+                                         (3, 1, None, 0), (1, 1, [5, 6], 0)])
+        self.assertIsNone(read_checkpoint(filename))
+        pairs = dict((p.idnum, p) for p in self.pairs)
+        r = PairScheduler(iter(self.pairs[3:]), stealing=True)
+        r.restore(state, pairs.get)
+        got = [r.nextWork(i) for i in (1, 2, 3)]
+        self.assertEqual([(w.pair.idnum, w.halves) for w in got],
+                         [(1, [0, 1, 2, 3, 4]), (3, None), (1, [5, 6])])
+        r.done(1, DonePairMesage(1, 6, 2))
+        self.assertEqual(r.counts['pairsDone'], 1)
+        r.done(3, DonePairMesage(3, 4, 4))
+        r.done(2, DonePairMesage(2, 1, 0))
+        self.assertIsNone(r.nextWork(1))
+        self.assertTrue(r.finished())
+        self.assertEqual((r.counts['pairsSent'], r.counts['pairsDone'],
+                          r.counts['totalCompletions'],
+                          r.counts['completionsPassed']), (3, 3, 18, 9))
+        self.assertRaises(ValueError, r.restore, {'version': 0}, pairs.get)
+
+    def test_checkpointReports(self):
+        '''
+        The reports of unfinished work written out before a checkpoint should
+        be dropped when the work is done again after restoring it.
+        '''
+        s = PairScheduler(iter(self.pairs))
+        s.nextWork(1)
+        s.nextWork(2)
+        self.assertEqual(s.reported(1, 1, 3), 0)
+        self.assertEqual(s.reported(1, 1, 2), 0)
+        self.assertEqual(s.reported(2, 2, 4), 0)
+        s.done(2, DonePairMesage(2, 7, 3))
+        state = s.checkpoint()
+        self.assertEqual(state['work'], [(1, 1, None, 5)])
+        pairs = dict((p.idnum, p) for p in self.pairs)
+        r = PairScheduler(iter(self.pairs[2:]))
+        r.restore(state, pairs.get)
+        r.nextWork(1)
+        self.assertEqual(r.reported(1, 1, 4), 4)
+        self.assertEqual(r.reported(1, 1, 4), 1)
+        self.assertEqual(r.reported(1, 1, 4), 0)
+        self.assertEqual(r.checkpoint()['work'], [(1, 1, None, 12)])
+
+    def test_feed(self):
+        '''
+        A group leader's scheduler should leave workers idle once its pairs
+        run out, and give out the pairs and pieces it is fed later.
+        '''
+        s = PairScheduler(iter(()), stealing=True)
+        self.assertIsNone(s.nextWork(1))
+        self.assertEqual(s.idle, [1])
+        s.feed(self.pairs[:2])
+        s.feed(self.pairs[2:])
+        s.idle.remove(1)
+        self.assertEqual(s.nextWork(1).pair.idnum, 1)
+        s.addPiece(FakePair(7), [3])
+        work = s.nextWork(2)
+        self.assertEqual((work.pair.idnum, work.halves), (7, [3]))
+        self.assertEqual([s.nextWork(3).pair.idnum for i in range(2)],
+                         [2, 3])
+        s.done(2, DonePairMesage(2, 5, 1))
+        self.assertEqual(s.unfinished, {1: 1, 2: 1, 3: 1})
+
+    def test_block(self):
+        '''
+        A block should be finished once every piece of its pairs is, and
+        report the counts merged over the pieces.
+        '''
+        block = Block(self.pairs[:2], True)
+        block.count(0, DonePairMesage(3, 5, 1))
+        block.left[1] += 1
+        block.count(1, DonePairMesage(3, 2, 2))
+        self.assertFalse(block.finished())
+        block.count(1, DonePairMesage(4, 3, 0))
+        self.assertTrue(block.finished())
+        reply = block.reply(1)
+        self.assertIsInstance(reply, DoneChunkMessage)
+        self.assertEqual([(r.sourceRank, r.countTotal, r.countFailures)
+                          for r in reply.replies], [(1, 5, 1), (1, 5, 2)])
+        block = Block(self.pairs[:1], False)
+        block.count(0, DonePairMesage(3, 5, 1))
+        self.assertIsInstance(block.reply(1), DonePairMesage)
+        self.assertIsNone(block.reply(1).stats)
+
+    def test_blockStats(self):
+        '''
+        A block should merge the stage statistics of the pieces of a pair.
+        '''
+        stats = StageStats()
+        stats.counts['pairs'] = 1
+        stats.times['engine'] = 0.5
+        block = Block(self.pairs[:1], False)
+        block.left[0] += 1
+        block.count(0, DonePairMesage(3, 2, 2, stats))
+        block.count(0, DonePairMesage(4, 3, 0, stats))
+        merged = block.reply(1).stats
+        self.assertEqual(merged.counts['pairs'], 2)
+        self.assertEqual(merged.times['engine'], 1.0)
+        self.assertEqual(stats.counts['pairs'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+'''
+Tests for the per-stage counters and timers of the workers.
+'''
+import unittest
+from stageStats import StageStats, COUNTERS, TIMERS
+from mappingIterators import EndpointEmptyMappingPairIterator
+from pairEngine import FactorizedPairEngine, JointPairEngine
+
+
+class Test_stageStats(unittest.TestCase):
+
+    def setUp(self):
+        self.pair = EndpointEmptyMappingPairIterator(skip=8999).next()
+
+    def test_engines(self):
+        '''
+        The counts of both enumerating engines should agree, and add up to
+        the counts of the pair.
+        '''
+        counts = []
+        for cls in (FactorizedPairEngine, JointPairEngine):
+            engine = cls(self.pair)
+            for p in engine.pairs():
+                pass
+            stats = StageStats().withEngine(engine)
+            c = stats.counts
+            self.assertEqual(c['pairs'], 1)
+            self.assertEqual(c['halfPruned'] + c['fullChecked'],
+                             engine.countTotal)
+            self.assertEqual(c['fullChecked'] - c['fullPassed'],
+                             engine.countFailures - c['halfPruned'])
+            counts.append(c)
+        self.assertEqual(counts[0], counts[1])
+        self.assertGreater(sum(stats.nodes), 0)
+        self.assertTrue(0 < stats.pruneRate() < 1)
+
+    def test_add(self):
+        '''
+        Adding stats should add every counter, timer and depth, and values
+        should round trip.
+        '''
+        a = StageStats()
+        b = StageStats()
+        for k, name in enumerate(COUNTERS):
+            a.counts[name] = k
+            b.counts[name] = 10
+        for name in TIMERS:
+            a.lap(name)
+            b.times[name] = 1.5
+        b.nodes[0] = 3
+        total = a.copy()
+        total.add(b)
+        self.assertEqual([total.counts[name] for name in COUNTERS],
+                         [k + 10 for k in range(len(COUNTERS))])
+        self.assertEqual(total.times['engine'], a.times['engine'] + 1.5)
+        self.assertEqual(total.nodes[0], 3)
+        self.assertEqual(a.nodes[0], 0)
+        self.assertEqual(StageStats.fromValues(total.values()), total)
+        self.assertIn("pruned:2", str(a))
+
+
+if __name__ == "__main__":
+    unittest.main()
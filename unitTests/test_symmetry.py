@@ -0,0 +1,66 @@
+'''
+Tests for the reduction of the pair search space under arm permutations.
+'''
+import unittest
+from mappingIterators import EndpointEmptyMappingPairIterator
+from mappingIterators import BasicEmptyMapIterator
+from mapping import MappingPair
+from pairEngine import FactorizedPairEngine
+from comparitors import checkCommutativityEncoded
+from symmetry import armPermutations, burnsideOrbitCount
+
+
+def allPairs(canonical=False):
+    gen = EndpointEmptyMappingPairIterator(canonical=canonical)
+    pairs = []
+    try:
+        while True:
+            pairs.append(gen.next())
+    except StopIteration:
+        return pairs
+
+
+class Test_symmetry(unittest.TestCase):
+
+    def test_basicCanonical(self):
+        '''
+        Canonical basepoints should cover every basepoint exactly once.
+        '''
+        full = list(BasicEmptyMapIterator())
+        canonical = list(BasicEmptyMapIterator(canonical=True))
+        self.assertEqual(sum(m.orbitSize for m in canonical), len(full))
+
+    def test_orbitCount(self):
+        '''
+        The canonical pairs should cover every pair exactly once, and their
+        number should agree with Burnside's lemma.
+        '''
+        full = allPairs()
+        canonical = allPairs(canonical=True)
+        self.assertEqual(sum(p.orbitSize for p in canonical), len(full))
+        self.assertEqual(burnsideOrbitCount(full), len(canonical))
+        # ids should be the same as in a full run
+        ids = set(p.idnum for p in full)
+        for p in canonical:
+            self.assertIn(p.idnum, ids)
+
+    def test_invariance(self):
+        '''
+        Conjugating a pair should not change what a worker computes for it.
+        '''
+        pair = EndpointEmptyMappingPairIterator(skip=8999).next()
+        expected = None
+        for g in armPermutations():
+            image = MappingPair(g.applyMapping(pair[0]),
+                                g.applyMapping(pair[1]))
+            engine = FactorizedPairEngine(image)
+            numbers = sorted((d, checkCommutativityEncoded(m1, m2))
+                             for m1, m2, d in engine.pairs())
+            result = (engine.countTotal, engine.countFailures, numbers)
+            if expected is None:
+                expected = result
+            self.assertEqual(result, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+'''
+Tests for the single node transports, run in real processes.
+'''
+import unittest
+import Queue
+import overseer
+from transport import run_processes, QueueTransport, TCPTransport
+from transport import ANY_SOURCE
+from message import StopMessage, StealMessage, DonePairMesage
+from wireFormat import defaultWireFormat
+
+
+def exchange(t):
+    '''
+    Every worker sends a message to the master, which answers each with one
+    addressed to that worker. Returns what the master saw.
+    '''
+    if t.rank != 0:
+        t.send(DonePairMesage(t.rank, t.rank * 10, t.rank))
+        reply = t.recv(source=0)
+        assert reply.serial == t.rank
+        t.barrier()
+        t.gather(t.rank * 2)
+        t.finalize()
+        return None
+    got = []
+    for i in range(1, t.size):
+        message = t.recv()
+        got.append((message.sourceRank, message.countTotal))
+        request = t.send(StealMessage(message.sourceRank),
+                         dest=message.sourceRank, block=False)
+        t.waitall([request])
+    t.barrier()
+    gathered = t.gather(-1)
+    t.finalize()
+    return sorted(got), gathered
+
+
+def failOnMaster(t):
+    '''
+    Rank 0 fails before the barrier every other rank waits in.
+    '''
+    if t.rank == 0:
+        raise ValueError("rank 0 failed")
+    t.barrier()
+
+
+class Test_transport(unittest.TestCase):
+
+    def check(self, backend, wire=None):
+        got, gathered = run_processes(4, exchange, backend, wire)
+        self.assertEqual(got, [(1, 10), (2, 20), (3, 30)])
+        self.assertEqual(gathered, [-1, 2, 4, 6])
+
+    def test_multiprocessing(self):
+        self.check('multiprocessing')
+        self.check('multiprocessing', defaultWireFormat)
+
+    def test_tcp(self):
+        self.check('tcp')
+        self.check('tcp', defaultWireFormat)
+
+    def test_masterFails(self):
+        '''
+        An exception on rank 0 should stop the other ranks and be raised,
+        rather than leave the run waiting for them.
+        '''
+        for backend in ('multiprocessing', 'tcp'):
+            self.assertRaises(ValueError, run_processes, 3, failOnMaster,
+                              backend)
+
+    def test_filter(self):
+        '''
+        Messages from other ranks should be kept while waiting for one rank,
+        and probe should not take the message.
+        '''
+        queues = [FakeQueue() for i in range(3)]
+        t = [QueueTransport(r, queues) for r in range(3)]
+        self.assertFalse(t[0].probe())
+        t[2].send(StealMessage(2))
+        t[1].send(StealMessage(1))
+        t[1].send(StopMessage())
+        self.assertFalse(t[0].probe(source=3))
+        self.assertTrue(t[0].probe(source=1))
+        self.assertEqual(t[0].recv(source=1).serial, 1)
+        self.assertIsInstance(t[0].recv(source=1), StopMessage)
+        self.assertEqual(t[0].recv(source=ANY_SOURCE).serial, 2)
+        self.assertFalse(t[0].probe())
+
+    def test_hierarchyOverTCP(self):
+        '''
+        The overseer should refuse to start in hierarchical mode over a
+        transport where only rank 0 can send to every rank.
+        '''
+        t = TCPTransport.__new__(TCPTransport)
+        t.rank = 0
+        t.size = 4
+        groupSize = overseer.HIERARCHY_GROUP_SIZE
+        overseer.HIERARCHY_GROUP_SIZE = 2
+        try:
+            self.assertRaises(ValueError, overseer.start, t)
+        finally:
+            overseer.HIERARCHY_GROUP_SIZE = groupSize
+
+
+class FakeQueue(object):
+    '''
+    Queue of a single process, for QueueTransports which all live in it.
+    '''
+    def __init__(self):
+        self.items = []
+
+    def put(self, item):
+        self.items.append(item)
+
+    def get(self, block=True):
+        if not self.items:
+            raise Queue.Empty
+        return self.items.pop(0)
+
+
+if __name__ == "__main__":
+    unittest.main()
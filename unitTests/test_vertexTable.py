@@ -0,0 +1,140 @@
+'''
+Tests for the integer-encoded vertex model and the encoded iterators and
+comparitors which run on it.
+'''
+import unittest
+import sys
+from StringIO import StringIO
+from itertools import islice
+from mapping import Vertex as v
+from mapping import Mapping
+from vertexTable import defaultTable, UNDEFINED
+from mappingIterators import EndpointEmptyMappingIterator
+from mappingIterators import SurjectiveMappingIterator, FullMappingIterator
+from mappingIterators import EncodedSurjectiveMappingIterator
+from mappingIterators import EncodedFullMappingIterator
+from comparitors import checkDisjointness, checkDisjointnessEncoded
+from comparitors import checkCommutativity, checkCommutativityEncoded
+from mappingIterators import EndpointEmptyMappingPairIterator
+
+
+class Test_vertexTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = defaultTable
+        self.maps = list(islice(EndpointEmptyMappingIterator(), 0, 510, 17))
+
+    def test_tables(self):
+        '''
+        Precomputed tables should agree with the Vertex methods.
+        '''
+        t = self.table
+        for c, a in enumerate(t.codomainVertices):
+            self.assertEqual(t.encodeCodomain(a), c)
+            self.assertEqual(tuple(t.codomainVertices[x]
+                                   for x in t.codomainAjacent[c]),
+                             a.ajacentCodomain())
+            for d, b in enumerate(t.codomainVertices):
+                self.assertEqual(t.codomainDistance[c][d], a - b)
+                if c == d:
+                    self.assertIsNone(t.codomainToward[c][d])
+                else:
+                    self.assertEqual(
+                        t.codomainVertices[t.codomainToward[c][d]],
+                        a.toward(b))
+        for c, a in enumerate(t.domainVertices):
+            self.assertEqual(t.encodeDomain(a), c)
+            self.assertEqual(tuple(t.domainVertices[x]
+                                   for x in t.domainAjacent[c]),
+                             a.ajacentDomain())
+
+    def test_encodeMapping(self):
+        '''
+        Encoding and decoding a mapping should be lossless.
+        '''
+        t = self.table
+        m = Mapping([v(0, 1), [v(0, 2), v(0, 1)], [], [v(0, 0)]])
+        buf = t.encodeMapping(m)
+        self.assertEqual(buf[0], t.encodeCodomain(v(0, 1)))
+        self.assertEqual(buf[t.domainCode(1, 1)], UNDEFINED)
+        self.assertEqual(str(t.decodeMapping(buf)), str(m))
+
+    def test_surjectiveIterator(self):
+        '''
+        The encoded surjective iterator should generate the same completions
+        in the same order as SurjectiveMappingIterator.
+        '''
+        t = self.table
+        for m in self.maps:
+            epm = t.encodeEndpointMap(m.endpointMap)
+            for length in (1, 2, None):
+                expected = [t.encodeMapping(x) for x in
+                            SurjectiveMappingIterator(m, length=length)]
+                got = list(EncodedSurjectiveMappingIterator(
+                    t.encodeMapping(m), epm, length=length))
+                self.assertEqual(got, expected)
+
+    def test_fullIterator(self):
+        '''
+        The encoded full iterator should generate the same completions in the
+        same order as FullMappingIterator.
+        '''
+        t = self.table
+        m = self.maps[3]
+        expected = [t.encodeMapping(x) for x in
+                    FullMappingIterator(m, length=2)]
+        got = list(EncodedFullMappingIterator(t.encodeMapping(m), length=2))
+        self.assertEqual(got, expected)
+
+    def test_disjointness(self):
+        '''
+        checkDisjointnessEncoded should agree with checkDisjointness.
+        '''
+        t = self.table
+        m1 = self.maps[0]
+        m2 = self.maps[-1]
+        for a in islice(SurjectiveMappingIterator(m1), 0, None, 7):
+            for b in islice(SurjectiveMappingIterator(m2), 0, None, 7):
+                self.assertEqual(
+                    checkDisjointnessEncoded(t.encodeMapping(a),
+                                             t.encodeMapping(b)),
+                    checkDisjointness(a, b))
+
+    def test_commutativity(self):
+        '''
+        checkCommutativityEncoded should agree with checkCommutativity
+        wherever it is defined. Where an image lies more than 1 up an arm,
+        which makes checkCommutativity raise, the encoded version still
+        returns the separation.
+        '''
+        t = self.table
+        agreed = 0
+        beyond = 0
+        # the basepoint of map1 is 2 up an arm in the pair after 60000
+        for skip in (0, 8999, 30000, 60000, 70000):
+            pair = EndpointEmptyMappingPairIterator(skip=skip).next()
+            for a in islice(SurjectiveMappingIterator(pair[0]), 5):
+                for b in islice(SurjectiveMappingIterator(pair[1]), 5):
+                    encoded = checkCommutativityEncoded(t.encodeMapping(a),
+                                                        t.encodeMapping(b))
+                    # checkCommutativity prints every point it tests
+                    stdout = sys.stdout
+                    sys.stdout = StringIO()
+                    try:
+                        expected = checkCommutativity(a, b)
+                    except ValueError:
+                        expected = None
+                    finally:
+                        sys.stdout = stdout
+                    if expected is None:
+                        self.assertGreater(encoded, 0)
+                        beyond += 1
+                    else:
+                        self.assertEqual(encoded, expected)
+                        agreed += 1
+        self.assertGreater(agreed, 0)
+        self.assertGreater(beyond, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
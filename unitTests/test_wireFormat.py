@@ -0,0 +1,126 @@
+'''
+Round trip tests for the binary encoding of messages.
+'''
+import unittest
+import cPickle
+from wireFormat import WireFormat
+from message import StopMessage, NewPairMessage, NewPairIdMessage
+from message import StealMessage, SplitMessage, StatusMessage
+from message import DonePairMesage, ReportPairMessage, ReportBatchMessage
+from message import ReturnWorkMessage, NewChunkMessage, NewChunkIdMessage
+from message import DoneChunkMessage
+from mapping import MappingPair
+from mappingIterators import EndpointEmptyMappingPairIterator
+from mappingIterators import SurjectiveMappingIterator
+from vertexTable import defaultTable
+from stageStats import StageStats
+
+
+def describePair(pair):
+    return (pair.idnum, pair.orbitSize,
+            [(str(m), [tuple(v) for v in m.endpointMap], getattr(m, 'id', -1))
+             for m in pair])
+
+
+class Test_wireFormat(unittest.TestCase):
+
+    def setUp(self):
+        self.wire = WireFormat(defaultTable)
+        gen = EndpointEmptyMappingPairIterator(skip=9000)
+        self.pair = gen.next()
+        self.pair.orbitSize = 6
+        m1 = SurjectiveMappingIterator(self.pair[0]).next()
+        m2 = SurjectiveMappingIterator(self.pair[1]).next()
+        self.fullPair = MappingPair(m1, m2)
+
+    def roundTrip(self, message, smaller=True):
+        buf = self.wire.encode(message)
+        self.assertIsInstance(buf, bytearray)
+        decoded = self.wire.decode(buf)
+        self.assertIs(type(decoded), type(message))
+        if smaller:
+            self.assertLess(len(buf), len(cPickle.dumps(message, 2)))
+        return decoded
+
+    def test_simple(self):
+        self.roundTrip(StopMessage())
+        for cls in (StatusMessage, DonePairMesage):
+            m = self.roundTrip(cls(7, 123456789012, 42))
+            self.assertEqual((m.sourceRank, m.countTotal, m.countFailures),
+                             (7, 123456789012, 42))
+        self.assertEqual(self.roundTrip(StealMessage(31)).serial, 31)
+        m = self.roundTrip(SplitMessage(3, 31, [4, 5], [0, 1, 2, 3]))
+        self.assertEqual((m.sourceRank, m.serial, m.given, m.kept),
+                         (3, 31, [4, 5], [0, 1, 2, 3]))
+        m = self.roundTrip(SplitMessage(3, 31, []))
+        self.assertEqual((m.given, m.kept), ([], None))
+        m = self.roundTrip(NewPairIdMessage(74733))
+        self.assertEqual((m.idnum, m.halves), (74733, None))
+        m = self.roundTrip(NewPairIdMessage(5, [6], 12))
+        self.assertEqual((m.idnum, m.halves, m.serial), (5, [6], 12))
+        m = self.roundTrip(ReturnWorkMessage(2, [12, 14]))
+        self.assertEqual((m.sourceRank, m.serials), (2, [12, 14]))
+        # pickle stores small integers in fewer bytes
+        m = self.roundTrip(NewChunkIdMessage(range(100, 140), 3), False)
+        self.assertEqual((m.idnums, m.serial), (range(100, 140), 3))
+        m = self.roundTrip(DoneChunkMessage(4, [DonePairMesage(4, i, i // 2)
+                                                for i in range(30)]))
+        self.assertEqual(m.sourceRank, 4)
+        self.assertEqual([(r.sourceRank, r.countTotal, r.countFailures)
+                          for r in m.replies],
+                         [(4, i, i // 2) for i in range(30)])
+
+    def test_stats(self):
+        '''
+        Stage statistics should survive status, done and done chunk
+        messages.
+        '''
+        stats = StageStats()
+        stats.counts['halfChecked'] = 12345678901
+        stats.times['commutativity'] = 0.25
+        stats.nodes[3] = 17
+        for cls in (StatusMessage, DonePairMesage):
+            m = self.roundTrip(cls(7, 10, 4, stats), False)
+            self.assertEqual(m.stats, stats)
+            self.assertIsNone(self.roundTrip(cls(7, 10, 4)).stats)
+        m = self.roundTrip(DoneChunkMessage(4, [DonePairMesage(4, 3, 1),
+                                                DonePairMesage(4, 5, 2,
+                                                               stats)]))
+        self.assertEqual([(r.countTotal, r.stats) for r in m.replies],
+                         [(3, None), (5, stats)])
+
+    def test_pairs(self):
+        m = self.roundTrip(NewPairMessage(self.pair))
+        self.assertEqual(describePair(m.pair), describePair(self.pair))
+        self.assertIsNone(m.halves)
+        m = self.roundTrip(NewPairMessage(self.pair, [1, 2], 9))
+        self.assertEqual((m.halves, m.serial), ([1, 2], 9))
+        m = self.roundTrip(NewChunkMessage([self.pair, self.fullPair], 8))
+        self.assertEqual([describePair(p) for p in m.pairs],
+                         [describePair(self.pair),
+                          describePair(self.fullPair)])
+        self.assertEqual(m.serial, 8)
+        m = self.roundTrip(ReportPairMessage(2, self.fullPair, 1, 0))
+        self.assertEqual(describePair(m.pair), describePair(self.fullPair))
+        self.assertEqual((m.sourceRank, m.disjointnessNumber,
+                          m.commutativityNumber), (2, 1, 0))
+
+    def test_batch(self):
+        t = defaultTable
+        epm1 = t.encodeEndpointMap(self.pair[0].endpointMap)
+        epm2 = t.encodeEndpointMap(self.pair[1].endpointMap)
+        reports = [(str(t.encodeMapping(self.fullPair[0])),
+                    str(t.encodeMapping(self.fullPair[1])), i % 3, i % 2)
+                   for i in range(50)]
+        m = self.roundTrip(ReportBatchMessage(4, epm1, epm2, reports, 9001))
+        self.assertEqual((m.sourceRank, m.epm1, m.epm2, m.idnum),
+                         (4, epm1, epm2, 9001))
+        self.assertEqual(m.reports, reports)
+
+    def test_bad(self):
+        self.assertRaises(TypeError, self.wire.encode, object())
+        self.assertRaises(ValueError, self.wire.decode, bytearray([99]))
+
+
+if __name__ == "__main__":
+    unittest.main()
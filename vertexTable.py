@@ -0,0 +1,218 @@
+'''
+vertexTable.py - Integer encoding of domain and codomain vertices.
+
+Every vertex of the domain triod (legs of length N) and of the codomain triod
+(legs of length M) is assigned a small integer code:
+    - the branch point is always code 0
+    - Vertex(arm, t) with t > 0 is code 1 + arm*L + (t-1), where L is N for
+      the domain and M for the codomain.
+
+With this layout the code of a domain vertex is also its slot in an encoded
+mapping: an encoded mapping is a sequence of length 1 + T*N holding the code
+of the image of every domain vertex, or UNDEFINED if the image is not yet
+known.
+
+Adjacency lists, railway-metric distances and toward() results are
+precomputed once per (N, M, T) so that the hot loops never have to construct
+or compare Vertex objects.
+'''
+from config import N, M, T
+from mapping import Vertex, Mapping
+
+# marker for an undefined slot in an encoded mapping. Codes must fit in a byte.
+UNDEFINED = 0xFF
+
+
+class VertexTable(object):
+    '''
+    Precomputed tables for the domain and codomain vertices of a given
+    (N, M, T). Tables are tuples indexed by vertex code.
+    '''
+    def __init__(self, n=N, m=M, t=T):
+        self.N = n
+        self.M = m
+        self.T = t
+        self.domainSize = 1 + t*n
+        self.codomainSize = 1 + t*m
+        if self.domainSize > UNDEFINED or self.codomainSize > UNDEFINED:
+            raise ValueError("Triod is too large to be encoded in a byte")
+        # code -> Vertex
+        self.domainVertices = self._vertices(n)
+        self.codomainVertices = self._vertices(m)
+        # code -> arm, dist
+        self.domainArm = tuple(v[0] for v in self.domainVertices)
+        self.domainDist = tuple(v[1] for v in self.domainVertices)
+        self.codomainArm = tuple(v[0] for v in self.codomainVertices)
+        self.codomainDist = tuple(v[1] for v in self.codomainVertices)
+        # code -> tuple of ajacent codes
+        self.domainAjacent = self._ajacent(n)
+        self.codomainAjacent = self._ajacent(m)
+        # code, code -> railway distance
+        self.domainDistance = self._distances(self.domainArm,
+                                              self.domainDist)
+        self.codomainDistance = self._distances(self.codomainArm,
+                                                self.codomainDist)
+        # code, code -> code of next vertex towards the second one
+        self.domainToward = self._toward(n, self.domainArm, self.domainDist)
+        self.codomainToward = self._toward(m, self.codomainArm,
+                                           self.codomainDist)
+        # arm -> code of codomain endpoint Vertex(arm, M)
+        self.codomainEndpoint = tuple(self._code(a, m, m) for a in range(t))
+
+    def _code(self, arm, dist, length):
+        '''
+        Return the code of the vertex (arm, dist) on a triod with legs of the
+        given length.
+        '''
+        if dist == 0:
+            return 0
+        return 1 + arm*length + dist - 1
+
+    def _vertices(self, length):
+        return (Vertex(0, 0),) + tuple(Vertex(a, d) for a in range(self.T)
+                                       for d in range(1, length+1))
+
+    def _ajacent(self, length):
+        '''
+        Ajacency lists in the same order as Vertex._ajacent: the vertex
+        itself, then towards the branch point, then away from it.
+        '''
+        ajacent = [(0,) + tuple(self._code(a, 1, length)
+                                for a in range(self.T))]
+        for a in range(self.T):
+            for d in range(1, length+1):
+                c = self._code(a, d, length)
+                if d == length:
+                    ajacent.append((c, self._code(a, d-1, length)))
+                else:
+                    ajacent.append((c, self._code(a, d-1, length),
+                                    self._code(a, d+1, length)))
+        return tuple(ajacent)
+
+    def _distances(self, arms, dists):
+        size = len(arms)
+        table = []
+        for i in range(size):
+            row = []
+            for j in range(size):
+                if arms[i] == arms[j]:
+                    row.append(abs(dists[i] - dists[j]))
+                else:
+                    row.append(dists[i] + dists[j])
+            table.append(tuple(row))
+        return tuple(table)
+
+    def _toward(self, length, arms, dists):
+        '''
+        Same semantics as Vertex.toward: None on the diagonal.
+        '''
+        size = len(arms)
+        table = []
+        for i in range(size):
+            row = []
+            for j in range(size):
+                if i == j:
+                    row.append(None)
+                elif i == 0:
+                    row.append(self._code(arms[j], 1, length))
+                elif arms[i] != arms[j] or dists[j] < dists[i]:
+                    row.append(self._code(arms[i], dists[i]-1, length))
+                else:
+                    row.append(self._code(arms[i], dists[i]+1, length))
+            table.append(tuple(row))
+        return tuple(table)
+
+    def domainCode(self, arm, t):
+        '''
+        Return the code of domain vertex (arm, t), which is also its slot in
+        an encoded mapping.
+        '''
+        return self._code(arm, t, self.N)
+
+    def codomainCode(self, arm, t):
+        '''
+        Return the code of codomain vertex (arm, t).
+        '''
+        return self._code(arm, t, self.M)
+
+    def encodeDomain(self, v):
+        '''
+        Return the code of a domain Vertex.
+        '''
+        return self._code(v[0], v[1], self.N)
+
+    def encodeCodomain(self, v):
+        '''
+        Return the code of a codomain Vertex.
+        '''
+        return self._code(v[0], v[1], self.M)
+
+    def encodeMapping(self, mapping):
+        '''
+        Return the encoded form of a Mapping as a bytearray of length
+        domainSize. Undefined vertices are set to UNDEFINED.
+        '''
+        if not isinstance(mapping, Mapping):
+            raise TypeError("Argument must be of type 'Mapping'")
+        buf = bytearray([UNDEFINED]) * self.domainSize
+        buf[0] = self.encodeCodomain(mapping(0, 0))
+        for arm in range(self.T):
+            leg = mapping.getLeg(arm)
+            for d in range(self.N):
+                if leg[d] is not None:
+                    buf[1 + arm*self.N + d] = self.encodeCodomain(leg[d])
+        return buf
+
+    def encodeEndpointMap(self, endpointMap):
+        '''
+        Return a tuple containing the domain codes of an endpoint map.
+        '''
+        return tuple(self.encodeDomain(v) for v in endpointMap)
+
+    def dereference(self, buf, arm, vertex):
+        '''
+        Encoded counterpart of Mapping._mappingDereference. Returns the image
+        of the point (arm, vertex) under the encoded mapping buf as an
+        (arm, dist) tuple, or None if the mapping is undefined there.
+        '''
+        vLow = int(vertex)
+        vHigh = int(vertex+1)
+        if vHigh > self.N:
+            vHigh = self.N
+        low = buf[self.domainCode(arm, vLow-1) if vLow > 0 else 0]
+        high = buf[self.domainCode(arm, vHigh-1)]
+        if low == UNDEFINED or high == UNDEFINED:
+            return None
+        fLow = self.codomainDist[low]
+        fHigh = self.codomainDist[high]
+        fArm = self.codomainArm[high]
+        vP = vertex % 1.0
+        if fLow < fHigh:
+            f = fLow + vP
+        elif fLow == fHigh:
+            f = fLow
+        else:
+            f = fLow - vP
+        if f == 0:
+            fArm = 0
+        return (fArm, f)
+
+    def decodeMapping(self, buf, endpointMap=None):
+        '''
+        Construct a Mapping from an encoded mapping. If endpointMap is given,
+        it is a sequence of domain codes which is decoded and attached to the
+        mapping.
+        '''
+        cv = self.codomainVertices
+        n = self.N
+        mapList = [cv[buf[0]]]
+        for arm in range(self.T):
+            mapList.append([cv[c] if c != UNDEFINED else None
+                            for c in buf[1 + arm*n:1 + (arm+1)*n]])
+        mapp = Mapping(mapList)
+        if endpointMap is not None:
+            mapp.endpointMap = [self.domainVertices[c] for c in endpointMap]
+        return mapp
+
+# table for the vertices configured in config.py
+defaultTable = VertexTable()
@@ -0,0 +1,250 @@
+'''
+wireFormat.py - Fixed-layout binary encoding of the messages in message.py
+
+Messages are encoded into a bytearray which can be sent with the buffer-based
+MPI calls (Send/Recv) instead of being pickled. Every message starts with a
+one byte type code followed by its fields, packed little-endian with struct.
+Mappings are sent in the encoded form of vertexTable.py: an integer id,
+domainSize bytes of codomain codes and T bytes of endpoint map domain codes,
+so the layout depends only on N, M and T. Lists of halves, serials or pair ids
+are sent as a count followed by the values as 32 bit integers, with NO_HALVES
+as the count for None. The StageStats of status and done messages follow
+their counts as a flag byte, 0 for None, and the values of the stats.
+'''
+import struct
+from itertools import chain
+from message import StopMessage, NewPairMessage, NewPairIdMessage
+from message import StealMessage, SplitMessage, StatusMessage
+from message import DonePairMesage, ReportPairMessage, ReportBatchMessage
+from message import ReturnWorkMessage, NewChunkMessage, NewChunkIdMessage
+from message import DoneChunkMessage
+from mapping import MappingPair
+from vertexTable import defaultTable, UNDEFINED
+from stageStats import StageStats, COUNTERS, TIMERS
+
+# message type codes
+STOP, NEW_PAIR, NEW_PAIR_ID, STEAL, SPLIT, STATUS, DONE_PAIR, REPORT_PAIR, \
+    REPORT_BATCH, RETURN_WORK, NEW_CHUNK, NEW_CHUNK_ID, DONE_CHUNK = \
+    range(1, 14)
+# count of a list of halves which is None
+NO_HALVES = 0xFFFFFFFF
+
+
+class WireFormat(object):
+    '''
+    Encoder and decoder of messages for the mappings of a VertexTable.
+    '''
+    def __init__(self, table=defaultTable):
+        self.table = table
+        L = table.domainSize
+        T = table.T
+        self.code = struct.Struct('<B')
+        self.counts = struct.Struct('<Biqq')
+        self.serial = struct.Struct('<Bq')
+        self.newPairId = struct.Struct('<Bqq')
+        self.split = struct.Struct('<Biq')
+        self.rank = struct.Struct('<Bi')
+        self.chunk = struct.Struct('<BqI')
+        self.doneChunk = struct.Struct('<BiI')
+        self.pair = struct.Struct('<qq')
+        self.mapping = struct.Struct('<q{}s{}s'.format(L, T))
+        self.reportPair = struct.Struct('<Biii')
+        self.reportBatch = struct.Struct('<BiqI{}s{}s'.format(T, T))
+        self.reportFormat = '{}s{}shh'.format(L, L)
+        self.count = struct.Struct('<I')
+        self.stats = struct.Struct('<{}q{}d{}q'.format(
+            len(COUNTERS), len(TIMERS), L - 1))
+        self.noEndpoints = str(bytearray([UNDEFINED]) * T)
+
+    def encode(self, message):
+        '''
+        Return the encoding of a message as a bytearray.
+        '''
+        if isinstance(message, StopMessage):
+            parts = [self.code.pack(STOP)]
+        elif isinstance(message, NewPairMessage):
+            parts = [self.serial.pack(NEW_PAIR, message.serial),
+                     self._encodePair(message.pair),
+                     self._encodeList(message.halves)]
+        elif isinstance(message, NewPairIdMessage):
+            parts = [self.newPairId.pack(NEW_PAIR_ID, message.serial,
+                                         message.idnum),
+                     self._encodeList(message.halves)]
+        elif isinstance(message, StealMessage):
+            parts = [self.serial.pack(STEAL, message.serial)]
+        elif isinstance(message, SplitMessage):
+            parts = [self.split.pack(SPLIT, message.sourceRank,
+                                     message.serial),
+                     self._encodeList(message.given),
+                     self._encodeList(message.kept)]
+        elif isinstance(message, NewChunkMessage):
+            parts = [self.chunk.pack(NEW_CHUNK, message.serial,
+                                     len(message.pairs))]
+            parts.extend(self._encodePair(p) for p in message.pairs)
+        elif isinstance(message, NewChunkIdMessage):
+            parts = [self.serial.pack(NEW_CHUNK_ID, message.serial),
+                     self._encodeList(message.idnums)]
+        elif isinstance(message, DoneChunkMessage):
+            n = len(message.replies)
+            parts = [self.doneChunk.pack(DONE_CHUNK, message.sourceRank, n),
+                     struct.pack('<{}q'.format(2*n), *chain.from_iterable(
+                         (r.countTotal, r.countFailures)
+                         for r in message.replies))]
+            parts.extend(self._encodeStats(r.stats) for r in message.replies)
+        elif isinstance(message, ReturnWorkMessage):
+            parts = [self.rank.pack(RETURN_WORK, message.sourceRank),
+                     self._encodeList(message.serials)]
+        elif isinstance(message, (StatusMessage, DonePairMesage)):
+            code = STATUS if isinstance(message, StatusMessage) else DONE_PAIR
+            parts = [self.counts.pack(code, message.sourceRank,
+                                      message.countTotal,
+                                      message.countFailures),
+                     self._encodeStats(message.stats)]
+        elif isinstance(message, ReportPairMessage):
+            parts = [self.reportPair.pack(REPORT_PAIR, message.sourceRank,
+                                          message.disjointnessNumber,
+                                          message.commutativityNumber),
+                     self._encodePair(message.pair)]
+        elif isinstance(message, ReportBatchMessage):
+            parts = [self.reportBatch.pack(REPORT_BATCH, message.sourceRank,
+                                           message.idnum,
+                                           len(message.reports),
+                                           str(bytearray(message.epm1)),
+                                           str(bytearray(message.epm2)))]
+            n = len(message.reports)
+            parts.append(struct.pack('<' + self.reportFormat * n,
+                                     *chain.from_iterable(message.reports)))
+        else:
+            raise TypeError("Cannot encode message: {}".format(message))
+        return bytearray(''.join(parts))
+
+    def decode(self, buf):
+        '''
+        Return the message encoded in buf.
+        '''
+        code, = self.code.unpack_from(buf)
+        if code == STOP:
+            return StopMessage()
+        elif code == NEW_PAIR:
+            code, serial = self.serial.unpack_from(buf)
+            pair, offset = self._decodePair(buf, self.serial.size)
+            halves, offset = self._decodeList(buf, offset)
+            return NewPairMessage(pair, halves, serial)
+        elif code == NEW_PAIR_ID:
+            code, serial, idnum = self.newPairId.unpack_from(buf)
+            halves, offset = self._decodeList(buf, self.newPairId.size)
+            return NewPairIdMessage(idnum, halves, serial)
+        elif code == STEAL:
+            code, serial = self.serial.unpack_from(buf)
+            return StealMessage(serial)
+        elif code == SPLIT:
+            code, rank, serial = self.split.unpack_from(buf)
+            given, offset = self._decodeList(buf, self.split.size)
+            kept, offset = self._decodeList(buf, offset)
+            return SplitMessage(rank, serial, given, kept)
+        elif code == NEW_CHUNK:
+            code, serial, n = self.chunk.unpack_from(buf)
+            offset = self.chunk.size
+            pairs = []
+            for i in xrange(n):
+                pair, offset = self._decodePair(buf, offset)
+                pairs.append(pair)
+            return NewChunkMessage(pairs, serial)
+        elif code == NEW_CHUNK_ID:
+            code, serial = self.serial.unpack_from(buf)
+            idnums, offset = self._decodeList(buf, self.serial.size)
+            return NewChunkIdMessage(idnums, serial)
+        elif code == DONE_CHUNK:
+            code, rank, n = self.doneChunk.unpack_from(buf)
+            counts = struct.unpack_from('<{}q'.format(2*n), buf,
+                                        self.doneChunk.size)
+            offset = self.doneChunk.size + 16*n
+            replies = []
+            for i in xrange(n):
+                stats, offset = self._decodeStats(buf, offset)
+                replies.append(DonePairMesage(rank, counts[2*i],
+                                              counts[2*i + 1], stats))
+            return DoneChunkMessage(rank, replies)
+        elif code == RETURN_WORK:
+            code, rank = self.rank.unpack_from(buf)
+            serials, offset = self._decodeList(buf, self.rank.size)
+            return ReturnWorkMessage(rank, serials)
+        elif code in (STATUS, DONE_PAIR):
+            code, rank, total, failures = self.counts.unpack_from(buf)
+            stats, offset = self._decodeStats(buf, self.counts.size)
+            if code == STATUS:
+                return StatusMessage(rank, total, failures, stats)
+            return DonePairMesage(rank, total, failures, stats)
+        elif code == REPORT_PAIR:
+            code, rank, djnum, comnum = self.reportPair.unpack_from(buf)
+            pair, offset = self._decodePair(buf, self.reportPair.size)
+            return ReportPairMessage(rank, pair, djnum, comnum)
+        elif code == REPORT_BATCH:
+            code, rank, idnum, n, epm1, epm2 = \
+                self.reportBatch.unpack_from(buf)
+            fields = struct.unpack_from('<' + self.reportFormat * n, buf,
+                                        self.reportBatch.size)
+            reports = zip(*[iter(fields)] * 4)
+            return ReportBatchMessage(rank, tuple(bytearray(epm1)),
+                                      tuple(bytearray(epm2)), reports, idnum)
+        raise ValueError("Unknown message type code: {}".format(code))
+
+    def _encodePair(self, pair):
+        parts = [self.pair.pack(pair.idnum, pair.orbitSize)]
+        for m in pair:
+            if m.endpointMap:
+                epm = self.table.encodeEndpointMap(m.endpointMap)
+                epm = str(bytearray(epm))
+            else:
+                epm = self.noEndpoints
+            parts.append(self.mapping.pack(getattr(m, 'id', -1),
+                                           str(self.table.encodeMapping(m)),
+                                           epm))
+        return ''.join(parts)
+
+    def _decodePair(self, buf, offset):
+        idnum, orbitSize = self.pair.unpack_from(buf, offset)
+        offset += self.pair.size
+        maps = []
+        for i in range(2):
+            mapid, m, epm = self.mapping.unpack_from(buf, offset)
+            offset += self.mapping.size
+            if epm == self.noEndpoints:
+                mapp = self.table.decodeMapping(bytearray(m))
+            else:
+                mapp = self.table.decodeMapping(bytearray(m), bytearray(epm))
+            if mapid != -1:
+                mapp.id = mapid
+            maps.append(mapp)
+        pair = MappingPair(idnum, maps[0], maps[1])
+        pair.orbitSize = orbitSize
+        return pair, offset
+
+    def _encodeStats(self, stats):
+        if stats is None:
+            return self.code.pack(0)
+        return self.code.pack(1) + self.stats.pack(*stats.values())
+
+    def _decodeStats(self, buf, offset):
+        flag, = self.code.unpack_from(buf, offset)
+        offset += self.code.size
+        if not flag:
+            return None, offset
+        values = self.stats.unpack_from(buf, offset)
+        return StageStats.fromValues(values), offset + self.stats.size
+
+    def _encodeList(self, values):
+        if values is None:
+            return self.count.pack(NO_HALVES)
+        return struct.pack('<I{}I'.format(len(values)), len(values), *values)
+
+    def _decodeList(self, buf, offset):
+        n, = self.count.unpack_from(buf, offset)
+        offset += self.count.size
+        if n == NO_HALVES:
+            return None, offset
+        values = list(struct.unpack_from('<{}I'.format(n), buf, offset))
+        return values, offset + 4*n
+
+# wire format for the vertices configured in config.py
+defaultWireFormat = WireFormat()